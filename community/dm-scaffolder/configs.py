@@ -12,20 +12,125 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+import os
+import sys
+import threading
+import time
+
 from ruamel.yaml import YAML
 
 class Config:
     
     yaml = YAML()
 
+    # Seconds before the cached children of a folder are listed again.
+    default_folders_cache_ttl = 24 * 3600
+
+    # Every provider object reads the configs, possibly from several threads.
+    # The file is parsed once per path, under a lock, as the YAML instance
+    # is not thread-safe.
+    loaded = {}
+    lock = threading.Lock()
+
     def __init__(self, path):
         self.path = path
-        f = open(path, "r")
-        self.configs = self.yaml.load(f.read())
-        f.close()
-
-    def update_folders(self, folders):
-        self.configs['folders_list_cache'] = folders
-        print 'lets write'
-        with open(self.path, 'w') as yf:
-            self.yaml.dump(self.configs, stream=yf)
+        with self.lock:
+            if path not in self.loaded:
+                f = open(path, "r")
+                self.loaded[path] = self.yaml.load(f.read())
+                f.close()
+            self.configs = self.loaded[path]
+
+    def folder_cache(self):
+        """ The folder tree cache, kept in a side file next to the configs."""
+        ttl = self.configs.get('folders_cache_ttl', self.default_folders_cache_ttl)
+        return FolderCache(os.path.splitext(self.path)[0] + '.folders.json', ttl)
+
+
+class FolderCache:
+    """
+    Cache of the folder tree of an organization.
+
+    Every node, the organization and its folders, is stored with its parent,
+    its children and the time its children were listed, so that only the
+    stale parts of the tree have to be listed again. The cache is written to
+    a compact JSON file; updates go to a temporary file which is then renamed
+    over it, so an interrupted run never leaves a broken cache behind.
+    """
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self.nodes = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.nodes = json.load(f)
+
+    def clear(self):
+        self.nodes = {}
+
+    def children(self, node):
+        """ The cached children of a node, or None if they were never listed."""
+        if node not in self.nodes or self.nodes[node]['listed'] is None:
+            return None
+        return self.nodes[node]['children']
+
+    def is_stale(self, node, now=None):
+        """ Whether the children of a node have to be listed (again)."""
+        if self.children(node) is None:
+            return True
+        return (now or time.time()) - self.nodes[node]['listed'] > self.ttl
+
+    def set_children(self, node, children, now=None):
+        """ Records the listed children of a node. Subtrees of the children
+        that are gone are dropped; the subtrees of the others are kept.
+        A child that has already been listed under another parent has moved
+        there, and keeps its subtree. A child that moved here is removed
+        from the children of its previous parent."""
+        entry = self.nodes.setdefault(node, {'parent': None, 'children': [], 'listed': None})
+        for child in set(entry['children']) - set(children):
+            if child in self.nodes and self.nodes[child]['parent'] == node:
+                self.drop(child)
+        for child in children:
+            child_entry = self.nodes.setdefault(
+                child, {'parent': node, 'children': [], 'listed': None})
+            previous = self.nodes.get(child_entry['parent'])
+            if child_entry['parent'] != node and previous:
+                previous['children'] = [c for c in previous['children'] if c != child]
+            child_entry['parent'] = node
+        entry['children'] = list(children)
+        entry['listed'] = now or time.time()
+
+    def drop(self, node):
+        """ Removes a node and its subtree, but for the folders that have
+        moved out of it."""
+        stack = [node]
+        while stack:
+            parent = stack.pop()
+            entry = self.nodes.pop(parent, None)
+            if entry:
+                stack.extend(child for child in entry['children']
+                             if child in self.nodes and self.nodes[child]['parent'] == parent)
+
+    def descendants(self, root, max_levels):
+        """ The folders under root, up to max_levels deep, depth-first."""
+        folders = []
+        stack = [(root, 0)]
+        while stack:
+            node, level = stack.pop()
+            if node != root:
+                folders.append(node)
+            if level < max_levels:
+                children = self.children(node) or []
+                stack.extend((child, level + 1) for child in reversed(children))
+        return folders
+
+    def save(self):
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            json.dump(self.nodes, f, separators=(',', ':'), sort_keys=True)
+        if sys.platform == 'win32' and os.path.exists(self.path):
+            # Windows does not rename over an existing file
+            os.remove(self.path)
+        os.rename(tmp_path, self.path)
@@ -0,0 +1,122 @@
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runs the scaffolder providers concurrently and prints one combined
+Deployment Manager config.
+
+The organization level providers (folder, project) run once. The project
+level providers (network, firewall, pubsub) run once for every project given
+with --project, or for the gcloud default project if there is none. Every
+run is a separate job on a thread pool, so the total time is bounded by the
+slowest provider rather than the sum of all of them.
+"""
+import argparse
+import sys
+import time
+from multiprocessing.pool import ThreadPool
+
+from dm_config import DMConfig
+from providers.firewall import FirewallCFT
+from providers.folder   import FolderCFT
+from providers.project  import ProjectCFT
+from providers.network  import NetworkCFT
+from providers.pubsub   import PubSubTopicCFT
+
+# (name, provider class, whether it runs once per project), in output order.
+PROVIDERS = [
+    ("folder", FolderCFT, False),
+    ("project", ProjectCFT, False),
+    ("network", NetworkCFT, True),
+    ("firewall", FirewallCFT, True),
+    ("pubsub", PubSubTopicCFT, True)]
+
+
+def get_jobs(providers, projects):
+    """ Returns the (name, provider class, gcloud flags) jobs to run."""
+
+    jobs = []
+    for name, provider, per_project in PROVIDERS:
+        if name not in providers:
+            continue
+        if not per_project:
+            jobs.append((name, provider, ""))
+            continue
+        for project in projects or [None]:
+            jobs.append((name, provider,
+                         "--project=" + project if project else ""))
+    return jobs
+
+
+def run_job(job):
+    """ Returns (job, resources, error, seconds) for one job.
+    Runs on a pool thread."""
+
+    name, provider, gcloud_flags = job
+    start = time.time()
+    try:
+        resources = list(provider().get_list(gcloud_flags))
+        return job, resources, None, time.time() - start
+    except Exception as e:
+        # Any failure is reported with the job, so the other jobs still run
+        # and the pool is not torn down by an error in one provider.
+        return job, [], "%s: %s" % (type(e).__name__, e), time.time() - start
+
+
+def main(argv):
+    names = [name for name, _, _ in PROVIDERS]
+    parser = argparse.ArgumentParser(
+        description="Exports the resources of all providers as one "
+        "Deployment Manager config.")
+    parser.add_argument("--project", action="append", default=[],
+                        help="Project to export the project level resources "
+                        "of. Can be repeated.")
+    parser.add_argument("--providers", default=",".join(names),
+                        help="Comma separated providers to run, out of " +
+                        ", ".join(names) + ".")
+    parser.add_argument("--jobs", type=int, default=16,
+                        help="Number of providers run at the same time.")
+    args = parser.parse_args(argv[1:])
+
+    providers = [p for p in args.providers.split(",") if p]
+    for name in providers:
+        if name not in names:
+            parser.error("unknown provider: " + name)
+
+    jobs = get_jobs(providers, args.project)
+    pool = ThreadPool(max(1, min(args.jobs, len(jobs))))
+    try:
+        results = pool.map(run_job, jobs, 1)
+    finally:
+        pool.terminate()
+        pool.join()
+
+    resources = []
+    failed = False
+    for (name, _, gcloud_flags), items, error, seconds in results:
+        label = " ".join([name, gcloud_flags]).strip()
+        if error is not None:
+            sys.stderr.write("Provider " + label + " failed. (" + error + ")\n")
+            failed = True
+            continue
+        sys.stderr.write("Listed %d resources with %s in %.1fs\n" %
+                         (len(items), label, seconds))
+        resources.extend(items)
+
+    DMConfig(resources)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -17,10 +17,65 @@ BaseProvider implement common functionalities for all API provider
 """
 import sys
 import os
+import json
+from subprocess import CalledProcessError
 from subprocess import check_output
+from subprocess import PIPE
+from subprocess import Popen
 import configs
 
 from ruamel.yaml import YAML
+from ruamel.yaml.comments import CommentedMap
+
+# Bytes read from the gcloud output pipe at a time.
+READ_SIZE = 64 * 1024
+
+
+def iter_json_array(chunks):
+    """
+    Yields the objects of a JSON array, given as consecutive text chunks, as
+    soon as each of them is complete. Objects keep their key order.
+    Raises ValueError if the text ends before the array does, or if anything
+    but whitespace follows it.
+    """
+    decoder = json.JSONDecoder(object_pairs_hook=CommentedMap)
+    buf = ''
+    started = False
+    ended = False
+    for chunk in chunks:
+        buf += chunk
+        while True:
+            buf = buf.lstrip()
+            if ended:
+                if buf:
+                    raise ValueError('Extra data after the JSON array: ' + buf[:80])
+                break
+            if not started:
+                if not buf:
+                    break
+                if buf[0] != '[':
+                    raise ValueError('Expected a JSON array: ' + buf[:80])
+                buf = buf[1:]
+                started = True
+                continue
+            if buf.startswith(','):
+                buf = buf[1:].lstrip()
+            if buf.startswith(']'):
+                buf = buf[1:]
+                ended = True
+                continue
+            if not buf.startswith('{'):
+                # Either the end of the array or more data is needed.
+                break
+            try:
+                item, end = decoder.raw_decode(buf)
+            except ValueError:
+                # The object is not complete yet.
+                break
+            buf = buf[end:]
+            yield item
+    if not ended:
+        raise ValueError('Incomplete JSON array: ' + buf[:80])
 
 
 class BaseProvider(object):
@@ -68,7 +123,7 @@ class BaseProvider(object):
     def get_gcloud_command(self):
         """Generating gcloud command based on the provider details"""
         return ("gcloud " + self.gcloud_stage + self.base_api + " " + self.resource +
-                " list --format=yaml" + " " + self.gcloud_flags)
+                " list --format=json" + " " + self.gcloud_flags)
 
     def set_properties(self, _properties):
         """Setting property values for the provider"""
@@ -81,23 +136,46 @@ class BaseProvider(object):
         self.base_yaml['properties'] = self.properties
 
     def get_list(self, gcloud_flags=""):
-        """Getting the list of GCP objects and returning them as provider objects"""
+        """Yielding the GCP objects as provider objects, while gcloud lists them"""
         use_shell = sys.platform == 'win32'
-        props = check_output((self.get_gcloud_command() +
-                              gcloud_flags).split(), shell=use_shell).split('---')
-        mylist = []
-        for prop in props:
-            if prop is None:
-                continue
-            item = self.get_new()
-            prop = self.yaml.load(prop)
-            if prop is None:
-                continue
-            item.set_properties(prop)
-            item.fill_properties()
-            mylist.append(item)
-
-        return mylist
+        cmd = (self.get_gcloud_command() + gcloud_flags).split()
+        proc = Popen(cmd, stdout=PIPE, shell=use_shell)
+        complete = False
+        try:
+            fd = proc.stdout.fileno()
+            for prop in iter_json_array(iter(lambda: os.read(fd, READ_SIZE), '')):
+                yield self.new_item(prop)
+            complete = True
+        except ValueError:
+            # The output of a failing gcloud is cut short, report the failure
+            proc.stdout.close()
+            if proc.wait():
+                raise CalledProcessError(proc.returncode, cmd)
+            raise
+        finally:
+            proc.stdout.close()
+            if not complete and proc.poll() is None:
+                proc.kill()
+        if proc.wait():
+            raise CalledProcessError(proc.returncode, cmd)
+
+    def get_list_output(self, gcloud_flags=""):
+        """Running the gcloud list command and returning its raw output.
+        Only runs gcloud, so it can be called from several threads."""
+        use_shell = sys.platform == 'win32'
+        return check_output((self.get_gcloud_command() +
+                             gcloud_flags).split(), shell=use_shell)
+
+    def parse_list(self, output):
+        """Returning the objects of a gcloud list output as provider objects"""
+        return [self.new_item(prop) for prop in iter_json_array([output])]
+
+    def new_item(self, prop):
+        """Returning a new provider object for one listed GCP object"""
+        item = self.get_new()
+        item.set_properties(prop)
+        item.fill_properties()
+        return item
 
     def scrub_properties(self):
         """
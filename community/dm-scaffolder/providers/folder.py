@@ -14,6 +14,8 @@
 
 """ Provider classes for GCP Folders"""
 import sys
+import time
+from multiprocessing.pool import ThreadPool
 
 import providers.baseprovider as base
 
@@ -25,8 +27,13 @@ class FolderBase(base.BaseProvider):
         "createTime",
         "lifecycleState"]
 
+    # Folders deeper than this are not listed.
+    max_levels = 4
+    # Number of gcloud list commands running at the same time.
+    list_jobs = 16
+
     def __init__(self, dm_api, gcloud_stage, gcloud_flags=''):
-        self.readonly_properties += self.folder_readonly_properties
+        self.readonly_properties = self.readonly_properties + self.folder_readonly_properties
         base.BaseProvider.__init__(
             self, "resource-manager", "folders", dm_api, gcloud_stage, gcloud_flags)
 
@@ -38,28 +45,89 @@ class FolderBase(base.BaseProvider):
         return self.get_list_by_parent(" --organization=" + self.config.configs['organization_id'] + " " + gcloud_flags, 0)
 
     def get_list_by_parent(self, parent, level):
-        """ List of the folders under a specific parent node."""
+        """ List of the folders under a specific parent node.
+
+        The tree is crawled breadth-first: the children of every folder of a
+        level are listed concurrently, on a pool of list_jobs threads, before
+        moving on to the next level. The folders are returned depth-first,
+        each one followed by its subfolders."""
+
+        children = {}
+        parents = [parent]
+        pool = ThreadPool(self.list_jobs)
+        try:
+            while parents and level < self.max_levels:
+                outputs = pool.map(self.get_list_output, parents)
+                next_parents = []
+                for parent_flags, output in zip(parents, outputs):
+                    children[parent_flags] = self.parse_list(output)
+                    for folder in children[parent_flags]:
+                        next_parents.append(" --folder=" + folder.properties["name"][8:])
+                parents = next_parents
+                level += 1
+                sys.stderr.write("\rListed %d folders, %d levels deep" %
+                                 (sum(len(c) for c in children.values()), level))
+            sys.stderr.write("\n")
+        finally:
+            pool.terminate()
+            pool.join()
+
+        return self.flatten(children, parent)
+
+    def flatten(self, children, parent):
+        """ The folders under parent in the children index, depth-first."""
 
         folders = []
-        folders_tmp = super(FolderBase, self).get_list(parent)
-        if level < 4:
-            for folder in folders_tmp:
-                folders.append(folder)
-                folders += self.get_list_by_parent(" --folder=" +
-                                                   folder.properties["name"][8:], level+1)
+        for folder in children.get(parent, []):
+            folders.append(folder)
+            folders += self.flatten(children, " --folder=" + folder.properties["name"][8:])
         return folders
 
     def get_folder_ids(self, forced_update=False):
-        """ Return all folder IDs under the ORG recursively"""
-
-        folder_ids = self.config.configs['folders_list_cache']
-        if forced_update or len(folder_ids) == 0:
-            folder_ids=[]
-            for folder in self.get_list():
-                folder_ids.append(folder.properties["name"][8:])
-            self.config.update_folders(folder_ids)
-            
-        return folder_ids
+        """ Return all folder IDs under the ORG recursively
+
+        The folder tree is cached between runs (see configs.FolderCache).
+        Only the folders whose cached children are stale are listed again,
+        concurrently level by level like get_list_by_parent(). With
+        forced_update the whole tree is listed again."""
+
+        cache = self.config.folder_cache()
+        if forced_update:
+            cache.clear()
+        root = "organizations/" + self.config.configs['organization_id']
+        now = time.time()
+        nodes = [root]
+        level = 0
+        listed = 0
+        pool = ThreadPool(self.list_jobs)
+        try:
+            while nodes and level < self.max_levels:
+                stale = [node for node in nodes if cache.is_stale(node, now)]
+                outputs = pool.map(self.get_list_output,
+                                   [self.get_parent_flags(node) for node in stale])
+                for node, output in zip(stale, outputs):
+                    cache.set_children(node, [folder.properties["name"]
+                                              for folder in self.parse_list(output)], now)
+                listed += len(stale)
+                nodes = [child for node in nodes for child in cache.children(node) or []]
+                level += 1
+                sys.stderr.write("\rListed the children of %d folders, %d levels deep" %
+                                 (listed, level))
+            sys.stderr.write("\n")
+        finally:
+            pool.terminate()
+            pool.join()
+
+        if listed:
+            cache.save()
+        return [node[8:] for node in cache.descendants(root, self.max_levels)]
+
+    def get_parent_flags(self, node):
+        """ gcloud flags listing the children of an organization or folder"""
+        kind, node_id = node.split('/', 1)
+        if kind == "organizations":
+            return " --organization=" + node_id
+        return " --folder=" + node_id
 
 class FolderAlpha(FolderBase):
     """ Folder Alpha API provider"""
@@ -16,6 +16,7 @@
 Network (VPC) provider implements GCP Network(VPC) specific transaltions
 Supports V1 CFT versions
 """
+from multiprocessing.pool import ThreadPool
 from providers.subnetwork import SubnetworkCFT
 import providers.baseprovider as base
 
@@ -34,7 +35,7 @@ class NetworkBase(base.BaseProvider):
 
     def __init__(self, dm_api, gcloud_stage, gcloud_flags=''):
         
-        self.readonly_properties += self.network_readonly_properties
+        self.readonly_properties = self.readonly_properties + self.network_readonly_properties
 
         base.BaseProvider.__init__(
             self, "compute", "networks", dm_api, gcloud_stage, gcloud_flags)
@@ -62,16 +63,30 @@ class NetworkCFT(NetworkBase):
 
 
     def get_list(self, gcloud_flags=""):
-        
-        network_list = super(NetworkCFT, self).get_list(gcloud_flags)
-        
-        for network in network_list:
-            subnetworks =[]
-            for subnet in SubnetworkCFT().get_list(' --network ' + network.properties['name']):
-                subnetworks.append(subnet.base_yaml)
-            network.properties['subnetworks'] = subnetworks
-
-        return network_list
+        """ Yields the networks with their subnetworks filled in.
+
+        All subnetworks are listed with a single gcloud call, on a separate
+        thread while the networks are listed, and indexed by network name."""
+
+        pool = ThreadPool(1)
+        try:
+            subnetworks = pool.apply_async(self.get_subnetworks, (gcloud_flags,))
+            for network in super(NetworkCFT, self).get_list(gcloud_flags):
+                network.properties['subnetworks'] = subnetworks.get().get(
+                    network.properties['name'], [])
+                yield network
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def get_subnetworks(self, gcloud_flags=""):
+        """ Returns the subnetwork resources of every network, by network name."""
+
+        subnetworks = {}
+        for subnet in SubnetworkCFT().get_list(gcloud_flags):
+            network = subnet.properties['network'].split('/')[-1]
+            subnetworks.setdefault(network, []).append(subnet.base_yaml)
+        return subnetworks
 
     def get_new(self):
         return NetworkCFT()
@@ -14,7 +14,10 @@
 
 """ Provider classes for GCP Project"""
 import providers.baseprovider as base
+import json
 import sys
+from multiprocessing.pool import ThreadPool
+from subprocess import CalledProcessError
 from subprocess import check_output
 
 class ProjectBase(base.BaseProvider):
@@ -23,11 +26,17 @@ class ProjectBase(base.BaseProvider):
     project_readonly_properties = [
         "createTime"]
 
+    # Number of gcloud shared VPC lookups running at the same time.
+    list_jobs = 16
+
     def __init__(self, dm_api, gcloud_stage, gcloud_flags=''):
         
         self.host_projects = []
+        # Guest project ID -> host project ID.
         self.guest_projects = {}
-        self.readonly_properties += self.project_readonly_properties
+        # Host project ID -> error of its associated projects lookup.
+        self.vpc_errors = {}
+        self.readonly_properties = self.readonly_properties + self.project_readonly_properties
 
         base.BaseProvider.__init__(self, "", "projects", dm_api, gcloud_stage, gcloud_flags)
     def get_new(self):
@@ -55,34 +64,44 @@ class ProjectBase(base.BaseProvider):
     def get_vpc_host_project_ids(self):
         
         use_shell = sys.platform == 'win32'
-        props = check_output(("gcloud compute shared-vpc organizations list-host-projects " + self.config.configs['organization_id'] + " --format yaml" ).split(), shell=use_shell).split('---')
+        output = check_output(("gcloud compute shared-vpc organizations list-host-projects " + self.config.configs['organization_id'] + " --format json" ).split(), shell=use_shell)
         
-        for prop in props:
-            if prop is None:
-                continue
-            prop = self.yaml.load(prop)
-            if prop is None:
-                continue
+        for prop in base.iter_json_array([output]):
             self.host_projects.append(prop['name'])
 
     def get_vpc_guest_project_ids(self):
+        """ Fills the guest -> host index of every shared VPC host project.
+
+        The host projects are looked up concurrently on a pool of list_jobs
+        threads. Hosts whose lookup failed are reported on stderr and kept in
+        vpc_errors."""
+
+        pool = ThreadPool(self.list_jobs)
+        try:
+            results = pool.map(self.list_associated_projects, self.host_projects)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        for host_id, output, error in results:
+            if error is not None:
+                self.vpc_errors[host_id] = error
+                sys.stderr.write("Project " + host_id + " can't be reached. "
+                                 "Potentially up for deletion. (" + error + ")\n")
+                continue
+            for prop in base.iter_json_array([output]):
+                self.guest_projects[prop['id']] = host_id
 
-        for id in self.host_projects:
-            
-            use_shell = sys.platform == 'win32'
-            try:
-                props = check_output(("gcloud compute shared-vpc associated-projects list " + id + " --format yaml" ).split(), shell=use_shell).split('---')
-                
-                for prop in props:
-                    if prop is None:
-                        continue
-                    prop = self.yaml.load(prop)
-                    if prop is None:
-                        continue
-                    
-                    self.guest_projects[prop['id']] = id
-            except:
-                print "Project " + id + "can't be reached. Potentially up for deletion."
+    def list_associated_projects(self, host_id):
+        """ Returns (host_id, gcloud output, error) for one host project.
+        Runs on a pool thread, so the output is parsed by the caller."""
+
+        use_shell = sys.platform == 'win32'
+        try:
+            output = check_output(("gcloud compute shared-vpc associated-projects list " + host_id + " --format json" ).split(), shell=use_shell)
+            return host_id, output, None
+        except (CalledProcessError, OSError) as e:
+            return host_id, None, str(e)
 
     def set_as_vpc_host(self):
         #Not implemented by default
@@ -131,7 +150,7 @@ class ProjectCFT(ProjectBase):
                 project.set_as_vpc_guest(self.guest_projects[project.properties['projectId']])
             
             use_shell = sys.platform == 'win32'
-            props = self.yaml.load(check_output(("gcloud beta billing projects describe " + project.properties['projectId'] + " --format yaml" ).split(), shell=use_shell))
+            props = json.loads(check_output(("gcloud beta billing projects describe " + project.properties['projectId'] + " --format json" ).split(), shell=use_shell))
             project.base_yaml['properties']['billingAccountId'] = props.get('billingAccountName')
             
         return projects_list
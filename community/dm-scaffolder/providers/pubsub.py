@@ -16,6 +16,7 @@
 PubSubTopic provider implements GCP PubSub Topic specific transaltions
 Supports V1, CFT versions
 """
+from multiprocessing.pool import ThreadPool
 import providers.baseprovider as base
 
 
@@ -102,14 +103,30 @@ class PubSubTopicCFT(PubSubTopicBase):
     def fill_properties(self):
         self.base_yaml['properties']['topic'] = self.properties
         self.base_yaml['properties']['subscriptions'] = []
-        self.get_subscriptions()
 
-    def get_subscriptions(self):
-        """ Sub-optimal implementation """
-
-        __subscriptions = PubSubSubscriptionCFT().get_list()
-        __subs_yaml = []
-        for sub in __subscriptions:
-            if sub.base_yaml['properties']['topic'] == self.base_yaml['properties']['topic']['name']:
-                 __subs_yaml.append(sub.base_yaml['properties']['subscriptions'][0])
-        self.base_yaml['properties']['subscriptions'] = __subs_yaml
+    def get_list(self, gcloud_flags=""):
+        """ Yields the topics with their subscriptions filled in.
+
+        All subscriptions are listed with a single gcloud call, with the same
+        flags, on a separate thread while the topics are listed, and indexed
+        by topic name."""
+
+        pool = ThreadPool(1)
+        try:
+            subscriptions = pool.apply_async(self.get_subscriptions, (gcloud_flags,))
+            for topic in super(PubSubTopicCFT, self).get_list(gcloud_flags):
+                topic.base_yaml['properties']['subscriptions'] = subscriptions.get().get(
+                    topic.properties['name'], [])
+                yield topic
+        finally:
+            pool.terminate()
+            pool.join()
+
+    def get_subscriptions(self, gcloud_flags=""):
+        """ Returns the subscription properties of every topic, by topic name."""
+
+        subscriptions = {}
+        for sub in PubSubSubscriptionCFT().get_list(gcloud_flags):
+            subscriptions.setdefault(sub.properties['topic'], []).append(
+                sub.base_yaml['properties']['subscriptions'][0])
+        return subscriptions
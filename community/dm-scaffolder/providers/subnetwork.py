@@ -33,7 +33,7 @@ class SubnetworkBase(base.BaseProvider):
 
     def __init__(self, dm_api, gcloud_stage, gcloud_flags=''):
         
-        self.readonly_properties += self.Subnetwork_readonly_properties
+        self.readonly_properties = self.readonly_properties + self.Subnetwork_readonly_properties
 
         base.BaseProvider.__init__(
             self, "compute", "networks subnets", dm_api, gcloud_stage, gcloud_flags)
@@ -0,0 +1,71 @@
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests of the streaming parser of gcloud list output.
+
+Run from the dm-scaffolder directory with: python tests/baseprovider_test.py
+"""
+import json
+import os
+import sys
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+from providers.baseprovider import iter_json_array
+
+ITEMS = [
+    {'name': 'net-0', 'z': 1, 'a': {'nested': ['x', {'y': '}]'}]}},
+    {'name': 'net-1', 'description': 'a ] b, {c}'},
+    {'name': 'net-2'},
+]
+
+
+def chunks(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+class IterJsonArrayTest(unittest.TestCase):
+
+    def test_any_chunk_size(self):
+        text = json.dumps(ITEMS, indent=2)
+        for size in [1, 2, 7, 64, len(text)]:
+            self.assertEqual([dict(item) for item in iter_json_array(chunks(text, size))],
+                             ITEMS)
+
+    def test_keeps_key_order(self):
+        item = next(iter_json_array(['[{"z": 1, "a": 2, "m": 3}]']))
+        self.assertEqual(list(item.keys()), ['z', 'a', 'm'])
+
+    def test_yields_items_as_they_complete(self):
+        items = iter_json_array(iter(['[{"name": "a"}, {"na', 'me": "b"}]']))
+        self.assertEqual(next(items)['name'], 'a')
+        self.assertEqual(next(items)['name'], 'b')
+
+    def test_empty_array(self):
+        self.assertEqual(list(iter_json_array(['[]'])), [])
+        self.assertEqual(list(iter_json_array([' [\n', ' ]\n'])), [])
+
+    def test_rejects_incomplete_or_malformed_output(self):
+        for text in ['', '[', '[{"name": "a"}', '[{"name": "a"}, {"na',
+                     '[{"name": "a"},', '[{"name" "a"}]', '{"name": "a"}',
+                     '[{"name": "a"}] x']:
+            with self.assertRaises(ValueError):
+                list(iter_json_array(chunks(text, 3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
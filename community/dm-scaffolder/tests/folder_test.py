@@ -0,0 +1,203 @@
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests of the folder crawl and of the folder tree cache.
+
+gcloud is replaced with the fake next to this file. Run from the
+dm-scaffolder directory with: python tests/folder_test.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import configs
+from providers.folder import FolderCFT
+
+ORGANIZATION_ID = '1234'
+
+
+def expected_ids(parent, branch, levels):
+    """ The folder IDs of the fake tree under parent, depth-first."""
+    ids = []
+    if levels == 0:
+        return ids
+    for i in range(branch):
+        folder_id = parent + '.' + str(i) if parent else str(i)
+        ids.append(folder_id)
+        ids += expected_ids(folder_id, branch, levels - 1)
+    return ids
+
+
+class FakeGcloudTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.environ = dict(os.environ)
+        os.environ['FAKE_GCLOUD_DIR'] = self.state_dir
+        os.environ['PATH'] = TESTS_DIR + os.pathsep + os.environ['PATH']
+        # The providers read configs.yaml next to configs.py, stand in for it
+        self.configs_path = os.path.splitext(configs.__file__)[0] + '.yaml'
+        configs.Config.loaded[self.configs_path] = {'organization_id': ORGANIZATION_ID}
+
+    def tearDown(self):
+        del configs.Config.loaded[self.configs_path]
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.state_dir)
+
+    def calls(self):
+        path = os.path.join(self.state_dir, 'calls')
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            lines = f.readlines()
+        os.remove(path)
+        return lines
+
+
+class FolderCrawlTest(FakeGcloudTest):
+
+    def test_lists_max_levels_depth_first(self):
+        provider = FolderCFT()
+        folders = provider.get_list()
+        self.assertEqual([f.properties['name'][8:] for f in folders],
+                         expected_ids('', 2, provider.max_levels))
+        # The folders of the last level are not listed
+        calls = self.calls()
+        self.assertEqual(len(calls), 1 + 2 + 4 + 8)
+        listed = [c.split('--folder=')[1].split()[0] for c in calls if '--folder=' in c]
+        self.assertEqual(max(f.count('.') for f in listed), provider.max_levels - 2)
+
+    def test_folder_ids_are_cached(self):
+        cache_path = os.path.join(self.state_dir, 'configs.folders.json')
+        provider = FolderCFT()
+        provider.config.folder_cache = lambda: configs.FolderCache(cache_path, 3600)
+        expected = expected_ids('', 2, provider.max_levels)
+
+        self.assertEqual(provider.get_folder_ids(), expected)
+        self.assertEqual(len(self.calls()), 15)
+        self.assertEqual(provider.get_folder_ids(), expected)
+        self.assertEqual(len(self.calls()), 0)
+        self.assertEqual(provider.get_folder_ids(forced_update=True), expected)
+        self.assertEqual(len(self.calls()), 15)
+
+    def test_folder_moved_to_a_shallower_parent(self):
+        cache_path = os.path.join(self.state_dir, 'configs.folders.json')
+        provider = FolderCFT()
+        provider.config.folder_cache = lambda: configs.FolderCache(cache_path, 3600)
+        # An expired cache in which folder 0.0 was under 1.0, a level deeper
+        cache = configs.FolderCache(cache_path, 3600)
+        cache.set_children('organizations/' + ORGANIZATION_ID, ['folders/0', 'folders/1'], 1)
+        cache.set_children('folders/0', [], 1)
+        cache.set_children('folders/1', ['folders/1.0'], 1)
+        cache.set_children('folders/1.0', ['folders/0.0'], 1)
+        cache.set_children('folders/0.0', ['folders/0.0.0'], 1)
+        cache.save()
+
+        self.assertEqual(provider.get_folder_ids(),
+                         expected_ids('', 2, provider.max_levels))
+        self.assertEqual(len(self.calls()), 15)
+
+
+class FolderCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'folders.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_staleness(self):
+        cache = configs.FolderCache(self.path, 100)
+        self.assertTrue(cache.is_stale('organizations/1', 1000))
+        self.assertEqual(cache.children('organizations/1'), None)
+        cache.set_children('organizations/1', ['folders/a'], 1000)
+        self.assertFalse(cache.is_stale('organizations/1', 1100))
+        self.assertTrue(cache.is_stale('organizations/1', 1101))
+        self.assertTrue(cache.is_stale('folders/a', 1000))
+
+    def test_dropped_children_lose_their_subtree(self):
+        cache = configs.FolderCache(self.path, 100)
+        cache.set_children('organizations/1', ['folders/a', 'folders/b'], 1000)
+        cache.set_children('folders/a', ['folders/a.1'], 1000)
+        cache.set_children('folders/a.1', ['folders/a.1.1'], 1000)
+        cache.set_children('folders/b', ['folders/b.1'], 1000)
+        cache.set_children('organizations/1', ['folders/b'], 2000)
+        self.assertEqual(sorted(cache.nodes),
+                         ['folders/b', 'folders/b.1', 'organizations/1'])
+        self.assertEqual(cache.children('folders/b'), ['folders/b.1'])
+
+    def moved_folder_cache(self):
+        """ A cache in which x, under b.1, moved to a and a was relisted."""
+        cache = configs.FolderCache(self.path, 100)
+        cache.set_children('organizations/1', ['folders/a', 'folders/b'], 1000)
+        cache.set_children('folders/b', ['folders/b.1'], 1000)
+        cache.set_children('folders/b.1', ['folders/x'], 1000)
+        cache.set_children('folders/x', ['folders/x.1'], 1000)
+        cache.set_children('folders/a', ['folders/x'], 2000)
+        return cache
+
+    def test_moved_children_keep_their_subtree(self):
+        cache = self.moved_folder_cache()
+        cache.set_children('folders/b.1', [], 2000)
+        self.assertEqual(cache.children('folders/a'), ['folders/x'])
+        self.assertEqual(cache.children('folders/x'), ['folders/x.1'])
+
+        cache = self.moved_folder_cache()
+        cache.set_children('organizations/1', ['folders/a'], 2000)
+        self.assertEqual(sorted(cache.nodes),
+                         ['folders/a', 'folders/x', 'folders/x.1', 'organizations/1'])
+
+    def test_moved_folder_is_listed_once(self):
+        cache = configs.FolderCache(self.path, 100)
+        cache.set_children('organizations/1', ['folders/a', 'folders/b'], 1000)
+        cache.set_children('folders/b', ['folders/x'], 1000)
+        cache.set_children('folders/x', ['folders/x.1'], 1000)
+        # x moved from b to a, and b has not expired yet
+        cache.set_children('folders/a', ['folders/x'], 1050)
+        self.assertFalse(cache.is_stale('folders/b', 1050))
+        self.assertEqual(cache.children('folders/b'), [])
+        self.assertEqual(cache.descendants('organizations/1', 4),
+                         ['folders/a', 'folders/x', 'folders/x.1', 'folders/b'])
+
+    def test_descendants_depth_first_up_to_max_levels(self):
+        cache = configs.FolderCache(self.path, 100)
+        cache.set_children('organizations/1', ['folders/a', 'folders/b'], 1000)
+        cache.set_children('folders/a', ['folders/a.1', 'folders/a.2'], 1000)
+        cache.set_children('folders/a.1', ['folders/a.1.1'], 1000)
+        self.assertEqual(cache.descendants('organizations/1', 2),
+                         ['folders/a', 'folders/a.1', 'folders/a.2', 'folders/b'])
+        self.assertEqual(cache.descendants('organizations/1', 3)[2], 'folders/a.1.1')
+
+    def test_save_and_load(self):
+        cache = configs.FolderCache(self.path, 100)
+        cache.set_children('organizations/1', ['folders/a'], 1000)
+        cache.save()
+        cache.set_children('organizations/1', ['folders/b'], 2000)
+        cache.save()
+        self.assertEqual(os.listdir(self.dir), ['folders.json'])
+        loaded = configs.FolderCache(self.path, 100)
+        self.assertEqual(loaded.nodes, cache.nodes)
+        self.assertEqual(loaded.children('organizations/1'), ['folders/b'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Tests of the PubSub topic provider.
+
+gcloud is replaced with the fake next to this file. Run from the
+dm-scaffolder directory with: python tests/pubsub_test.py
+"""
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import configs
+from providers.pubsub import PubSubTopicCFT
+
+
+class PubSubTopicTest(unittest.TestCase):
+
+    def setUp(self):
+        self.state_dir = tempfile.mkdtemp()
+        self.environ = dict(os.environ)
+        os.environ['FAKE_GCLOUD_DIR'] = self.state_dir
+        os.environ['PATH'] = TESTS_DIR + os.pathsep + os.environ['PATH']
+        # The providers read configs.yaml next to configs.py, stand in for it
+        self.configs_path = os.path.splitext(configs.__file__)[0] + '.yaml'
+        configs.Config.loaded[self.configs_path] = {}
+
+    def tearDown(self):
+        del configs.Config.loaded[self.configs_path]
+        os.environ.clear()
+        os.environ.update(self.environ)
+        shutil.rmtree(self.state_dir)
+
+    def calls(self):
+        with open(os.path.join(self.state_dir, 'calls')) as f:
+            return f.readlines()
+
+    def test_subscriptions_by_topic(self):
+        topics = list(PubSubTopicCFT().get_list('--project=p'))
+        self.assertEqual([t.properties['name'] for t in topics],
+                         ['projects/p/topics/t-%d' % i for i in range(3)])
+        self.assertEqual(
+            [[s['name'] for s in t.base_yaml['properties']['subscriptions']]
+             for t in topics],
+            [['projects/p/subscriptions/s-0-0', 'projects/p/subscriptions/s-0-1'],
+             ['projects/p/subscriptions/s-1-0', 'projects/p/subscriptions/s-1-1'],
+             []])
+
+    def test_lists_subscriptions_once_with_the_job_flags(self):
+        list(PubSubTopicCFT().get_list('--project=p'))
+        calls = self.calls()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(
+            sorted(c.split()[1] for c in calls), ['subscriptions', 'topics'])
+        for call in calls:
+            self.assertIn('--project=p', call.split())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -18,23 +18,43 @@
 # Script for resizing managed instance group (MIG) cluster size based
 # on the number of jobs in the Condor Queue.
 
-from pprint import pprint
+from pprint import pformat
 from googleapiclient import discovery
 from oauth2client.client import GoogleCredentials
+from multiprocessing.pool import ThreadPool
 
-import os
-import math
+import condor_parser
+import policy
+import time
 import argparse
+import httplib2
+import threading
 
 parser = argparse.ArgumentParser("autoscaler.py")
 parser.add_argument("-p", "--project_id", help="Project id", type=str)
 parser.add_argument("-r", "--region", help="GCP region where the managed instance group is located", type=str)
 parser.add_argument("-z", "--zone", help="Name of GCP zone where the managed instance group is located", type=str)
 parser.add_argument("-g", "--group_manager", help="Name of the managed instance group", type=str)
-parser.add_argument("-c", "--computeinstancelimit", help="Maximum number of compute instances", type=int)
+parser.add_argument("-m", "--mig", help="Managed instance group as ZONE/NAME or REGION/NAME, optionally followed by :MAX_SIZE:WEIGHT. Can be repeated, replaces --zone and --group_manager", type=str, action="append")
+parser.add_argument("-c", "--computeinstancelimit", help="Maximum number of compute instances, in all managed instance groups together", type=int)
 parser.add_argument("-v", "--verbosity", help="Increase output verbosity. 1-show basic debug info. 2-show detail debug info", type=int, choices=[0, 1, 2])
+parser.add_argument("-d", "--daemon", help="Keep running and resize the managed instance group every --interval seconds", action="store_true")
+parser.add_argument("-i", "--interval", help="Seconds between two resizes in daemon mode. Default is 60", type=int, default=60)
+parser.add_argument("--delete_chunk_size", help="Maximum number of instances removed by one delete request, from 1 to 1000. Default is 100", type=int, default=100)
+parser.add_argument("--record_trace", help="Append the time and queue length of every run to this file, for simulate.py", type=str)
+policy.addPolicyArguments(parser)
 args = parser.parse_args()
 
+# deleteInstances accepts at most 1000 instances per request
+if not 1 <= args.delete_chunk_size <= 1000:
+    parser.error("--delete_chunk_size must be between 1 and 1000")
+
+# The predictive policy learns the queue growth and the time of the last
+# resizes from the previous runs of the same process, which a single run
+# does not have
+if args.policy == 'predictive' and not args.daemon:
+    parser.error("--policy predictive requires --daemon")
+
 # Project ID
 project = args.project_id  # Ex:'slurm-var-demo'
 
@@ -58,7 +78,7 @@ debug = 0
 if (args.verbosity):
     debug = args.verbosity
 
-# Limit for the maximum number of compute instance. If zero (default setting), no limit will be enforced by the  script 
+# Limit for the maximum number of compute instance, in all MIGs together. If zero (default setting), no limit will be enforced by the  script 
 compute_instance_limit = 0
 if (args.computeinstancelimit):
     compute_instance_limit = abs(args.computeinstancelimit)
@@ -67,209 +87,380 @@ if (args.computeinstancelimit):
 if debug > 1:
     print 'Launching autoscaler.py with the following arguments:'
     print 'project_id: ' + project
-    print 'region: ' + region
-    print 'zone: ' + zone
-    print 'group_manager: ' + instance_group_manager
+    print 'region: ' + str(region)
+    print 'zone: ' + str(zone)
+    print 'group_manager: ' + str(instance_group_manager)
+    print 'mig: ' + str(args.mig)
     print 'computeinstancelimit: ' + str(compute_instance_limit)
     print 'debuglevel: ' + str(debug)
-
-
-# Remove specified instance from MIG and decrease MIG size
-def deleteFromMig(instance):
-    instanceUrl = 'https://www.googleapis.com/compute/v1/projects/' \
-        + project + '/zones/' + zone + '/instances/' + instance
-    instances_to_delete = {'instances': [instanceUrl]}
-
-    requestDelInstance = \
-        service.instanceGroupManagers().deleteInstances(project=project,
-            zone=zone, instanceGroupManager=instance_group_manager,
-            body=instances_to_delete)
-    response = requestDelInstance.execute()
-    if debug > 0:
-        print 'Request to delete instance ' + instance
-        pprint(response)
-
-    return response
-
-def getInstanceTemplateInfo():
-    requestTemplateName = \
-        service.instanceGroupManagers().get(project=project, zone=zone,
-            instanceGroupManager=instance_group_manager,
-            fields='instanceTemplate')
-    responseTemplateName = requestTemplateName.execute()
-    template_name = ''
+    print 'daemon: ' + str(args.daemon)
+    print 'interval: ' + str(args.interval)
+    print 'delete_chunk_size: ' + str(args.delete_chunk_size)
+    print 'policy: ' + args.policy
+
+
+# Information about the instance templates of the MIGs, by template URL. The
+# template of a MIG rarely changes, so it is only looked up again when the
+# instanceTemplate of the MIG points to a new one.
+template_info_cache = {}
+
+# Slots of every Condor node, kept up to date across runs in daemon mode
+slot_index = condor_parser.SlotIndex()
+
+# Maximum number of API calls, such as operations waited on, made at the
+# same time
+api_threads = 16
+
+# The http connections of the API client can not be shared between threads,
+# so each thread that calls the API gets its own
+thread_local = threading.local()
+
+
+def getHttp():
+    if not hasattr(thread_local, 'http'):
+        thread_local.http = credentials.authorize(httplib2.Http())
+    return thread_local.http
+
+
+# A zonal or regional managed instance group, given as
+# LOCATION/NAME[:MAX_SIZE[:WEIGHT]], and the state kept about it across runs.
+# MAX_SIZE limits the MIG alone, --computeinstancelimit all MIGs together;
+# the queue is spread over the MIGs in proportion to their WEIGHT, 1 by
+# default, by policy.spreadQueue
+class Mig(object):
+
+    def __init__(self, spec):
+        location_name, _, options = spec.partition(':')
+        self.location, _, self.name = location_name.partition('/')
+        options = options.split(':') if options else []
+        self.max_size = 0
+        if len(options) > 0 and options[0]:
+            self.max_size = abs(int(options[0]))
+        self.weight = 1.0
+        if len(options) > 1 and options[1]:
+            self.weight = float(options[1])
+        # Zones are regions with a suffix, e.g. us-central1-f
+        self.regional = self.location.count('-') < 2
+        # The scaling policy keeps its queue samples and the time of the
+        # last resizes across runs in daemon mode
+        self.policy = policy.policyFromArgs(args, self.max_size)
+        self.current = 0
+        self.template_url = None
+        self.cores_per_node = 0
+        # Zone to look up the machine type in
+        self.zone = self.location
+
+    def __str__(self):
+        return self.location + '/' + self.name
+
+    def groupManagers(self):
+        if self.regional:
+            return service.regionInstanceGroupManagers()
+        return service.instanceGroupManagers()
+
+    def locationArgs(self):
+        if self.regional:
+            return {'region': self.location}
+        return {'zone': self.location}
+
+    # Number of jobs the MIG can run at its maximum size
+    def capacity(self):
+        if self.max_size <= 0:
+            return float('inf')
+        return self.max_size * self.cores_per_node
+
+    def isFull(self, size):
+        return self.max_size > 0 and size >= self.max_size
+
+
+# Get the current size and the instance template of a MIG. Runs on a pool
+# thread, so the messages are returned to be printed by the caller
+def refreshMig(mig):
+    messages = []
+    requestGroupInfo = mig.groupManagers().get(project=project,
+            instanceGroupManager=mig.name, **mig.locationArgs())
+    responseGroupInfo = requestGroupInfo.execute(http=getHttp())
+    mig.current = int(responseGroupInfo['targetSize'])
+    mig.template_url = responseGroupInfo['instanceTemplate']
+    if mig.regional:
+        zones = responseGroupInfo.get('distributionPolicy', {}).get('zones', [])
+        if zones:
+            mig.zone = zones[0]['zone'].split('/')[-1]
 
     if debug > 1:
-        print 'Request for the template name'
-        pprint(responseTemplateName)
+        messages.append('MIG Information:')
+        messages.append(str(responseGroupInfo))
 
-    if len(responseTemplateName) > 0:
-        template_url = responseTemplateName.get('instanceTemplate')
-        template_url_partitioned = template_url.split('/')
-        template_name = \
-            template_url_partitioned[len(template_url_partitioned) - 1]
+    instanceTemlateInfo = getInstanceTemplateInfo(mig.template_url, mig.zone,
+                                                  messages)
+    if debug > 1:
+        messages.append('Information about the compute instance template')
+        messages.append(pformat(instanceTemlateInfo))
+    mig.cores_per_node = instanceTemlateInfo['guest_cpus']
+    return messages
+
+
+# URLs of the instances of a MIG whose name is in names
+def listInstances(mig, names):
+    urls = {}
+    list_args = mig.locationArgs()
+    while True:
+        request = mig.groupManagers().listManagedInstances(project=project,
+                instanceGroupManager=mig.name, **list_args)
+        response = request.execute(http=getHttp())
+        for managed in response.get('managedInstances', []):
+            name = managed['instance'].split('/')[-1]
+            if name in names:
+                urls[name] = managed['instance']
+        if not response.get('nextPageToken'):
+            return urls
+        list_args['pageToken'] = response['nextPageToken']
+
+
+# Remove specified instances from MIG and decrease MIG size. The instances
+# are sent in chunks of --delete_chunk_size per request; one operation is
+# returned for each chunk, and messages are added to messages
+def deleteFromMig(mig, instance_urls, messages):
+    responses = []
+    for start in range(0, len(instance_urls), args.delete_chunk_size):
+        chunk = instance_urls[start:start + args.delete_chunk_size]
+        instances_to_delete = {'instances': chunk}
+
+        requestDelInstance = \
+            mig.groupManagers().deleteInstances(project=project,
+                instanceGroupManager=mig.name, body=instances_to_delete,
+                **mig.locationArgs())
+        response = requestDelInstance.execute(http=getHttp())
+        if debug > 0:
+            messages.append('Request to delete instances ' + ', '.join(
+                url.split('/')[-1] for url in chunk))
+            messages.append(pformat(response))
+        responses.append(response)
+
+    return responses
+
+
+# Wait until a zonal or regional operation is done. Runs on a pool thread
+def waitForOperation(operation):
+    while operation.get('status') != 'DONE':
+        if 'zone' in operation:
+            request = service.zoneOperations().wait(project=project,
+                    zone=operation['zone'].split('/')[-1],
+                    operation=operation['name'])
+        else:
+            request = service.regionOperations().wait(project=project,
+                    region=operation['region'].split('/')[-1],
+                    operation=operation['name'])
+        operation = request.execute(http=getHttp())
+    return operation
+
+
+# Wait on all operations concurrently, and add the errors of failed ones to
+# messages
+def waitForOperations(operations, messages):
+    if not operations:
+        return []
+    results = operation_pool.map(waitForOperation, operations, 1)
+
+    for operation in results:
+        if 'error' in operation:
+            messages.append('Operation ' + operation['name'] + ' failed:')
+            messages.append(pformat(operation['error']))
+        elif debug > 1:
+            messages.append('Operation ' + operation['name'] + ' done')
+    return results
+
+# Machine type and number of CPUs of an instance template, with messages
+# added to messages
+def getInstanceTemplateInfo(template_url, zone, messages):
+    if template_url in template_info_cache:
+        return template_info_cache[template_url]
+
+    template_url_partitioned = template_url.split('/')
+    template_name = \
+        template_url_partitioned[len(template_url_partitioned) - 1]
 
     requestInstanceTemplate = \
         service.instanceTemplates().get(project=project,
             instanceTemplate=template_name, fields='properties')
-    responseInstanceTemplateInfo = requestInstanceTemplate.execute()
+    responseInstanceTemplateInfo = requestInstanceTemplate.execute(http=getHttp())
 
     if debug > 1:
-        print 'Template information'
-        pprint(responseInstanceTemplateInfo['properties'])
+        messages.append('Template information')
+        messages.append(pformat(responseInstanceTemplateInfo['properties']))
 
     machine_type = responseInstanceTemplateInfo['properties']['machineType']
     is_preemtible = responseInstanceTemplateInfo['properties']['scheduling']['preemptible']
     if debug > 0:
-        print 'Machine Type: ' + machine_type
-        print 'Is preemtible: ' + str(is_preemtible)
+        messages.append('Machine Type: ' + machine_type)
+        messages.append('Is preemtible: ' + str(is_preemtible))
     request = service.machineTypes().get(project=project, zone=zone,
             machineType=machine_type)
-    response = request.execute()
+    response = request.execute(http=getHttp())
     guest_cpus = response['guestCpus']
     if debug > 1:
-        print 'Machine information'
-        pprint(responseInstanceTemplateInfo['properties'])
+        messages.append('Machine information')
+        messages.append(pformat(response))
     if debug > 0:
-        print 'Guest CPUs: ' + str(guest_cpus)
+        messages.append('Guest CPUs: ' + str(guest_cpus))
 
     instanceTemlateInfo = {'machine_type': machine_type,
                            'is_preemtible': is_preemtible,
                            'guest_cpus': guest_cpus}
+    template_info_cache[template_url] = instanceTemlateInfo
     return instanceTemlateInfo
 
 
-# Obtain credentials
+# Resize one MIG to size. Scaling down removes idle nodes, taken from
+# idle_nodes, the longest idle first. Runs on a pool thread, so the messages
+# are returned to be printed by the caller
+def resizeMig(change):
+    mig, size, idle_nodes = change
+    messages = []
+    if size < mig.current:
+        instance_urls = listInstances(mig, set(idle_nodes))
+        idle_nodes = [n for n in idle_nodes if n in instance_urls]
+        idle_nodes = idle_nodes[:mig.current - size]
+        for node in idle_nodes:
+            messages.append('Will shut down: ' + node + ' ...')
+        operations = deleteFromMig(mig, [instance_urls[n] for n in idle_nodes],
+                                   messages)
+        waitForOperations(operations, messages)
+
+        if debug > 1:
+            messages.append("Scaling down complete")
+
+    if size > mig.current:
+        messages.append("Scaling up " + str(mig) + ". Need to increase number of instances to " + str(size))
+        #Request to resize
+        request = mig.groupManagers().resize(project=project,
+                instanceGroupManager=mig.name, size=size,
+                **mig.locationArgs())
+        response = request.execute(http=getHttp())
+        if debug > 1:
+            messages.append('Requesting to increase MIG size')
+            messages.append(pformat(response))
+            messages.append("Scaling up complete")
+    return messages
+
+
+# Resize the MIGs once, based on the current number of jobs in the queue
+def autoscale():
+    # Get total number of jobs in the queue that includes number of jos waiting as well as number of jobs already assigned to nodes
+    totals = condor_parser.getQueueTotals()
+    queue = totals.jobs
+    idle_jobs = totals.idle
+    on_hold_jobs = totals.held
+
+    print 'Total queue length: ' + str(queue)
+    print 'Idle jobs: ' + str(idle_jobs)
+    print 'Jobs on hold: ' + str(on_hold_jobs)
+
+    # Adjust current queue length by the number of jos that are on-hold
+    queue -=on_hold_jobs
+    if on_hold_jobs>0:
+        print "Adjusted queue length: " + str(queue)
+
+    now = time.time()
+    if args.record_trace:
+        with open(args.record_trace, 'a') as trace:
+            trace.write('%d,%d\n' % (now, queue))
+
+    # Get current number of instances and the instance template of every
+    # MIG, concurrently
+    for messages in mig_pool.map(refreshMig, migs, 1):
+        for message in messages:
+            print message
+    templates_in_use = set(mig.template_url for mig in migs)
+    for template_url in template_info_cache.keys():
+        if template_url not in templates_in_use:
+            del template_info_cache[template_url]
+
+    nodes = policy.spreadQueue(queue, migs, compute_instance_limit)
+    if compute_instance_limit > 0 and sum(nodes.values()) >= compute_instance_limit:
+        print 'Total target size is limited by ' + str(compute_instance_limit)
+    sizes = {}
+    for mig in migs:
+        # Jobs the nodes of the MIG run, so the policy sizes the MIG for
+        # exactly its share of the nodes
+        share = nodes[mig] * mig.cores_per_node
+        if len(migs) > 1:
+            print 'Managed instance group ' + str(mig) + ': ' + str(nodes[mig]) + ' nodes'
+        print 'Number of CPU per compute node: ' + str(mig.cores_per_node)
+        sizes[mig] = mig.policy.target(now, share, mig.current, mig.cores_per_node)
+
+        # If compute instance limit is specified, can not start more instances then specified in the limit
+        if mig.policy.limited:
+            print "MIG target size will be limited by " + str(mig.max_size)
+    if compute_instance_limit > 0 and sum(sizes.values()) > compute_instance_limit:
+        print 'Target sizes reduced to ' + str(compute_instance_limit) + ' nodes in total'
+        policy.limitTotalSize(sizes, nodes, compute_instance_limit)
+
+    changes = []
+    for mig in migs:
+        size = sizes[mig]
+        if len(migs) > 1:
+            print 'Managed instance group ' + str(mig) + ':'
+        print 'New MIG target size: ' + str(size)
+        print 'Current MIG target size: ' + str(mig.current)
+
+        if size == 0 and mig.current == 0:
+            print 'No jobs in the queue and no compute instances running. Nothing to do'
+        elif size == mig.current:
+            print 'Running correct number of compute nodes to handle number of jobs in the queue'
+        else:
+            changes.append((mig, size))
+
+    idle_nodes = []
+    if any(size < mig.current for mig, size in changes):
+        print 'Scaling down. Looking for nodes that can be shut down'
+        # Count the claimed and unclaimed slots of every node in Condor
+        condor_parser.updateSlotIndex(slot_index)
+        if debug > 1:
+            print 'Compute node slots:'
+            for node in sorted(slot_index.nodes):
+                print slot_index.nodes[node]
+
+        # Nodes that are not busy (all slots showing status as
+        # "Unclaimed"), the longest idle first
+        idle_nodes = sorted(slot_index.idleNodes(),
+                            key=lambda n: slot_index.nodes[n].last_activity)
+
+    # Resize the MIGs concurrently
+    results = mig_pool.map(resizeMig,
+                           [(mig, size, idle_nodes) for mig, size in changes], 1)
+    for messages in results:
+        for message in messages:
+            print message
+
+
+migs = [Mig(spec) for spec in args.mig or [zone + '/' + instance_group_manager]]
+
+# The queue is spread in proportion to the weights, so at least one MIG must
+# get a share of it
+if not any(mig.weight > 0 for mig in migs):
+    parser.error("at least one --mig must have a WEIGHT above 0")
+
+# Obtain credentials once; in daemon mode the same authenticated client is
+# used for every resize
 credentials = GoogleCredentials.get_application_default()
 service = discovery.build('compute', 'v1', credentials=credentials)
 
-# Get total number of jobs in the queue that includes number of jos waiting as well as number of jobs already assigned to nodes
-queue_length_req = 'condor_q -totals -format "%d " Jobs -format "%d " Idle -format "%d " Held'
-queue_length_resp = os.popen(queue_length_req).read().split()
-
-if len(queue_length_resp) > 1:
-    queue = int(queue_length_resp[0])
-    idle_jobs = int(queue_length_resp[1])
-    on_hold_jobs = int(queue_length_resp[2])
-else:
-    queue = 0
-    idle_jobs = 0
-    on_hold_jobs = 0
-
-print 'Total queue length: ' + str(queue)
-print 'Idle jobs: ' + str(idle_jobs)
-print 'Jobs on hold: ' + str(on_hold_jobs)
-
-instanceTemlateInfo = getInstanceTemplateInfo()
-if debug > 1:
-    print 'Information about the compute instance template'
-    pprint(instanceTemlateInfo)
-
-cores_per_node = instanceTemlateInfo['guest_cpus']
-print 'Number of CPU per compute node: ' + str(cores_per_node)
-
-# Get state for for all jobs in Condor
-name_req = 'condor_status  -af name state'
-slot_names = os.popen(name_req).read().splitlines()
-if debug > 1:
-    print 'Currently running jobs in Condor'
-    print slot_names
-
-# Adjust current queue length by the number of jos that are on-hold
-queue -=on_hold_jobs
-if on_hold_jobs>0:
-    print "Adjusted queue length: " + str(queue) 
-
-# Calculate number instances to satisfy current job queue length
-if queue > 0:
-    size = int(math.ceil(float(queue) / float(cores_per_node)))
-    if debug>0:
-       print "Calucalting size of MIG: ⌈" + str(queue) + "/" + str(cores_per_node) + "⌉ = " + str(size)
-else:
-    size = 0
-
-# If compute instance limit is specified, can not start more instances then specified in the limit
-if compute_instance_limit > 0 and size > compute_instance_limit:
-    size = compute_instance_limit;
-    print "MIG target size will be limited by " + str(compute_instance_limit)
-
-print 'New MIG target size: ' + str(size)
-
-# Get current number of instances in the MIG
-requestGroupInfo = service.instanceGroupManagers().get(project=project,
-        zone=zone, instanceGroupManager=instance_group_manager)
-responseGroupInfo = requestGroupInfo.execute()
-currentTarget = int(responseGroupInfo['targetSize'])
-print 'Current MIG target size: ' + str(currentTarget)
-
-if debug > 1:
-    print 'MIG Information:'
-    print responseGroupInfo
+# The thread pools, and the http connection of each of their threads, are
+# kept for the life of the process. Operations are waited on from the MIG
+# threads, so they get a pool of their own
+mig_pool = ThreadPool(min(len(migs), api_threads))
+operation_pool = ThreadPool(api_threads)
 
-if size == 0 and currentTarget == 0:
-    print 'No jobs in the queue and no compute instances running. Nothing to do'
+if not args.daemon:
+    autoscale()
     exit()
 
-if size == currentTarget:
-    print 'Running correct number of compute nodes to handle number of jobs in the queue'
-    exit()
-
-
-if size < currentTarget:
-    print 'Scaling down. Looking for nodes that can be shut down' 
-    # Find nodes that are not busy (all slots showing status as "Unclaimed")
-
-    node_busy = {}
-    for slot_name in slot_names:
-        name_status = slot_name.split()
-        if len(name_status) > 1:
-            name = name_status[0]
-            status = name_status[1]
-            slot = "NO-SLOT"
-            slot_server = name.split('@')
-            if len(slot_server) > 1:
-                slot = slot_server[0]
-                server = slot_server[1].split('.')[0]
-            else:
-                server = slot_server[0].split('.')[0]
-
-            if debug > 0:
-                print slot + ', ' + server + ', ' + status + '\n'
-
-            if server not in node_busy:
-                if status == 'Unclaimed':
-                    node_busy[server] = False
-                else:
-                    node_busy[server] = True
-            else:
-                if status != 'Unclaimed':
-                    node_busy[server] = True
-                    
-    if debug > 1:
-        print 'Compuute node busy status:'
-        print node_busy
-
-    # Shut down nodes that are not busy
-    for node in node_busy:
-        if not node_busy[node]:
-            print 'Will shut down: ' + node + ' ...'
-            respDel = deleteFromMig(node)
-            if debug > 1:
-                print "Shut down request for compute node " + node
-                pprint(respDel)
-                
-    if debug > 1:
-        print "Scaling down complete"
-
-if size > currentTarget:
-    print "Scaling up. Need to increase number of instances to " + str(size)
-    #Request to resize
-    request = service.instanceGroupManagers().resize(project=project,
-            zone=zone, 
-            instanceGroupManager=instance_group_manager,
-            size=size)
-    response = request.execute()
-    if debug > 1:
-        print 'Requesting to increase MIG size'
-        pprint(response)
-        print "Scaling up complete"
+while True:
+    started = time.time()
+    try:
+        autoscale()
+    except Exception as e:
+        # Keep the control loop running through transient API or HTCondor errors
+        print 'Autoscaling failed: ' + str(e)
+    time.sleep(max(0, args.interval - (time.time() - started)))
@@ -0,0 +1,176 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Reads the state of the HTCondor queue and pool from the machine readable
+# output of condor_q and condor_status.
+
+from subprocess import CalledProcessError, Popen, PIPE
+
+# Totals of the queue, one fixed column per attribute
+QUEUE_TOTALS_CMD = ['condor_q', '-totals',
+                    '-format', '%d ', 'Jobs',
+                    '-format', '%d ', 'Idle',
+                    '-format', '%d ', 'Held']
+
+# One slot per line, with tab separated fixed columns
+SLOTS_CMD = ['condor_status', '-af:t',
+             'Name', 'Machine', 'State', 'EnteredCurrentActivity']
+
+
+class QueueTotals(object):
+    """Number of jobs in the queue: all of them, idle and on hold."""
+
+    def __init__(self, jobs=0, idle=0, held=0):
+        self.jobs = jobs
+        self.idle = idle
+        self.held = held
+
+
+class Node(object):
+    """Slot counts of one compute node.
+
+    last_activity is the latest time, in seconds since the epoch, at which
+    one of the slots of the node entered its current activity.
+    """
+
+    __slots__ = ('name', 'slots', 'claimed', 'unclaimed', 'last_activity')
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.slots = 0
+        self.claimed = 0
+        self.unclaimed = 0
+        self.last_activity = 0
+
+    def isIdle(self):
+        return self.slots > 0 and self.claimed == 0
+
+    def __repr__(self):
+        return '%s(slots=%d, claimed=%d, unclaimed=%d, last_activity=%d)' % (
+            self.name, self.slots, self.claimed, self.unclaimed,
+            self.last_activity)
+
+
+class SlotIndex(object):
+    """Per node slot counts of the pool, by node name.
+
+    The index is meant to be kept across runs of the autoscaler: update()
+    reuses the Node objects and the host name to node name mapping of
+    the previous run, and drops the nodes that are gone from the pool.
+    """
+
+    def __init__(self):
+        self.nodes = {}
+        # Machine (full host name) to node name, e.g.
+        # condor-compute-0001.c.project.internal -> condor-compute-0001
+        self.machines = {}
+
+    def update(self, lines):
+        """Rebuilds the counts from condor_status lines, see SLOTS_CMD."""
+        for node in self.nodes.itervalues():
+            node.reset()
+        seen = set()
+        for line in lines:
+            columns = line.rstrip('\n').split('\t')
+            if len(columns) < 3:
+                continue
+            name, machine, state = columns[0], columns[1], columns[2]
+            if machine == 'undefined' or not machine:
+                # Slot names are slotN@host, or just host without slots
+                machine = name.rpartition('@')[2]
+            node_name = self.machines.get(machine)
+            if node_name is None:
+                node_name = machine.split('.', 1)[0]
+                self.machines[machine] = node_name
+            node = self.nodes.get(node_name)
+            if node is None:
+                node = Node(node_name)
+                self.nodes[node_name] = node
+            seen.add(node_name)
+
+            node.slots += 1
+            if state == 'Unclaimed':
+                node.unclaimed += 1
+            else:
+                node.claimed += 1
+            if len(columns) > 3:
+                try:
+                    entered = int(columns[3])
+                except ValueError:
+                    entered = 0
+                if entered > node.last_activity:
+                    node.last_activity = entered
+
+        for node_name in [n for n in self.nodes if n not in seen]:
+            del self.nodes[node_name]
+        if len(self.machines) > 2 * len(self.nodes):
+            self.machines = dict((m, n) for m, n in self.machines.iteritems()
+                                 if n in self.nodes)
+        return self
+
+    def idleNodes(self):
+        """Names of the nodes with no claimed slot, sorted."""
+        return sorted(n for n, node in self.nodes.iteritems()
+                      if node.isIdle())
+
+    def busyNodes(self):
+        """Names of the nodes with at least one claimed slot, sorted."""
+        return sorted(n for n, node in self.nodes.iteritems()
+                      if node.claimed > 0)
+
+
+def parseQueueTotals(output):
+    """Returns the QueueTotals of the output of QUEUE_TOTALS_CMD."""
+    values = output.split()
+    if len(values) < 3:
+        return QueueTotals()
+    return QueueTotals(int(values[0]), int(values[1]), int(values[2]))
+
+
+def getQueueTotals():
+    """Runs condor_q and returns the QueueTotals of the queue.
+
+    Raises CalledProcessError if condor_q fails, rather than reporting an
+    empty queue.
+    """
+    proc = Popen(QUEUE_TOTALS_CMD, stdout=PIPE)
+    output = proc.communicate()[0]
+    if proc.returncode:
+        raise CalledProcessError(proc.returncode, ' '.join(QUEUE_TOTALS_CMD))
+    return parseQueueTotals(output)
+
+
+def updateSlotIndex(index):
+    """Runs condor_status and updates the SlotIndex from its output.
+
+    The output is read line by line as condor_status writes it, so the whole
+    listing of a large pool is never held in memory at once. Raises
+    CalledProcessError if condor_status fails, as its output is then
+    incomplete and the index must not be used to pick nodes to delete.
+    """
+    proc = Popen(SLOTS_CMD, stdout=PIPE)
+    try:
+        index.update(proc.stdout)
+    finally:
+        proc.stdout.close()
+        proc.wait()
+    if proc.returncode:
+        raise CalledProcessError(proc.returncode, ' '.join(SLOTS_CMD))
+    return index
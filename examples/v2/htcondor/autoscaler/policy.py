@@ -0,0 +1,249 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Scaling policies of the autoscaler. A policy turns the queue length seen
+# at each run into the target size of the managed instance group (MIG).
+# Policies keep state between runs, so they should be created once per
+# process and fed every sample, as autoscaler.py does in daemon mode and
+# simulate.py does when it replays a trace.
+
+import math
+from collections import deque
+
+
+class ProportionalPolicy(object):
+    """One node per cores_per_node jobs in the queue, as many as needed.
+
+    This is the original rule of the autoscaler: the target size is
+    ⌈queue / cores_per_node⌉, capped by limit if limit is not zero.
+    """
+
+    def __init__(self, limit=0):
+        self.limit = limit
+        # Whether the last target was capped by the limit
+        self.limited = False
+
+    def needed(self, queue, cores_per_node):
+        if queue <= 0:
+            return 0
+        return int(math.ceil(float(queue) / float(cores_per_node)))
+
+    def capped(self, size):
+        self.limited = self.limit > 0 and size > self.limit
+        if self.limited:
+            return self.limit
+        return size
+
+    def target(self, now, queue, current, cores_per_node):
+        """Returns the target size of the MIG.
+
+        now is the time of the sample in seconds, queue the number of jobs
+        to run and current the current target size of the MIG.
+        """
+        return self.capped(self.needed(queue, cores_per_node))
+
+
+class PredictivePolicy(ProportionalPolicy):
+    """Sizes the MIG for the queue predicted horizon seconds ahead.
+
+    The queue growth rate is the least squares slope of the samples of the
+    last window seconds. A growing queue makes the MIG grow ahead of demand;
+    a shrinking one never sizes it below what the current queue needs.
+
+    The MIG grows as soon as more nodes are needed, by at most
+    max_scale_up_step nodes (0 is no limit) and not sooner than
+    scale_up_cooldown seconds after the previous scale-up. It only shrinks
+    when the need is below (1 - hysteresis) times its current size, by at
+    most max_scale_down_step nodes, and not sooner than scale_down_cooldown
+    seconds after any previous resize.
+    """
+
+    def __init__(self, limit=0, window=600, horizon=180, hysteresis=0.2,
+                 scale_up_cooldown=0, scale_down_cooldown=300,
+                 max_scale_up_step=0, max_scale_down_step=0):
+        ProportionalPolicy.__init__(self, limit)
+        self.window = window
+        self.horizon = horizon
+        self.hysteresis = hysteresis
+        self.scale_up_cooldown = scale_up_cooldown
+        self.scale_down_cooldown = scale_down_cooldown
+        self.max_scale_up_step = max_scale_up_step
+        self.max_scale_down_step = max_scale_down_step
+        self.samples = deque()
+        self.last_scale_up = None
+        self.last_scale_down = None
+
+    def rate(self):
+        """Queue growth in jobs per second over the window."""
+        n = len(self.samples)
+        if n < 2:
+            return 0.0
+        mean_t = sum(t for t, _ in self.samples) / float(n)
+        mean_q = sum(q for _, q in self.samples) / float(n)
+        var = sum((t - mean_t) ** 2 for t, _ in self.samples)
+        if var == 0:
+            return 0.0
+        cov = sum((t - mean_t) * (q - mean_q) for t, q in self.samples)
+        return cov / var
+
+    def predicted(self, now, queue):
+        self.samples.append((now, queue))
+        while self.samples and self.samples[0][0] < now - self.window:
+            self.samples.popleft()
+        return max(0.0, queue + self.rate() * self.horizon)
+
+    def since(self, now, last):
+        if last is None:
+            return float('inf')
+        return now - last
+
+    def target(self, now, queue, current, cores_per_node):
+        predicted = self.predicted(now, queue)
+        # Never plan for fewer nodes than the jobs already in the queue need
+        needed = self.needed(max(queue, predicted), cores_per_node)
+        size = current
+
+        if needed > current:
+            if self.since(now, self.last_scale_up) >= self.scale_up_cooldown:
+                size = needed
+                if self.max_scale_up_step > 0:
+                    size = min(size, current + self.max_scale_up_step)
+        elif needed < current * (1.0 - self.hysteresis) or needed == 0:
+            since_resize = min(self.since(now, self.last_scale_up),
+                               self.since(now, self.last_scale_down))
+            if since_resize >= self.scale_down_cooldown:
+                size = needed
+                if self.max_scale_down_step > 0:
+                    size = max(size, current - self.max_scale_down_step)
+
+        size = self.capped(size)
+        if size > current:
+            self.last_scale_up = now
+        elif size < current:
+            self.last_scale_down = now
+        return size
+
+
+def spreadQueue(queue, migs, limit=0):
+    """Spreads the queue over the MIGs and returns their number of nodes.
+
+    The jobs are spread in proportion to the weight of the MIGs. A MIG gets
+    at most as many jobs as it has cores at its maximum size; what does not
+    fit is spread over the other MIGs, and MIGs with a weight of 0 get none.
+    The total number of nodes is computed once, at most limit if limit is not
+    zero, and handed out as whole nodes by largest remainder, so that
+    rounding up every share does not add a node per MIG.
+
+    migs are autoscaler.Mig objects, or any object with a weight, a
+    cores_per_node, capacity() and isFull(size). Returns a dict of the
+    number of nodes by MIG. Raises ValueError if no MIG has a weight above 0.
+    """
+    if migs and not any(mig.weight > 0 for mig in migs):
+        raise ValueError('every managed instance group has a weight of 0')
+    shares = dict((mig, 0.0) for mig in migs)
+    remaining = float(queue)
+    open_migs = [mig for mig in migs if mig.weight > 0]
+    while remaining > 0 and open_migs:
+        total_weight = sum(mig.weight for mig in open_migs)
+        spread = 0.0
+        not_full = []
+        for mig in open_migs:
+            share = remaining * mig.weight / total_weight
+            room = mig.capacity() - shares[mig]
+            if share >= room:
+                share = room
+            else:
+                not_full.append(mig)
+            shares[mig] += share
+            spread += share
+        remaining -= spread
+        if len(not_full) == len(open_migs):
+            break
+        open_migs = not_full
+
+    # Nodes needed by each MIG for its share, as a fraction. The small
+    # tolerance keeps float errors from adding a node
+    wanted = dict((mig, shares[mig] / float(mig.cores_per_node))
+                  for mig in migs)
+    total_wanted = sum(wanted.values())
+    total = int(math.ceil(total_wanted - 1e-9))
+    if limit > 0 and total > limit:
+        total = limit
+        # Every MIG gets the same fraction of the nodes it wants
+        wanted = dict((mig, wanted[mig] * total / total_wanted)
+                      for mig in migs)
+
+    nodes = dict((mig, int(wanted[mig] + 1e-9)) for mig in migs)
+    for _ in range(total - sum(nodes.values())):
+        candidates = [mig for mig in migs
+                      if mig.weight > 0 and not mig.isFull(nodes[mig])]
+        if not candidates:
+            break
+        mig = max(candidates,
+                  key=lambda m: (wanted[m] - nodes[m], m.weight))
+        nodes[mig] += 1
+    return nodes
+
+
+def limitTotalSize(sizes, nodes, limit=0):
+    """Brings the total of the target sizes down to limit, if it is not zero.
+
+    The policies may exceed the limit when they keep nodes or grow ahead of
+    the queue. sizes and nodes are the target sizes and the spreadQueue
+    nodes of the MIGs, by MIG. Nodes are taken from the MIGs furthest above
+    their number of nodes first. sizes is changed in place and returned.
+    """
+    if limit <= 0:
+        return sizes
+    excess = sum(sizes.values()) - limit
+    while excess > 0:
+        mig = max(sizes, key=lambda m: (sizes[m] - nodes[m], sizes[m]))
+        sizes[mig] -= 1
+        excess -= 1
+    return sizes
+
+
+# Policies by the name used on the command line
+POLICIES = {
+    'proportional': ProportionalPolicy,
+    'predictive': PredictivePolicy,
+}
+
+
+def addPolicyArguments(parser):
+    """Adds the policy selection and tuning arguments to an ArgumentParser."""
+    parser.add_argument("--policy", help="Scaling policy: proportional (default) or predictive", choices=sorted(POLICIES), default='proportional')
+    parser.add_argument("--window", help="predictive: seconds of queue samples used to predict the queue growth. Default is 600", type=int, default=600)
+    parser.add_argument("--horizon", help="predictive: seconds ahead the queue is predicted for. Default is 180", type=int, default=180)
+    parser.add_argument("--hysteresis", help="predictive: only scale down when less than (1 - hysteresis) of the nodes are needed. Default is 0.2", type=float, default=0.2)
+    parser.add_argument("--scale_up_cooldown", help="predictive: minimum seconds between two scale-ups. Default is 0", type=int, default=0)
+    parser.add_argument("--scale_down_cooldown", help="predictive: minimum seconds between any resize and a scale-down. Default is 300", type=int, default=300)
+    parser.add_argument("--max_scale_up_step", help="predictive: maximum number of nodes added at once. Default is no limit", type=int, default=0)
+    parser.add_argument("--max_scale_down_step", help="predictive: maximum number of nodes removed at once. Default is no limit", type=int, default=0)
+
+
+def policyFromArgs(args, limit=0):
+    """Returns the policy selected by the arguments of addPolicyArguments."""
+    if args.policy == 'predictive':
+        return PredictivePolicy(limit, window=args.window,
+                                horizon=args.horizon,
+                                hysteresis=args.hysteresis,
+                                scale_up_cooldown=args.scale_up_cooldown,
+                                scale_down_cooldown=args.scale_down_cooldown,
+                                max_scale_up_step=args.max_scale_up_step,
+                                max_scale_down_step=args.max_scale_down_step)
+    return POLICIES[args.policy](limit)
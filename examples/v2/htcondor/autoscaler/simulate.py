@@ -0,0 +1,138 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Replays a recorded queue trace against the scaling policies, offline, and
+# reports the node-hours each policy uses against the time jobs wait.
+#
+# A trace has one "time,queue" line per autoscaler run, as written by
+# autoscaler.py --record_trace: the time in seconds and the number of jobs
+# in the queue, not counting the jobs on hold. The queue is replayed as
+# recorded, whatever the simulated cluster size. At every sample the policy
+# picks the target size. New nodes are ready boot_time seconds later.
+# Removed nodes are taken from the ready nodes without jobs, as the
+# autoscaler only deletes idle nodes. Until the next sample, every job of
+# the queue beyond the cores of the ready nodes counts as waiting.
+
+import argparse
+import math
+
+import policy
+
+
+class Result(object):
+    """Totals of one simulation run."""
+
+    def __init__(self, name):
+        self.name = name
+        self.node_seconds = 0.0
+        self.wait_job_seconds = 0.0
+        self.seconds = 0.0
+        self.max_nodes = 0
+        self.scale_ups = 0
+        self.scale_downs = 0
+        self.nodes_added = 0
+        self.nodes_removed = 0
+
+
+def readTrace(path):
+    """Returns the (time, queue) samples of a trace file, sorted by time."""
+    samples = []
+    with open(path) as f:
+        for line in f:
+            fields = line.replace(',', ' ').split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            try:
+                samples.append((float(fields[0]), int(fields[1])))
+            except (ValueError, IndexError):
+                # Header or malformed line
+                continue
+    samples.sort()
+    return samples
+
+
+def simulate(samples, scaling_policy, cores_per_node, boot_time, name=''):
+    """Replays samples against scaling_policy and returns a Result."""
+    result = Result(name)
+    # Time at which each node of the MIG is ready to run jobs
+    nodes = []
+    for i, (now, queue) in enumerate(samples):
+        current = len(nodes)
+        size = scaling_policy.target(now, queue, current, cores_per_node)
+        ready = [t for t in nodes if t <= now]
+        if size > current:
+            nodes.extend([now + boot_time] * (size - current))
+            result.scale_ups += 1
+            result.nodes_added += size - current
+        elif size < current:
+            busy = int(math.ceil(min(queue, len(ready) * cores_per_node)
+                                 / float(cores_per_node)))
+            removed = min(current - size, len(ready) - busy)
+            if removed > 0:
+                # Booting nodes are not in the pool yet, so the idle nodes
+                # removed are ready ones
+                nodes.sort()
+                del nodes[:removed]
+                ready = ready[removed:]
+                result.scale_downs += 1
+                result.nodes_removed += removed
+        result.max_nodes = max(result.max_nodes, len(nodes))
+
+        if i + 1 < len(samples):
+            dt = samples[i + 1][0] - now
+            result.seconds += dt
+            result.node_seconds += len(nodes) * dt
+            result.wait_job_seconds += max(
+                0, queue - len(ready) * cores_per_node) * dt
+    return result
+
+
+def printResults(results):
+    print '%-14s %10s %14s %12s %9s %6s %6s' % (
+        'policy', 'node-hours', 'job-wait-hours', 'avg-waiting', 'max-nodes',
+        'ups', 'downs')
+    for r in results:
+        avg_waiting = r.wait_job_seconds / r.seconds if r.seconds else 0
+        print '%-14s %10.1f %14.1f %12.1f %9d %6d %6d' % (
+            r.name, r.node_seconds / 3600, r.wait_job_seconds / 3600,
+            avg_waiting, r.max_nodes, r.scale_ups, r.scale_downs)
+
+
+def main():
+    parser = argparse.ArgumentParser("simulate.py")
+    parser.add_argument("trace", help="Queue trace file with time,queue lines", type=str)
+    parser.add_argument("--cores_per_node", help="Number of CPU per compute node. Default is 4", type=int, default=4)
+    parser.add_argument("--boot_time", help="Seconds before a new node runs jobs. Default is 120", type=int, default=120)
+    parser.add_argument("-c", "--computeinstancelimit", help="Maximum number of compute instances", type=int, default=0)
+    parser.add_argument("--compare", help="Simulate every policy, with the same tuning arguments", action="store_true")
+    policy.addPolicyArguments(parser)
+    args = parser.parse_args()
+
+    samples = readTrace(args.trace)
+    names = sorted(policy.POLICIES) if args.compare else [args.policy]
+    results = []
+    for name in names:
+        args.policy = name
+        scaling_policy = policy.policyFromArgs(args,
+                                               abs(args.computeinstancelimit))
+        results.append(simulate(samples, scaling_policy, args.cores_per_node,
+                                args.boot_time, name))
+    printResults(results)
+
+
+if __name__ == '__main__':
+    main()
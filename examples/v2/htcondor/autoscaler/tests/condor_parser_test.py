@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Tests of the parsing of condor_q and condor_status output. Run with:
+# python tests/condor_parser_test.py
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import condor_parser
+
+
+def slot(name, machine, state, entered):
+    return '\t'.join([name, machine, state, str(entered)]) + '\n'
+
+
+class SlotIndexTest(unittest.TestCase):
+
+    def testCountsSlotsPerNode(self):
+        index = condor_parser.SlotIndex().update([
+            slot('slot1@node-1.c.p.internal', 'node-1.c.p.internal', 'Claimed', 100),
+            slot('slot2@node-1.c.p.internal', 'node-1.c.p.internal', 'Unclaimed', 300),
+            slot('slot1@node-2.c.p.internal', 'node-2.c.p.internal', 'Unclaimed', 200),
+            slot('slot2@node-2.c.p.internal', 'node-2.c.p.internal', 'Unclaimed', 250),
+            # No Machine attribute, and a malformed line
+            slot('slot1@node-3.c.p.internal', 'undefined', 'Unclaimed', 'x'),
+            'garbage\n',
+        ])
+        self.assertEqual(index.idleNodes(), ['node-2', 'node-3'])
+        self.assertEqual(index.busyNodes(), ['node-1'])
+        node = index.nodes['node-1']
+        self.assertEqual((node.slots, node.claimed, node.unclaimed,
+                          node.last_activity), (2, 1, 1, 300))
+        self.assertEqual(index.nodes['node-2'].last_activity, 250)
+        self.assertEqual(index.nodes['node-3'].last_activity, 0)
+
+    def testUpdateReusesNodesAndDropsTheGoneOnes(self):
+        index = condor_parser.SlotIndex()
+        index.update([slot('slot1@a.internal', 'a.internal', 'Claimed', 1),
+                      slot('slot1@b.internal', 'b.internal', 'Claimed', 1)])
+        node_a = index.nodes['a']
+        index.update([slot('slot1@a.internal', 'a.internal', 'Unclaimed', 2)])
+        self.assertTrue(index.nodes['a'] is node_a)
+        self.assertEqual(sorted(index.nodes), ['a'])
+        self.assertEqual((node_a.slots, node_a.claimed), (1, 0))
+        self.assertEqual(index.idleNodes(), ['a'])
+
+
+class QueueTotalsTest(unittest.TestCase):
+
+    def testParse(self):
+        totals = condor_parser.parseQueueTotals('12 5 2 ')
+        self.assertEqual((totals.jobs, totals.idle, totals.held), (12, 5, 2))
+
+    def testEmptyOutput(self):
+        totals = condor_parser.parseQueueTotals('')
+        self.assertEqual((totals.jobs, totals.idle, totals.held), (0, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright 2018 Google Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Tests of the scaling policies. Run with: python tests/policy_test.py
+
+import argparse
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import policy
+
+
+class ProportionalPolicyTest(unittest.TestCase):
+
+    def testOneNodePerCoresPerNodeJobs(self):
+        p = policy.ProportionalPolicy()
+        self.assertEqual(p.target(0, 0, 5, 4), 0)
+        self.assertEqual(p.target(0, 1, 5, 4), 1)
+        self.assertEqual(p.target(0, 9, 0, 4), 3)
+
+    def testLimit(self):
+        p = policy.ProportionalPolicy(limit=2)
+        self.assertEqual(p.target(0, 100, 0, 4), 2)
+        self.assertTrue(p.limited)
+        self.assertEqual(p.target(0, 4, 2, 4), 1)
+        self.assertFalse(p.limited)
+
+
+class PredictivePolicyTest(unittest.TestCase):
+
+    def policy(self, **kwargs):
+        args = dict(window=600, horizon=180, hysteresis=0.2,
+                    scale_up_cooldown=0, scale_down_cooldown=0)
+        args.update(kwargs)
+        return policy.PredictivePolicy(**args)
+
+    def testGrowsAheadOfAGrowingQueue(self):
+        p = self.policy()
+        self.assertEqual(p.target(0, 40, 0, 4), 10)
+        # 40 jobs more per minute: 120 more jobs 180 seconds ahead
+        self.assertEqual(p.target(60, 80, 10, 4), 50)
+
+    def testNeverBelowTheCurrentQueue(self):
+        p = self.policy(hysteresis=0)
+        p.target(0, 400, 0, 4)
+        self.assertEqual(p.target(60, 100, 100, 4), 25)
+
+    def testWindowDropsOldSamples(self):
+        p = self.policy(window=100)
+        p.target(0, 0, 0, 4)
+        p.target(60, 60, 0, 4)
+        p.target(1000, 60, 0, 4)
+        self.assertEqual(list(p.samples), [(1000, 60)])
+        self.assertEqual(p.rate(), 0.0)
+
+    def testHysteresis(self):
+        p = self.policy()
+        # 9 nodes needed out of 10 is within the 20% hysteresis
+        self.assertEqual(p.target(0, 36, 10, 4), 10)
+        self.assertEqual(p.target(0, 28, 10, 4), 7)
+        self.assertEqual(p.target(0, 0, 10, 4), 0)
+
+    def testCooldowns(self):
+        p = self.policy(scale_up_cooldown=100, scale_down_cooldown=300,
+                        window=1)
+        self.assertEqual(p.target(0, 40, 0, 4), 10)
+        self.assertEqual(p.target(50, 80, 10, 4), 10)
+        self.assertEqual(p.target(100, 80, 10, 4), 20)
+        self.assertEqual(p.target(200, 0, 20, 4), 20)
+        self.assertEqual(p.target(400, 0, 20, 4), 0)
+
+    def testSteps(self):
+        p = self.policy(max_scale_up_step=5, max_scale_down_step=3,
+                        window=1)
+        self.assertEqual(p.target(0, 100, 0, 4), 5)
+        self.assertEqual(p.target(10, 100, 5, 4), 10)
+        self.assertEqual(p.target(20, 0, 10, 4), 7)
+
+    def testLimit(self):
+        p = self.policy(limit=8)
+        self.assertEqual(p.target(0, 100, 0, 4), 8)
+        self.assertTrue(p.limited)
+
+
+class Mig(object):
+    """The part of autoscaler.Mig that spreadQueue uses."""
+
+    def __init__(self, cores_per_node=4, max_size=0, weight=1.0):
+        self.cores_per_node = cores_per_node
+        self.max_size = max_size
+        self.weight = weight
+
+    def capacity(self):
+        if self.max_size <= 0:
+            return float('inf')
+        return self.max_size * self.cores_per_node
+
+    def isFull(self, size):
+        return self.max_size > 0 and size >= self.max_size
+
+
+class SpreadQueueTest(unittest.TestCase):
+
+    def spread(self, queue, migs, limit=0):
+        nodes = policy.spreadQueue(queue, migs, limit)
+        return [nodes[mig] for mig in migs]
+
+    def testInProportionToWeight(self):
+        self.assertEqual(self.spread(64, [Mig(weight=1), Mig(weight=3)]),
+                         [4, 12])
+        self.assertEqual(self.spread(0, [Mig(), Mig()]), [0, 0])
+
+    def testWholeNodesByLargestRemainder(self):
+        # Half a node for each MIG is two nodes, not three
+        self.assertEqual(self.spread(6, [Mig(), Mig(), Mig()]), [1, 1, 0])
+
+    def testSaturatedMaxSize(self):
+        self.assertEqual(self.spread(40, [Mig(max_size=2), Mig()]), [2, 8])
+        self.assertEqual(self.spread(1000, [Mig(max_size=2), Mig(max_size=3)]),
+                         [2, 3])
+
+    def testGlobalLimit(self):
+        self.assertEqual(self.spread(80, [Mig(), Mig()], limit=5), [3, 2])
+        # Every MIG gets the same fraction of the nodes it wants: a quarter
+        self.assertEqual(self.spread(80, [Mig(max_size=1), Mig()], limit=5),
+                         [0, 5])
+        self.assertEqual(self.spread(8, [Mig(), Mig()], limit=5), [1, 1])
+
+    def testMixedCoreCounts(self):
+        self.assertEqual(self.spread(20, [Mig(cores_per_node=2),
+                                          Mig(cores_per_node=8)]), [5, 2])
+
+    def testWeightZero(self):
+        self.assertEqual(self.spread(40, [Mig(weight=0), Mig()]), [0, 10])
+        with self.assertRaises(ValueError):
+            policy.spreadQueue(40, [Mig(weight=0), Mig(weight=0)])
+
+
+class LimitTotalSizeTest(unittest.TestCase):
+
+    def testTakesFromTheMigsFurthestAboveTheirNodes(self):
+        a, b = Mig(), Mig()
+        sizes = policy.limitTotalSize({a: 5, b: 4}, {a: 3, b: 3}, 6)
+        self.assertEqual((sizes[a], sizes[b]), (3, 3))
+
+    def testNoLimit(self):
+        a = Mig()
+        self.assertEqual(policy.limitTotalSize({a: 5}, {a: 1}), {a: 5})
+
+
+class PolicyFromArgsTest(unittest.TestCase):
+
+    def testDefaults(self):
+        parser = argparse.ArgumentParser()
+        policy.addPolicyArguments(parser)
+        args = parser.parse_args([])
+        self.assertTrue(isinstance(policy.policyFromArgs(args),
+                                   policy.ProportionalPolicy))
+        args = parser.parse_args(['--policy', 'predictive', '--window', '60'])
+        p = policy.policyFromArgs(args, 10)
+        self.assertTrue(isinstance(p, policy.PredictivePolicy))
+        self.assertEqual((p.limit, p.window), (10, 60))
+
+
+if __name__ == '__main__':
+    unittest.main()
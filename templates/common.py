@@ -13,6 +13,7 @@
 # limitations under the License.
 """Generic simple functions used for python based templage generation."""
 
+import collections
 import re
 import sys
 import traceback
@@ -21,6 +22,24 @@ import default
 import yaml
 
 RFC1035_RE = re.compile(r'^[a-z][-a-z0-9]{1,61}[a-z0-9]{1}$')
+ZONE_RE = re.compile(r'(\w+)-(\w+)(\d)-(\w)')
+
+# Maximum number of names kept by each of the NAMES caches.
+NAME_CACHE_SIZE = 4096
+
+# Maximum number of distinct compute links kept by LINKS.
+LINK_CACHE_SIZE = 1024
+
+# LibYAML based dumper when PyYAML was built with it. It uses the full
+# representer of yaml.dump, but its emitter only writes the same text as the
+# pure python one when every string is printable ASCII: it does not fold long
+# double-quoted scalars, for one. See GetDumper().
+C_DUMPER = getattr(yaml, 'CDumper', None)
+NOT_PRINTABLE_ASCII_RE = re.compile(r'[^\x20-\x7e]')
+try:
+  NUMBER_TYPES = (int, long, float)  # pylint: disable=undefined-variable
+except NameError:
+  NUMBER_TYPES = (int, float)
 
 
 class Error(Exception):
@@ -28,6 +47,121 @@ class Error(Exception):
   pass
 
 
+class LinkCache(object):
+  """Bounded LRU cache of compute links.
+
+  Identical links are built for every VM, disk and local SSD of an expansion.
+  The cache returns the same string object for each of them instead of
+  building a new one, and counts hits and misses to show whether it helps.
+  """
+
+  def __init__(self, max_size=LINK_CACHE_SIZE):
+    self.max_size = max_size
+    self.links = collections.OrderedDict()
+    self.hits = 0
+    self.misses = 0
+
+  def Intern(self, parts):
+    """Returns the link for a tuple of path parts under COMPUTE_URL_BASE."""
+    link = self.links.pop(parts, None)
+    if link is None:
+      self.misses += 1
+      link = default.COMPUTE_URL_BASE + ''.join(parts)
+      if len(self.links) >= self.max_size:
+        self.links.popitem(last=False)
+    else:
+      self.hits += 1
+    self.links[parts] = link
+    return link
+
+  def Clear(self):
+    self.links.clear()
+    self.hits = 0
+    self.misses = 0
+
+  def Stats(self):
+    return {'hits': self.hits, 'misses': self.misses, 'size': len(self.links)}
+
+
+LINKS = LinkCache()
+
+
+class NameService(object):
+  """Memoizes auto-generated names, references and short zone names.
+
+  Templates build names for the same (base, resource, zone) combinations
+  many times per expansion. Only valid names are cached, so invalid ones keep
+  raising Error. Each cache is emptied once it holds max_size entries.
+  """
+
+  def __init__(self, max_size=NAME_CACHE_SIZE):
+    self.max_size = max_size
+    self.names = {}
+    self.refs = {}
+    self.zones = {}
+
+  def _Store(self, cache, key, value):
+    if len(cache) >= self.max_size:
+      cache.clear()
+    cache[key] = value
+
+  def AutoName(self, base, resource, *args):
+    key = (base, resource) + args
+    auto_name = self.names.get(key, None)
+    if auto_name is None:
+      auto_name = '%s-%s' % (base, '-'.join(list(args) +
+                                            [default.AKA[resource]]))
+      if not RFC1035_RE.match(auto_name):
+        raise Error('"%s" name for type %s does not match RFC1035 regex (%s)' %
+                    (auto_name, resource, RFC1035_RE.pattern))
+      self._Store(self.names, key, auto_name)
+    return auto_name
+
+  def AutoNames(self, name_args):
+    """Builds and validates a list of names in one pass.
+
+    Args:
+      name_args: list of (base, resource, *args) tuples, as passed to AutoName.
+
+    Returns:
+      The list of names, in order.
+
+    Raises:
+      Error: listing every invalid name, not only the first.
+    """
+    names = []
+    errors = []
+    for args in name_args:
+      try:
+        names.append(self.AutoName(*args))
+      except Error as e:
+        errors.append(str(e))
+    if errors:
+      raise Error('\n'.join(errors))
+    return names
+
+  def AutoRef(self, base, resource, *args):
+    key = (base, resource) + args
+    ref = self.refs.get(key, None)
+    if ref is None:
+      ref = Ref(self.AutoName(base, resource, *args))
+      self._Store(self.refs, key, ref)
+    return ref
+
+  def ShortenZoneName(self, zone):
+    short_name = self.zones.get(zone, None)
+    if short_name is None:
+      geo, coord, number, letter = ZONE_RE.findall(zone)[0]
+      geo = geo.lower() if len(geo) == 2 else default.LOC[geo.lower()]
+      coord = default.LOC[coord.lower()]
+      short_name = geo + '-' + coord + str(number) + letter.lower()
+      self._Store(self.zones, zone, short_name)
+    return short_name
+
+
+NAMES = NameService()
+
+
 def AddDiskResourcesIfNeeded(context):
   """Checks context if disk resources need to be added."""
   if default.DISK_RESOURCES in context.properties:
@@ -38,16 +172,17 @@ def AddDiskResourcesIfNeeded(context):
 
 def AutoName(base, resource, *args):
   """Helper method to generate names automatically based on default."""
-  auto_name = '%s-%s' % (base, '-'.join(list(args) + [default.AKA[resource]]))
-  if not RFC1035_RE.match(auto_name):
-    raise Error('"%s" name for type %s does not match RFC1035 regex (%s)' %
-                (auto_name, resource, RFC1035_RE.pattern))
-  return auto_name
+  return NAMES.AutoName(base, resource, *args)
+
+
+def AutoNames(name_args):
+  """Generates a list of names, reporting all invalid ones together."""
+  return NAMES.AutoNames(name_args)
 
 
 def AutoRef(base, resource, *args):
   """Helper method that builds a reference for an auto-named resource."""
-  return Ref(AutoName(base, resource, *args))
+  return NAMES.AutoRef(base, resource, *args)
 
 
 def OrderedItems(dict_obj):
@@ -60,12 +195,7 @@ def OrderedItems(dict_obj):
 
 def ShortenZoneName(zone):
   """Given a string that looks like a zone name, creates a shorter version."""
-  geo, coord, number, letter = re.findall(r'(\w+)-(\w+)(\d)-(\w)', zone)[0]
-  geo = geo.lower() if len(geo) == 2 else default.LOC[geo.lower()]
-  coord = default.LOC[coord.lower()]
-  number = str(number)
-  letter = letter.lower()
-  return geo + '-' + coord + number + letter
+  return NAMES.ShortenZoneName(zone)
 
 
 def ZoneToRegion(zone):
@@ -93,13 +223,12 @@ def RefGroup(name):
 
 
 def GlobalComputeLink(project, collection, name):
-  return ''.join([default.COMPUTE_URL_BASE, 'projects/', project, '/global/',
-                  collection, '/', name])
+  return LINKS.Intern(('projects/', project, '/global/', collection, '/', name))
 
 
 def LocalComputeLink(project, zone, key, value):
-  return ''.join([default.COMPUTE_URL_BASE, 'projects/', project, '/zones/',
-                  zone, '/', key, '/', value])
+  return LINKS.Intern(('projects/', project, '/zones/', zone, '/', key, '/',
+                       value))
 
 
 def ReadContext(context, prop_key):
@@ -126,15 +255,14 @@ def MakeGlobalComputeLink(context, key):
 def MakeSubnetworkComputeLink(context, key):
   project, zone, value = ReadContext(context, key)
   region = ZoneToRegion(zone)
-  return ''.join([default.COMPUTE_URL_BASE, 'projects/', project, '/regions/',
-                  region, '/subnetworks/', value])
+  return LINKS.Intern(('projects/', project, '/regions/', region,
+                       '/subnetworks/', value))
 
 
 def MakeAcceleratorTypeLink(context, accelerator_type):
   project = context.env['project']
   zone = context.properties.get('zone', None)
-  return ''.join([default.COMPUTE_URL_BASE, 'projects/', project, '/zones/',
-                  zone, '/acceleratorTypes/', accelerator_type])
+  return LocalComputeLink(project, zone, 'acceleratorTypes', accelerator_type)
 
 
 def MakeFQHN(context, name):
@@ -180,10 +308,101 @@ def ListPropertyValuesOfType(res_dict, prop, res_type):
 
 def MakeResource(resource_list, output_list=None):
   """Wrapper for a DM template basic spec."""
-  content = {'resources': resource_list}
+  return ''.join(GenerateResourceYaml(resource_list, output_list))
+
+
+def WriteResources(stream, resource_list, output_list=None):
+  """Writes a DM template spec to a file-like stream, one resource at a time."""
+  for chunk in GenerateResourceYaml(resource_list, output_list):
+    stream.write(chunk)
+
+
+def GenerateResourceYaml(resource_list, output_list=None):
+  """Yields the YAML of a DM template spec, one list item at a time.
+
+  The concatenated output is the same as yaml.dump({'resources': ...,
+  'outputs': ...}). yaml.dump turns objects referenced more than once into
+  anchors and aliases numbered across the whole document, so a spec with
+  such objects is dumped in one piece instead.
+
+  Args:
+    resource_list: list or iterable of resource dictionaries.
+    output_list: optional list of output dictionaries.
+
+  Yields:
+    YAML strings.
+  """
+  resource_list = list(resource_list)
+  if HasSharedObjects([resource_list, output_list]):
+    content = {'resources': resource_list}
+    if output_list:
+      content['outputs'] = output_list
+    yield yaml.dump(content, Dumper=GetDumper(content))
+    return
+
+  # Keys come out sorted, as yaml.dump sorts them.
   if output_list:
-    content['outputs'] = output_list
-  return yaml.dump(content)
+    yield 'outputs:\n'
+    for output in output_list:
+      yield DumpListItem(output)
+  resources = iter(resource_list)
+  for resource in resources:
+    yield 'resources:\n'
+    yield DumpListItem(resource)
+    break
+  else:
+    yield 'resources: []\n'
+  for resource in resources:
+    yield DumpListItem(resource)
+
+
+def DumpListItem(item):
+  """Dumps one item as a block sequence entry."""
+  return yaml.dump([item], Dumper=GetDumper(item))
+
+
+def GetDumper(value):
+  """Returns the fastest dumper that writes value as yaml.dump would.
+
+  That is the LibYAML based dumper if value only holds dicts, lists, tuples,
+  numbers, booleans, None and printable ASCII str, and yaml.Dumper otherwise.
+  """
+  if C_DUMPER is None:
+    return yaml.Dumper
+  stack = [value]
+  while stack:
+    value = stack.pop()
+    if isinstance(value, dict):
+      stack.extend(value.keys())
+      stack.extend(value.values())
+    elif isinstance(value, (list, tuple)):
+      stack.extend(value)
+    elif type(value) is str:  # pylint: disable=unidiomatic-typecheck
+      if NOT_PRINTABLE_ASCII_RE.search(value):
+        return yaml.Dumper
+    elif value is not None and not isinstance(value, NUMBER_TYPES):
+      return yaml.Dumper
+  return C_DUMPER
+
+
+def HasSharedObjects(value):
+  """Returns whether yaml.dump would write an alias for part of value."""
+  seen = set()
+  stack = [value]
+  while stack:
+    value = stack.pop()
+    if isinstance(value, dict):
+      children = value.values()
+    elif isinstance(value, (list, tuple)):
+      children = value
+    else:
+      continue
+    if value or not isinstance(value, tuple):
+      if id(value) in seen:
+        return True
+      seen.add(id(value))
+    stack.extend(children)
+  return False
 
 
 def TakeZoneOut(properties):
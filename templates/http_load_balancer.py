@@ -78,7 +78,7 @@ def GenerateNGlobalForwardingRules(context):
   n_of_ips = prop[N_OF_IPS]
 
   return [GenerateGlobalForwardingRule(context, idx)
-          for idx in xrange(0, n_of_ips)]
+          for idx in range(0, n_of_ips)]
 
 
 def GenerateFirewall(context):
@@ -70,10 +70,11 @@ def GenerateBackends(context):
   name = context.env['name']
   prop = context.properties
   replicas = prop[REPLICAS]
+  ig_names = common.AutoNames(
+      [(name, default.IGM, common.ShortenZoneName(zone_dict[default.ZONE]))
+       for zone_dict in replicas])
   backends = []
-  for zone_dict in replicas:
-    short_abbrv = common.ShortenZoneName(zone_dict[default.ZONE])
-    ig_name = common.AutoName(name, default.IGM, short_abbrv)
+  for zone_dict, ig_name in zip(replicas, ig_names):
     zone_dict[GEN_NAME] = ig_name
     backend = {'name': ig_name, 'group': common.RefGroup(ig_name)}
     backends.append(backend)
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for common.py. Run with: python tests/common_test.py
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import common  # pylint: disable=g-import-not-at-top
+import default  # pylint: disable=g-import-not-at-top
+import yaml  # pylint: disable=g-import-not-at-top
+
+STARTUP_SCRIPT = ('#!/bin/bash\n\techo "hello $USER" > /tmp/out\n' +
+                  'x' * 90 + " 'q'\n")
+
+# yaml.dump of a VM running STARTUP_SCRIPT. The long double-quoted scalar is
+# folded with an escaped line break, which the LibYAML emitter does not do.
+STARTUP_SCRIPT_YAML = (
+    'resources:\n'
+    '- name: vm\n'
+    '  properties:\n'
+    '    metadata:\n'
+    '      items:\n'
+    '      - key: startup-script\n'
+    '        value: "#!/bin/bash\\n\\techo \\"hello $USER\\" > /tmp/out\\n' +
+    'x' * 90 + '\\\n'
+    "          \\ 'q'\\n\"\n"
+    '  type: compute.v1.instance\n')
+
+
+def Vm(name, script=None, zone='us-central1-f'):
+  resource = {
+      'name': name,
+      'type': 'compute.v1.instance',
+      'properties': {
+          'zone': zone,
+          'disks': [{'boot': True, 'sizeGb': 10}],
+          'tags': ('http', 'https'),
+      },
+  }
+  if script is not None:
+    resource['properties'] = {'metadata': {'items': [
+        {'key': 'startup-script', 'value': script}]}}
+  return resource
+
+
+class MakeResourceTest(unittest.TestCase):
+
+  def assertSameAsYamlDump(self, resources, outputs=None):
+    content = {'resources': resources}
+    if outputs:
+      content['outputs'] = outputs
+    self.assertEqual(common.MakeResource(resources, outputs),
+                     yaml.dump(content))
+
+  def testStartupScriptWithEscapes(self):
+    self.assertEqual(common.MakeResource([Vm('vm', STARTUP_SCRIPT)]),
+                     STARTUP_SCRIPT_YAML)
+
+  def testSameAsYamlDump(self):
+    self.assertSameAsYamlDump([])
+    self.assertSameAsYamlDump([Vm('a'), Vm('b', STARTUP_SCRIPT)],
+                              [{'name': 'ip', 'value': '$(ref.a.networkIP)'}])
+    self.assertSameAsYamlDump([Vm('a', u'caf\u00e9\n'), Vm('b', 'a\x01b')])
+
+  def testSharedObjects(self):
+    shared = {'items': [{'key': 'k', 'value': 'v'}]}
+    resources = [Vm('a'), Vm('b')]
+    resources[0]['properties']['metadata'] = shared
+    resources[1]['properties']['metadata'] = shared
+    self.assertSameAsYamlDump(resources)
+
+
+class GetDumperTest(unittest.TestCase):
+
+  def testPrintableAsciiUsesFastestDumper(self):
+    fastest = getattr(yaml, 'CDumper', yaml.Dumper)
+    self.assertIs(common.GetDumper(Vm('a')), fastest)
+    self.assertIs(common.GetDumper({'a': [1, 2.5, None, ('b', False)]}),
+                  fastest)
+
+  def testOtherValuesUsePurePython(self):
+    for value in ['a\tb', 'a\nb', 'caf\xc3\xa9', u'caf\u00e9', object(),
+                  {'a\n': 'b'}, [{'a': ['b\r']}]]:
+      self.assertIs(common.GetDumper(value), yaml.Dumper)
+
+
+class LinkCacheTest(unittest.TestCase):
+
+  def testEvictsLeastRecentlyUsedLink(self):
+    links = common.LinkCache(max_size=2)
+    a = links.Intern(('projects/p', '/zones/', 'a'))
+    links.Intern(('projects/p', '/zones/', 'b'))
+    # a is used again, so b is the least recently used when c comes in
+    self.assertIs(links.Intern(('projects/p', '/zones/', 'a')), a)
+    links.Intern(('projects/p', '/zones/', 'c'))
+    self.assertEqual(list(links.links), [('projects/p', '/zones/', 'a'),
+                                         ('projects/p', '/zones/', 'c')])
+    self.assertEqual(links.Stats(), {'hits': 1, 'misses': 3, 'size': 2})
+
+    b = links.Intern(('projects/p', '/zones/', 'b'))
+    self.assertEqual(b, default.COMPUTE_URL_BASE + 'projects/p/zones/b')
+    self.assertNotIn(('projects/p', '/zones/', 'a'), links.links)
+    self.assertEqual(links.Stats(), {'hits': 1, 'misses': 4, 'size': 2})
+
+  def testClear(self):
+    links = common.LinkCache()
+    links.Intern(('projects/p',))
+    links.Intern(('projects/p',))
+    links.Clear()
+    self.assertEqual(links.Stats(), {'hits': 0, 'misses': 0, 'size': 0})
+
+
+class NameServiceTest(unittest.TestCase):
+
+  def testAutoNamesReportsEveryInvalidName(self):
+    names = common.NameService()
+    with self.assertRaises(common.Error) as raised:
+      names.AutoNames([('web', default.IGM, 'us-c1f'),
+                       ('Web', default.IGM, 'us-c1f'),
+                       ('web', default.INSTANCE, 'x' * 60),
+                       ('web', default.INSTANCE, 'us-c1f')])
+    lines = str(raised.exception).split('\n')
+    self.assertEqual(len(lines), 2)
+    self.assertTrue(lines[0].startswith('"Web-us-c1f-igm" name for type %s'
+                                        % default.IGM))
+    self.assertTrue(lines[1].startswith('"web-%s-vm" name' % ('x' * 60)))
+    # Invalid names are not cached, valid ones are
+    self.assertEqual(sorted(names.names.values()),
+                     ['web-us-c1f-igm', 'web-us-c1f-vm'])
+
+  def testAutoNamesHitsTheCache(self):
+    names = common.NameService()
+    name_args = [('web', default.IGM, names.ShortenZoneName(zone))
+                 for zone in ['us-central1-f', 'europe-west1-b']]
+    self.assertEqual(names.AutoNames(name_args),
+                     ['web-us-c1f-igm', 'web-eu-w1b-igm'])
+    cached = names.names[name_args[0]]
+    self.assertIs(names.AutoNames(name_args)[0], cached)
+    self.assertIs(names.AutoName(*name_args[0]), cached)
+    self.assertEqual(len(names.names), 2)
+    self.assertEqual(names.AutoRef(*name_args[1]),
+                     '$(ref.web-eu-w1b-igm.selfLink)')
+
+  def testCachesAreEmptiedWhenFull(self):
+    names = common.NameService(max_size=2)
+    names.AutoNames([('vm-%d' % i, default.INSTANCE) for i in range(3)])
+    self.assertEqual(names.names, {('vm-2', default.INSTANCE): 'vm-2-vm'})
+
+
+if __name__ == '__main__':
+  unittest.main()
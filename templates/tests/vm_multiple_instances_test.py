@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for vm_multiple_instances.py.
+
+Run with: python tests/vm_multiple_instances_test.py
+"""
+
+import copy
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import vm_multiple_instances  # pylint: disable=g-import-not-at-top
+
+
+class Context(object):
+
+  def __init__(self, properties):
+    self.env = {'name': 'vms', 'project': 'my-project', 'deployment': 'dep'}
+    self.properties = properties
+    self.imports = {}
+
+
+def Properties():
+  return {
+      'numberOfVMReplicas': 3,
+      'zone': 'us-central1-f',
+      'sourceImage': 'projects/debian-cloud/global/images/debian-9',
+      'serviceRegistryEndpointName': 'endpoint',
+      'disks': [
+          {'deviceName': 'data', 'diskSizeGb': 10},
+          {'deviceName': 'scratch', 'type': 'SCRATCH'},
+      ],
+      'metadata': {'items': [{'key': 'startup-script', 'value': 'echo hi'}]},
+      'tags': {'items': ['http']},
+      'guestAccelerators': [{'acceleratorType': 'nvidia-tesla-k80',
+                             'acceleratorCount': 1}],
+      'unused': {'large': ['shared'] * 10},
+  }
+
+
+class DeepCopyContext(object):
+  """The per copy context used before ReplicaContext, for comparison."""
+
+  def __init__(self, context):
+    self.env = copy.deepcopy(context.env)
+    self.properties = copy.deepcopy(context.properties)
+    self.imports = copy.deepcopy(context.imports)
+
+
+class GenerateConfigTest(unittest.TestCase):
+
+  def testSameAsDeepCopies(self):
+    context = Context(Properties())
+    config = vm_multiple_instances.GenerateConfig(context)
+    replica_context = vm_multiple_instances.ReplicaContext
+    vm_multiple_instances.ReplicaContext = DeepCopyContext
+    try:
+      expected = vm_multiple_instances.GenerateConfig(Context(Properties()))
+    finally:
+      vm_multiple_instances.ReplicaContext = replica_context
+    self.assertEqual(config, expected)
+    self.assertNotIn('&id', config)
+    self.assertIn('vms-3-data', config)
+
+  def testLeavesBasePropertiesAlone(self):
+    context = Context(Properties())
+    vm_multiple_instances.GenerateConfig(context)
+    # Only the disks to create are added, by AddDisksToContext.
+    disk_resources = context.properties.pop('addedDiskResources')
+    self.assertEqual([d['name'] for d in disk_resources],
+                     ['vms-1-data', 'vms-2-data', 'vms-3-data'])
+    self.assertEqual(context.properties, Properties())
+
+  def testSharesOtherProperties(self):
+    context = Context(Properties())
+    replica = vm_multiple_instances.ReplicaContext(context)
+    self.assertIs(replica.properties['unused'], context.properties['unused'])
+    for name in ['disks', 'metadata', 'tags', 'guestAccelerators']:
+      self.assertIsNot(replica.properties[name], context.properties[name])
+    self.assertIsNot(replica.properties['disks'][0],
+                     context.properties['disks'][0])
+    self.assertIsNot(replica.properties['metadata']['items'],
+                     context.properties['metadata']['items'])
+
+
+if __name__ == '__main__':
+  unittest.main()
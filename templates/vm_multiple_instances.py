@@ -12,7 +12,6 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 """Creates an multiple compies of a VM based on spec."""
-import copy
 import common
 import default
 import vm_instance
@@ -22,6 +21,45 @@ VM_COPIES = default.VM_COPIES
 ENDPOINT_NAME = default.ENDPOINT_NAME
 
 
+# Properties that every copy gets its own copy of: vm_instance edits them in
+# place, or puts them in the VM resource, where an object shared by several
+# VMs would be dumped as a YAML alias.
+REPLICA_PROPERTIES = [
+    default.DISK_RESOURCES,
+    default.DISKS,
+    default.GUEST_ACCELERATORS,
+    default.METADATA,
+    default.SERVICE_ACCOUNTS,
+    default.TAGS,
+]
+
+
+class ReplicaContext(object):
+  """Context for one copy of the VM.
+
+  The base context is never modified. The properties dict and env are flat
+  copies, the REPLICA_PROPERTIES are copied down to their leaves and every
+  other property is shared with the base context, read-only, like imports.
+  """
+
+  def __init__(self, context):
+    self.env = dict(context.env)
+    self.properties = dict(context.properties)
+    for name in REPLICA_PROPERTIES:
+      if name in self.properties:
+        self.properties[name] = CopyContainers(self.properties[name])
+    self.imports = context.imports
+
+
+def CopyContainers(value):
+  """Copies nested lists and dicts; other values are returned as is."""
+  if isinstance(value, dict):
+    return dict((k, CopyContainers(v)) for k, v in value.items())
+  if isinstance(value, list):
+    return [CopyContainers(v) for v in value]
+  return value
+
+
 # The optional and mandatory fields are the same as a vm_instance
 def GenerateMultipleComputeVMs(context):
   """Generates multiple VMs that are copies of a single VM spec."""
@@ -34,7 +72,7 @@ def GenerateMultipleComputeVMs(context):
   resources = []
   new_disks = []
   for idx in range(1, n_of_copies + 1):
-    ctx = copy.deepcopy(context)
+    ctx = ReplicaContext(context)
     idx_prop = ctx.properties
     ctx.env[default.NAME] += AddIdx(idx)
     # Do something with the instance name and with the disk names
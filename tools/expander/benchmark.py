@@ -0,0 +1,223 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Times local expansion of the repository templates.
+
+Every case is timed per template and, for the scaling cases, per resource
+count. Results can be saved as JSON and compared against a saved baseline, in
+which case the exit status is non-zero if any case got slower than the
+allowed threshold.
+"""
+
+from __future__ import print_function
+import argparse
+import json
+import os
+import sys
+import timeit
+
+import expander
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+TEMPLATES_DIR = os.path.join(REPO_ROOT, 'templates')
+
+DEFAULT_COUNTS = [1, 10, 100]
+
+VM_PROPERTIES = {
+    'sourceImage': 'debian-9',
+    'zone': 'us-central1-f',
+    'metadata': {'items': []},
+    'disks': [{'deviceName': 'data', 'diskSizeGb': 100}],
+    'localSSDs': 2,
+}
+
+
+def replicas(count):
+  zones = ['us-central1-a', 'us-central1-b', 'us-central1-c', 'us-central1-f',
+           'us-east1-b', 'us-east1-c', 'us-east1-d', 'europe-west1-b']
+  return [{'name': 'replica-%d' % i, 'zone': zones[i % len(zones)]}
+          for i in range(count)]
+
+
+def template_case(template, properties):
+  """Returns a case that expands one resource of a templates/ template."""
+
+  def build():
+    # Not every template has a schema listing its imports, so import the
+    # whole directory the way a config using these templates would.
+    exp = expander.Expander()
+    for name in sorted(os.listdir(TEMPLATES_DIR)):
+      if name.endswith('.py'):
+        exp.add_import(os.path.join(TEMPLATES_DIR, name), name)
+    config = {'resources': [{
+        'name': 'bench',
+        'type': template,
+        'properties': properties,
+    }]}
+    return exp, config
+
+  return build
+
+
+def config_case(path):
+  """Returns a case that expands a config file from the repository."""
+
+  def build():
+    exp = expander.Expander()
+    return exp, expander.load_config(os.path.join(REPO_ROOT, path), exp)
+
+  return build
+
+
+def get_cases(counts):
+  """Returns (name, build function) pairs for all benchmark cases."""
+  cases = [
+      ('vm_instance', template_case('vm_instance.py', VM_PROPERTIES)),
+      ('vm_instance_template',
+       template_case('vm_instance_template.py', VM_PROPERTIES)),
+      ('autoscaled_group', template_case('autoscaled_group.py', {
+          'instanceTemplate': 'bench-it',
+          'replicas': replicas(2),
+      })),
+      ('replicated_service', template_case('replicated_service.py', {
+          'instanceTemplate': 'bench-it',
+          'replicas': replicas(2),
+      })),
+      ('http_load_balancer', template_case('http_load_balancer.py', {
+          'defaultService': '$(ref.bench-bes.selfLink)',
+          'hostRules': [{'hosts': ['*'], 'pathMatcher': 'all'}],
+          'pathMatchers': [{'name': 'all',
+                            'defaultService': '$(ref.bench-bes.selfLink)'}],
+          'port': 80,
+      })),
+      ('examples/ha-service',
+       config_case('examples/v2/ha-service/python/example.yaml')),
+      ('examples/template_modules',
+       config_case('examples/v2/template_modules/python/'
+                   'use-python-template-with-modules.yaml')),
+      ('examples/step6_use_multiple_templates',
+       config_case('examples/v2/step_by_step_guide/'
+                   'step6_use_multiple_templates/python/'
+                   'config-with-many-templates.yaml')),
+  ]
+  for count in counts:
+    properties = dict(VM_PROPERTIES, numberOfVMReplicas=count)
+    cases.append(('vm_multiple_instances[%d]' % count,
+                  template_case('vm_multiple_instances.py', properties)))
+  for count in counts:
+    cases.append(('replicated_service[%d]' % count,
+                  template_case('replicated_service.py', {
+                      'instanceTemplate': 'bench-it',
+                      'replicas': replicas(count),
+                  })))
+  return cases
+
+
+def run_case(build, repeat, number):
+  """Returns (seconds per expansion, resource count) for one case."""
+  exp, config = build()
+  # The first expansion loads and caches the template modules.
+  resources = exp.expand_config(config)['resources']
+  timer = timeit.Timer(lambda: exp.expand_config(config))
+  best = min(timer.repeat(repeat=repeat, number=number)) / number
+  return best, len(resources)
+
+
+def link_stats(build):
+  """Returns common.LINKS stats for one expansion with an empty cache."""
+  exp, config = build()
+  exp.expand_config(config)
+  common = exp.modules.get('common', None)
+  if common is None or not hasattr(common, 'LINKS'):
+    return None
+  common.LINKS.Clear()
+  exp.expand_config(config)
+  return common.LINKS.Stats()
+
+
+def compare(results, baseline, threshold):
+  """Returns the names of cases slower than threshold times the baseline."""
+  regressions = []
+  for name, result in sorted(results.items()):
+    if name in baseline and (result['seconds'] >
+                             baseline[name]['seconds'] * threshold):
+      regressions.append(name)
+  return regressions
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description='Benchmarks local template expansion.')
+  parser.add_argument('--filter', default='',
+                      help='Only run cases whose name contains this string.')
+  parser.add_argument('--counts', default=','.join(map(str, DEFAULT_COUNTS)),
+                      help='Comma separated resource counts for the scaling '
+                      'cases.')
+  parser.add_argument('--repeat', type=int, default=3,
+                      help='Number of timing runs; the fastest is reported.')
+  parser.add_argument('--number', type=int, default=10,
+                      help='Expansions per timing run.')
+  parser.add_argument('--link-stats', action='store_true',
+                      help='Report compute link cache hits and misses for '
+                      'one expansion of each case.')
+  parser.add_argument('--save', help='Write results as JSON to this file.')
+  parser.add_argument('--baseline', help='Compare with results saved earlier.')
+  parser.add_argument('--threshold', type=float, default=1.25,
+                      help='Slowdown ratio against the baseline that counts '
+                      'as a regression.')
+  args = parser.parse_args(argv[1:])
+
+  counts = [int(c) for c in args.counts.split(',') if c]
+  results = {}
+  failed = False
+  print('%-40s %12s %10s %14s' % ('case', 'ms/expand', 'resources',
+                                  'us/resource'))
+  for name, build in get_cases(counts):
+    if args.filter not in name:
+      continue
+    try:
+      seconds, resources = run_case(build, args.repeat, args.number)
+    except Exception as e:  # pylint: disable=broad-except
+      print('%-40s failed: %s' % (name, e))
+      failed = True
+      continue
+    results[name] = {'seconds': seconds, 'resources': resources}
+    print('%-40s %12.3f %10d %14.1f' % (name, seconds * 1e3, resources,
+                                        seconds * 1e6 / max(resources, 1)))
+    stats = link_stats(build) if args.link_stats else None
+    if stats:
+      print('%-40s links: %d hits, %d misses' % ('', stats['hits'],
+                                                  stats['misses']))
+
+  if args.save:
+    with open(args.save, 'w') as f:
+      json.dump(results, f, indent=2, sort_keys=True)
+
+  if args.baseline:
+    with open(args.baseline) as f:
+      baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold)
+    for name in regressions:
+      print('REGRESSION: %s %.3fms -> %.3fms' % (
+          name, baseline[name]['seconds'] * 1e3,
+          results[name]['seconds'] * 1e3), file=sys.stderr)
+    failed = failed or bool(regressions)
+
+  sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+  main(sys.argv)
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Builds the dependency graph of an expanded config and plans its waves.
+
+A resource depends on every resource it references with $(ref.NAME.field)
+and on every resource listed in its metadata.dependsOn. Resources with no
+pending dependencies can be created in parallel, so the plan is a list of
+waves: each wave holds the resources whose dependencies are all in earlier
+waves. The number of waves is the length of the critical path.
+"""
+
+from __future__ import print_function
+import argparse
+import collections
+import re
+import sys
+import yaml
+
+import expander
+
+REF_RE = re.compile(r'\$\(ref\.([^.()]+)\.')
+
+
+class Graph(object):
+  """Dependency graph of the resources of an expanded config.
+
+  Attributes:
+    resources: resources by name, in config order.
+    deps: for each resource name, the set of resource names it depends on.
+    dangling: for each resource name with references to names that are not
+      in the config, the sorted list of those names.
+  """
+
+  def __init__(self, resources):
+    self.resources = collections.OrderedDict()
+    for resource in resources:
+      self.resources[resource['name']] = resource
+    self.deps = {}
+    self.dangling = {}
+    for name, resource in self.resources.items():
+      targets = find_refs(resource.get('properties', None))
+      metadata = resource.get('metadata', None) or {}
+      targets.update(metadata.get('dependsOn', None) or [])
+      self.deps[name] = set(t for t in targets if t in self.resources)
+      missing = sorted(t for t in targets if t not in self.resources)
+      if missing:
+        self.dangling[name] = missing
+
+  def dependents(self):
+    """Returns, for each resource name, the names that depend on it."""
+    result = dict((name, []) for name in self.resources)
+    for name in self.resources:
+      for dep in self.deps[name]:
+        result[dep].append(name)
+    return result
+
+
+def find_refs(value):
+  """Returns the set of resource names referenced anywhere in value."""
+  refs = set()
+  stack = [value]
+  while stack:
+    value = stack.pop()
+    if isinstance(value, dict):
+      stack.extend(value.values())
+    elif isinstance(value, list):
+      stack.extend(value)
+    elif isinstance(value, expander.STRING_TYPES) and '$(ref.' in value:
+      refs.update(REF_RE.findall(value))
+  return refs
+
+
+class Plan(object):
+  """Result of planning a Graph.
+
+  Attributes:
+    waves: lists of resource names, in config order within each wave.
+    critical_path: one longest chain of dependent resources.
+    cycles: lists of resource names that depend on each other.
+    blocked: names that are not in a cycle but depend on one.
+  """
+
+  def __init__(self, waves, critical_path, cycles, blocked):
+    self.waves = waves
+    self.critical_path = critical_path
+    self.cycles = cycles
+    self.blocked = blocked
+
+
+def plan(graph):
+  """Splits a Graph into waves of resources that can be created together."""
+  dependents = graph.dependents()
+  pending = dict((name, len(deps)) for name, deps in graph.deps.items())
+  order = dict((name, i) for i, name in enumerate(graph.resources))
+  # For each planned resource, the dependency on its longest chain.
+  previous = {}
+
+  waves = []
+  wave = [name for name in graph.resources if not pending[name]]
+  while wave:
+    waves.append(wave)
+    next_wave = []
+    for name in wave:
+      for dependent in dependents[name]:
+        previous[dependent] = name
+        pending[dependent] -= 1
+        if not pending[dependent]:
+          next_wave.append(dependent)
+    wave = sorted(next_wave, key=order.get)
+
+  critical_path = []
+  if waves:
+    name = waves[-1][0]
+    while name is not None:
+      critical_path.append(name)
+      name = previous.get(name, None)
+    critical_path.reverse()
+
+  unplanned = set(name for name in graph.resources if pending[name])
+  cycles = find_cycles(graph, unplanned)
+  in_cycle = set(name for cycle in cycles for name in cycle)
+  blocked = [name for name in graph.resources
+             if name in unplanned and name not in in_cycle]
+  return Plan(waves, critical_path, cycles, blocked)
+
+
+def find_cycles(graph, names):
+  """Returns the strongly connected components of names that form cycles."""
+  index = {}
+  lowlink = {}
+  stack = []
+  on_stack = set()
+  cycles = []
+  for root in graph.resources:
+    if root not in names or root in index:
+      continue
+    # Iterative Tarjan: each frame is a node and an iterator over its deps.
+    work = [(root, iter(sorted(graph.deps[root] & names)))]
+    index[root] = lowlink[root] = len(index)
+    stack.append(root)
+    on_stack.add(root)
+    while work:
+      node, deps = work[-1]
+      for dep in deps:
+        if dep not in index:
+          index[dep] = lowlink[dep] = len(index)
+          stack.append(dep)
+          on_stack.add(dep)
+          work.append((dep, iter(sorted(graph.deps[dep] & names))))
+          break
+        elif dep in on_stack:
+          lowlink[node] = min(lowlink[node], index[dep])
+      else:
+        work.pop()
+        if work:
+          parent = work[-1][0]
+          lowlink[parent] = min(lowlink[parent], lowlink[node])
+        if lowlink[node] == index[node]:
+          component = []
+          while True:
+            member = stack.pop()
+            on_stack.discard(member)
+            component.append(member)
+            if member == node:
+              break
+          if len(component) > 1 or node in graph.deps[node]:
+            cycles.append(sorted(component))
+  return cycles
+
+
+def print_plan(graph, result, out):
+  print('resources: %d' % len(graph.resources), file=out)
+  print('waves: %d' % len(result.waves), file=out)
+  for i, wave in enumerate(result.waves):
+    print('  %d: %s' % (i + 1, ', '.join(wave)), file=out)
+  print('critical path: %s' % ' -> '.join(result.critical_path), file=out)
+  if graph.dangling:
+    print('dangling references:', file=out)
+    for name in graph.resources:
+      if name in graph.dangling:
+        print('  %s: %s' % (name, ', '.join(graph.dangling[name])), file=out)
+  if result.cycles:
+    print('cycles:', file=out)
+    for cycle in result.cycles:
+      print('  %s' % ', '.join(cycle), file=out)
+  if result.blocked:
+    print('blocked by cycles: %s' % ', '.join(result.blocked), file=out)
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description='Plans the creation waves of a Deployment Manager config.')
+  parser.add_argument('config', help='Path to the config YAML file.')
+  parser.add_argument('--expanded', action='store_true',
+                      help='The config is already expanded; do not run '
+                      'templates.')
+  parser.add_argument('--jobs', type=int, default=1,
+                      help='Number of processes used to expand templates.')
+  args = parser.parse_args(argv[1:])
+
+  if args.expanded:
+    with open(args.config) as f:
+      config = yaml.load(f, Loader=expander.SAFE_LOADER) or {}
+  else:
+    config = expander.expand_file(args.config, jobs=args.jobs)
+
+  graph = Graph(config.get('resources', None) or [])
+  result = plan(graph)
+  print_plan(graph, result, sys.stdout)
+  sys.exit(1 if result.cycles else 0)
+
+
+if __name__ == '__main__':
+  main(sys.argv)
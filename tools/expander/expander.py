@@ -0,0 +1,361 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Expands Deployment Manager configs locally, without a live deployment."""
+
+from __future__ import print_function
+import argparse
+import copy
+import importlib
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import yaml
+
+try:
+  import jinja2  # pylint: disable=g-import-not-at-top
+except ImportError:
+  jinja2 = None
+
+try:
+  STRING_TYPES = basestring  # pylint: disable=invalid-name
+except NameError:
+  STRING_TYPES = str
+
+# LibYAML based loader when PyYAML was built with it, pure python otherwise.
+SAFE_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+TEMPLATE_EXTENSIONS = ('.py', '.jinja')
+
+DEFAULT_PROJECT = 'my-project'
+DEFAULT_PROJECT_NUMBER = '123456789012'
+DEFAULT_DEPLOYMENT = 'my-deployment'
+DEFAULT_USERNAME = 'user@example.com'
+
+
+class Error(Exception):
+  """Raised when a config or template cannot be expanded."""
+  pass
+
+
+class Context(object):
+  """Mirrors the context object Deployment Manager hands to templates."""
+
+  def __init__(self, env, properties, imports):
+    self.env = env
+    self.properties = properties
+    self.imports = imports
+
+
+class _TemplateFinder(object):
+  """Makes imported python files importable by their module name.
+
+  Implements both the legacy (find_module) and the current (find_spec) import
+  protocols so templates can be expanded on either python major version.
+  """
+
+  def __init__(self, expander):
+    self.expander = expander
+
+  def find_module(self, fullname, path=None):
+    return self if fullname in self.expander.py_modules else None
+
+  def load_module(self, fullname):
+    if fullname in sys.modules:
+      return sys.modules[fullname]
+    module = type(sys)(fullname)
+    sys.modules[fullname] = module
+    if self.expander.py_modules[fullname] is None:
+      module.__path__ = []
+    try:
+      self.exec_module(module)
+    except:
+      sys.modules.pop(fullname, None)
+      raise
+    return module
+
+  def find_spec(self, fullname, path=None, target=None):
+    if fullname not in self.expander.py_modules:
+      return None
+    import importlib.util  # pylint: disable=g-import-not-at-top
+    is_package = self.expander.py_modules[fullname] is None
+    return importlib.util.spec_from_loader(fullname, self,
+                                           is_package=is_package)
+
+  def create_module(self, spec):
+    return None
+
+  def exec_module(self, module):
+    import_name = self.expander.py_modules[module.__name__]
+    if import_name is None:
+      return
+    module.__file__ = self.expander.imports[import_name]
+    code = compile(self.expander.contents[import_name], module.__file__, 'exec')
+    exec(code, module.__dict__)  # pylint: disable=exec-used
+
+
+class Expander(object):
+  """Expands configs the way Deployment Manager does.
+
+  Every imported file is registered under its import name. Resources whose
+  type is an imported template are expanded recursively, with a context built
+  from the deployment environment, the resource properties (with schema
+  defaults applied) and the imported file contents, until only base type
+  resources remain.
+  """
+
+  def __init__(self, project=DEFAULT_PROJECT, deployment=DEFAULT_DEPLOYMENT,
+               env=None):
+    self.env = {
+        'deployment': deployment,
+        'project': project,
+        'project_number': DEFAULT_PROJECT_NUMBER,
+        'current_time': int(time.time()),
+        'username': DEFAULT_USERNAME,
+    }
+    self.env.update(env or {})
+    self.imports = {}
+    self.contents = {}
+    self.schemas = {}
+    self.py_modules = {}
+    self.modules = {}
+    self.finder = _TemplateFinder(self)
+
+  def add_imports(self, imports, base_dir):
+    """Registers a config or schema 'imports' list relative to base_dir."""
+    for imp in imports or []:
+      self.add_import(os.path.join(base_dir, imp['path']),
+                      imp.get('name', imp['path']))
+
+  def add_import(self, path, name=None):
+    """Registers an imported file, and the imports listed in its schema.
+
+    Args:
+      path: location of the file on disk.
+      name: the import name resource types refer to. Defaults to path, as it
+        does in Deployment Manager.
+    """
+    name = name or path
+    if name in self.imports:
+      return
+    with open(path) as f:
+      self.contents[name] = f.read()
+    self.imports[name] = path
+    if name.endswith('.py'):
+      # 'helpers/common.py' is importable as helpers.common.
+      parts = name[:-3].split('/')
+      for i in range(1, len(parts)):
+        self.py_modules.setdefault('.'.join(parts[:i]), None)
+      self.py_modules['.'.join(parts)] = name
+
+    schema_path = path + '.schema'
+    if os.path.exists(schema_path):
+      with open(schema_path) as f:
+        schema = yaml.safe_load(f) or {}
+      self.schemas[name] = schema
+      self.add_imports(schema.get('imports', None), os.path.dirname(path))
+
+  def is_template(self, type_name):
+    return (type_name in self.imports and
+            type_name.endswith(TEMPLATE_EXTENSIONS))
+
+  def expand_config(self, config, jobs=1):
+    """Returns the config with every template resource fully expanded.
+
+    Args:
+      config: the config dictionary, with its imports already registered.
+      jobs: number of worker processes. With more than one, template resources
+        are expanded level by level in this process until there are at least
+        as many independent template resources as jobs; those are then
+        expanded on a process pool. The result is the same, in the same
+        order, as a serial expansion.
+
+    Returns:
+      A config dictionary listing only base type resources.
+    """
+    resources = config.get('resources', None) or []
+    if jobs <= 1:
+      return {'resources': self.expand_resources(resources)}
+
+    pending = [r for r in resources if self.is_template(r['type'])]
+    while pending and len(pending) < jobs:
+      next_level = []
+      for resource in resources:
+        if self.is_template(resource['type']):
+          next_level.extend(self.expand_template(resource))
+        else:
+          next_level.append(resource)
+      resources = next_level
+      pending = [r for r in resources if self.is_template(r['type'])]
+    if not pending:
+      return {'resources': resources}
+
+    pool = multiprocessing.Pool(min(jobs, len(pending)), _init_worker,
+                                (self.env, sorted(self.imports.items())))
+    try:
+      results = [pool.apply_async(_expand_in_worker, (r,))
+                 if self.is_template(r['type']) else None
+                 for r in resources]
+      expanded = []
+      for resource, result in zip(resources, results):
+        expanded.extend(result.get() if result else [resource])
+    finally:
+      pool.terminate()
+      pool.join()
+    return {'resources': expanded}
+
+  def expand_resources(self, resources):
+    expanded = []
+    for resource in resources or []:
+      expanded.extend(self.expand_resource(resource))
+    return expanded
+
+  def expand_resource(self, resource):
+    """Returns the flattened list of base resources for one resource."""
+    if not self.is_template(resource['type']):
+      return [resource]
+    return self.expand_resources(self.expand_template(resource))
+
+  def expand_template(self, resource):
+    """Runs one template and returns the resources it generates, unexpanded."""
+    name = resource['name']
+    type_name = resource['type']
+    properties = copy.deepcopy(resource.get('properties', None) or {})
+    schema = self.schemas.get(type_name, {})
+    apply_schema_defaults(schema, properties)
+    for prop in schema.get('required', None) or []:
+      if prop not in properties:
+        raise Error(''.join(['Resource "', name, '" of type ', type_name,
+                             ' is missing required property "', prop, '"']))
+
+    env = dict(self.env, name=name, type=type_name)
+    context = Context(env, properties, self.contents)
+    if type_name.endswith('.py'):
+      result = self._generate_python(type_name, context)
+    else:
+      result = self._generate_jinja(type_name, context)
+
+    if isinstance(result, STRING_TYPES):
+      result = yaml.load(result, Loader=SAFE_LOADER)
+    return (result or {}).get('resources', None) or []
+
+  def _generate_python(self, type_name, context):
+    """Calls GenerateConfig, or generate_config, with the imports installed."""
+    saved = {}
+    for module_name in self.py_modules:
+      saved[module_name] = sys.modules.pop(module_name, None)
+      if module_name in self.modules:
+        sys.modules[module_name] = self.modules[module_name]
+    sys.meta_path.insert(0, self.finder)
+    try:
+      module = importlib.import_module(type_name[:-3].replace('/', '.'))
+      generate = getattr(module, 'GenerateConfig', None)
+      if generate is None:
+        generate = getattr(module, 'generate_config', None)
+      if generate is None:
+        raise Error(type_name + ' defines neither GenerateConfig nor '
+                    'generate_config.')
+      return generate(context)
+    finally:
+      sys.meta_path.remove(self.finder)
+      for module_name, module in saved.items():
+        loaded = sys.modules.pop(module_name, None)
+        if loaded is not None:
+          self.modules[module_name] = loaded
+        if module is not None:
+          sys.modules[module_name] = module
+
+  def _generate_jinja(self, type_name, context):
+    if jinja2 is None:
+      raise Error('Expanding ' + type_name + ' requires the jinja2 package.')
+    environment = jinja2.Environment(loader=jinja2.DictLoader(self.contents))
+    return environment.get_template(type_name).render(
+        env=context.env, properties=context.properties,
+        imports=context.imports)
+
+
+_worker_expander = None
+
+
+def _init_worker(env, imports):
+  """Builds the expander used by one pool process."""
+  global _worker_expander
+  _worker_expander = Expander(env=env)
+  for name, path in imports:
+    _worker_expander.add_import(path, name)
+
+
+def _expand_in_worker(resource):
+  # Template exceptions may not unpickle in the parent process, which does
+  # not have the template modules loaded, so pass them back as an Error.
+  try:
+    return _worker_expander.expand_resource(resource)
+  except Exception:  # pylint: disable=broad-except
+    raise Error(traceback.format_exc())
+
+
+def apply_schema_defaults(schema, value):
+  """Fills in schema defaults for missing properties, recursively."""
+  if isinstance(value, dict):
+    for prop, prop_schema in (schema.get('properties', None) or {}).items():
+      if not isinstance(prop_schema, dict):
+        continue
+      if prop not in value and 'default' in prop_schema:
+        value[prop] = copy.deepcopy(prop_schema['default'])
+      if prop in value:
+        apply_schema_defaults(prop_schema, value[prop])
+  elif isinstance(value, list) and isinstance(schema.get('items', None), dict):
+    for item in value:
+      apply_schema_defaults(schema['items'], item)
+
+
+def load_config(path, expander):
+  """Reads a config file and registers its imports with the expander."""
+  with open(path) as f:
+    config = yaml.safe_load(f) or {}
+  expander.add_imports(config.get('imports', None), os.path.dirname(path))
+  return config
+
+
+def expand_file(path, jobs=1, **kwargs):
+  """Expands the config at path; kwargs are passed on to Expander."""
+  expander = Expander(**kwargs)
+  return expander.expand_config(load_config(path, expander), jobs=jobs)
+
+
+def main(argv):
+  parser = argparse.ArgumentParser(
+      description='Expands a Deployment Manager config locally and prints '
+      'the resulting flattened resource list.')
+  parser.add_argument('config', help='Path to the config YAML file.')
+  parser.add_argument('--project', default=DEFAULT_PROJECT,
+                      help='Value of env["project"].')
+  parser.add_argument('--deployment', default=DEFAULT_DEPLOYMENT,
+                      help='Value of env["deployment"].')
+  parser.add_argument('--jobs', type=int, default=1,
+                      help='Number of processes used to expand independent '
+                      'templates in parallel.')
+  args = parser.parse_args(argv[1:])
+
+  expanded = expand_file(args.config, jobs=args.jobs, project=args.project,
+                         deployment=args.deployment)
+  print(yaml.safe_dump(expanded, default_flow_style=False), end='')
+
+
+if __name__ == '__main__':
+  main(sys.argv)
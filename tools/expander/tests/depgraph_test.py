@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for depgraph.py. Run with: python tests/depgraph_test.py"""
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import depgraph  # pylint: disable=g-import-not-at-top
+
+
+def Resource(name, refs=(), depends_on=None):
+  resource = {
+      'name': name,
+      'type': 'compute.v1.instance',
+      'properties': {'refs': ['$(ref.%s.selfLink)' % ref for ref in refs]},
+  }
+  if depends_on is not None:
+    resource['metadata'] = {'dependsOn': depends_on}
+  return resource
+
+
+def Plan(resources):
+  return depgraph.plan(depgraph.Graph(resources))
+
+
+class GraphTest(unittest.TestCase):
+
+  def testFindsReferencesAndDependsOn(self):
+    graph = depgraph.Graph([
+        Resource('net'),
+        Resource('vm', refs=['net'], depends_on=['disk', 'gone']),
+        Resource('disk', refs=['missing']),
+    ])
+    self.assertEqual(graph.deps, {'net': set(), 'vm': set(['net', 'disk']),
+                                  'disk': set()})
+    self.assertEqual(graph.dangling, {'vm': ['gone'], 'disk': ['missing']})
+
+  def testFindRefs(self):
+    self.assertEqual(
+        depgraph.find_refs({'a': ['x $(ref.one.selfLink) $(ref.two.id)'],
+                            'b': {'c': '$(ref.three.network)'}, 'd': 1}),
+        set(['one', 'two', 'three']))
+
+
+class PlanTest(unittest.TestCase):
+
+  def testWavesKeepConfigOrder(self):
+    result = Plan([
+        Resource('vm-b', refs=['net']),
+        Resource('fw', refs=['net']),
+        Resource('net'),
+        Resource('vm-a', refs=['net', 'fw']),
+        Resource('bucket'),
+    ])
+    self.assertEqual(result.waves,
+                     [['net', 'bucket'], ['vm-b', 'fw'], ['vm-a']])
+    self.assertEqual(result.critical_path, ['net', 'fw', 'vm-a'])
+    self.assertEqual(result.cycles, [])
+    self.assertEqual(result.blocked, [])
+
+  def testCyclesAndBlockedResources(self):
+    result = Plan([
+        Resource('a', refs=['b']),
+        Resource('b', refs=['a']),
+        Resource('c', refs=['a']),
+        Resource('self', refs=['self']),
+        Resource('free'),
+    ])
+    self.assertEqual(result.waves, [['free']])
+    self.assertEqual(result.cycles, [['a', 'b'], ['self']])
+    self.assertEqual(result.blocked, ['c'])
+
+  def testEmptyConfig(self):
+    result = Plan([])
+    self.assertEqual(result.waves, [])
+    self.assertEqual(result.critical_path, [])
+
+  def testLongChain(self):
+    # Deep chains are planned without recursion.
+    names = ['r%d' % i for i in range(5000)]
+    resources = [Resource(names[0])] + [
+        Resource(name, refs=[previous])
+        for previous, name in zip(names, names[1:])]
+    result = Plan(list(reversed(resources)))
+    self.assertEqual(len(result.waves), len(names))
+    self.assertEqual(result.critical_path, names)
+
+
+if __name__ == '__main__':
+  unittest.main()
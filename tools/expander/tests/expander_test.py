@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+#
+# Copyright 2018 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for expander.py. Run with: python tests/expander_test.py
+
+example_expanded.yaml is the expansion of example/config.yaml. After an
+intended change to the expander or to the templates it uses, regenerate it
+with:
+
+  ./expander.py example/config.yaml > tests/example_expanded.yaml
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPANDER_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, EXPANDER_DIR)
+
+import expander  # pylint: disable=g-import-not-at-top
+import yaml  # pylint: disable=g-import-not-at-top
+
+EXAMPLE_CONFIG = os.path.join(EXPANDER_DIR, 'example', 'config.yaml')
+EXAMPLE_EXPANDED = os.path.join(TESTS_DIR, 'example_expanded.yaml')
+
+# A template that imports a python file from a subdirectory, and generates
+# resources of a template type that is only imported by its schema. That one
+# only defines generate_config, and returns YAML text.
+TEMPLATES = {
+    'helpers/names.py': '''
+def Name(env, suffix):
+  return env['name'] + '-' + suffix
+''',
+    'service.py': '''
+from helpers import names
+
+
+def GenerateConfig(context):
+  resources = [{'name': names.Name(context.env, zone), 'type': 'vm.py',
+                'properties': {'zone': zone}}
+               for zone in context.properties['zones']]
+  resources.append({'name': names.Name(context.env, 'net'),
+                    'type': 'compute.v1.network'})
+  return {'resources': resources}
+''',
+    'service.py.schema': '''
+imports:
+- path: vm.py
+- path: helpers/names.py
+''',
+    'vm.py': '''
+def generate_config(context):
+  return """
+resources:
+- name: %(name)s
+  type: compute.v1.instance
+  properties:
+    zone: %(zone)s
+    machineType: %(machineType)s
+""" % dict(context.properties, name=context.env['name'])
+''',
+    'vm.py.schema': '''
+required:
+- zone
+properties:
+  machineType:
+    default: n1-standard-1
+''',
+}
+
+
+class ExampleTest(unittest.TestCase):
+
+  def testGoldenOutput(self):
+    with open(EXAMPLE_EXPANDED) as f:
+      expected = f.read()
+    expanded = expander.expand_file(EXAMPLE_CONFIG)
+    self.assertEqual(yaml.safe_dump(expanded, default_flow_style=False),
+                     expected)
+
+  def testJobs(self):
+    self.assertEqual(expander.expand_file(EXAMPLE_CONFIG, jobs=4),
+                     expander.expand_file(EXAMPLE_CONFIG))
+
+
+class ExpanderTest(unittest.TestCase):
+
+  def setUp(self):
+    self.config_dir = tempfile.mkdtemp()
+    for path, content in TEMPLATES.items():
+      path = os.path.join(self.config_dir, path)
+      if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+      with open(path, 'w') as f:
+        f.write(content)
+
+  def tearDown(self):
+    shutil.rmtree(self.config_dir)
+
+  def Expand(self, resources, **kwargs):
+    path = os.path.join(self.config_dir, 'config.yaml')
+    with open(path, 'w') as f:
+      yaml.safe_dump({'imports': [{'path': 'service.py'}],
+                      'resources': resources}, f)
+    return expander.expand_file(path, **kwargs)['resources']
+
+  def testNestedTemplates(self):
+    resources = self.Expand([
+        {'name': 'svc', 'type': 'service.py',
+         'properties': {'zones': ['zone-a', 'zone-b']}},
+        {'name': 'bucket', 'type': 'storage.v1.bucket'},
+    ])
+    self.assertEqual(resources, [
+        {'name': 'svc-zone-a', 'type': 'compute.v1.instance',
+         'properties': {'zone': 'zone-a', 'machineType': 'n1-standard-1'}},
+        {'name': 'svc-zone-b', 'type': 'compute.v1.instance',
+         'properties': {'zone': 'zone-b', 'machineType': 'n1-standard-1'}},
+        {'name': 'svc-net', 'type': 'compute.v1.network'},
+        {'name': 'bucket', 'type': 'storage.v1.bucket'},
+    ])
+
+  def testJobs(self):
+    resources = [{'name': 'svc-%d' % i, 'type': 'service.py',
+                  'properties': {'zones': ['zone-a', 'zone-b']}}
+                 for i in range(3)]
+    resources.insert(1, {'name': 'vm', 'type': 'vm.py',
+                         'properties': {'zone': 'zone-c'}})
+    serial = self.Expand(resources)
+    self.assertEqual(len(serial), 10)
+    # 2 jobs start from the top level templates, 5 after expanding them
+    # once, and 20 never have enough templates to start a pool.
+    for jobs in [2, 5, 20]:
+      self.assertEqual(self.Expand(resources, jobs=jobs), serial)
+
+  def testJobsMissingRequiredProperty(self):
+    with self.assertRaises(expander.Error) as cm:
+      self.Expand([{'name': 'vm-%d' % i, 'type': 'vm.py',
+                    'properties': {} if i == 1 else {'zone': 'zone-a'}}
+                   for i in range(3)], jobs=3)
+    self.assertIn('Resource "vm-1" of type vm.py is missing required '
+                  'property "zone"', str(cm.exception))
+
+  def testTemplateModulesAreNotLeftImported(self):
+    self.Expand([{'name': 'svc', 'type': 'service.py',
+                  'properties': {'zones': ['zone-a']}}])
+    for module_name in ['service', 'vm', 'helpers', 'helpers.names']:
+      self.assertNotIn(module_name, sys.modules)
+
+  def testMissingRequiredProperty(self):
+    with self.assertRaises(expander.Error) as cm:
+      self.Expand([{'name': 'vm-1', 'type': 'vm.py',
+                    'properties': {'machineType': 'f1-micro'}}])
+    self.assertEqual(str(cm.exception), 'Resource "vm-1" of type vm.py is '
+                     'missing required property "zone"')
+
+  def testNoGenerateConfig(self):
+    with open(os.path.join(self.config_dir, 'vm.py'), 'w') as f:
+      f.write('RESOURCES = []\n')
+    with self.assertRaises(expander.Error):
+      self.Expand([{'name': 'vm-1', 'type': 'vm.py',
+                    'properties': {'zone': 'zone-a'}}])
+
+
+if __name__ == '__main__':
+  unittest.main()
@@ -17,10 +17,20 @@
 """Generates a Jinja template from a list of GCE resource URLs."""
 
 from __future__ import print_function
-from copy import deepcopy
+import argparse
+import collections
+import hashlib
+import json
+from multiprocessing.pool import ThreadPool
+import os
 import re
+from subprocess import CalledProcessError
 from subprocess import check_output
+from subprocess import PIPE
+from subprocess import Popen
 import sys
+import tempfile
+import time
 import yaml
 
 
@@ -28,20 +38,168 @@ import yaml
 SELF_LINK_PATTERN = re.compile(r'.*/([^/]+/[^/]+)/projects/([^/]+)/(.+)/([^/]+)/(.*)$')
 COMPUTE_SELF_LINK_PATTERN = re.compile(r'projects/([^/]+)/(.+)/([^/]+)/(.*)$')
 
-
-def usage():
-  print(''.join(['Usage: ', sys.argv[0],
-                 ' <project> <resource URL file> [<output dir>]']),
-        file=sys.stderr)
-  print('  Default output dir is current directory.', file=sys.stderr)
-  print(file=sys.stderr)
-  print('  Will generate the following files:', file=sys.stderr)
-  print('    - <output dir>/generated.jinja', file=sys.stderr)
-  print('    - <output dir>/generated.jinja.schema', file=sys.stderr)
-  print('    - <output dir>/config.yaml', file=sys.stderr)
-
-
-def get_config(urls, project):
+# Number of gcloud describe commands run at the same time.
+DEFAULT_JOBS = 8
+# Failed describes are retried this many times, waiting RETRY_DELAY_SECONDS
+# before the first retry and doubling the wait for each following one.
+DESCRIBE_RETRIES = 3
+RETRY_DELAY_SECONDS = 1.0
+
+# Maximum number of names in the filter of one gcloud list command.
+LIST_BATCH_SIZE = 100
+# gcloud adds fields to the describe output of these collections that list
+# does not return (e.g. the autoscaler of a managed instance group), so they
+# are always described.
+DESCRIBE_ONLY_COLLECTIONS = ['instanceGroupManagers']
+# Collections that also have regional resources. gcloud needs --global to
+# pick the global ones, a list without it also returns the regional ones.
+GLOBAL_FLAG_COLLECTIONS = frozenset([
+    'addresses',
+    'backendServices',
+    'forwardingRules',
+    'healthChecks',
+    'sslCertificates',
+    'targetHttpProxies',
+    'targetHttpsProxies',
+    'urlMaps',
+])
+
+# Collections enumerated by --discover, read in this order. Networks come
+# first, so that the subnetworks they create in auto mode are known before
+# anything refers to them; these subnetworks, the default routes created with
+# networks and subnetworks, and the routes of network peerings are skipped.
+#
+# Some collections are left out:
+# - disks and instanceGroups: most are created implicitly by instances and
+#   managed instance groups, and the instances of an unmanaged instance group
+#   are not part of the group resource, so it would be generated empty.
+# - sslCertificates: the API does not return the private key, so the
+#   certificate cannot be created again from its description.
+DISCOVER_COLLECTIONS = [
+    'networks',
+    'subnetworks',
+    'addresses',
+    'backendBuckets',
+    'backendServices',
+    'firewalls',
+    'forwardingRules',
+    'healthChecks',
+    'httpHealthChecks',
+    'httpsHealthChecks',
+    'instanceGroupManagers',
+    'instanceTemplates',
+    'instances',
+    'routes',
+    'targetHttpProxies',
+    'targetHttpsProxies',
+    'targetPools',
+    'targetSslProxies',
+    'targetTcpProxies',
+    'urlMaps',
+]
+# Prefix of the names of routes created implicitly with networks and
+# subnetworks.
+DEFAULT_ROUTE_PREFIX = 'default-route-'
+SELF_LINK_FIELD_PATTERN = re.compile(r'^selfLink: *(.*)$', re.MULTILINE)
+
+# With --parameterize, string values of these fields that are repeated at
+# least PARAMETERIZE_MIN_COUNT times are replaced with template properties.
+PARAMETERIZE_FIELDS = frozenset([
+    'diskType',
+    'machineType',
+    'network',
+    'region',
+    'sourceImage',
+    'subnetwork',
+    'zone',
+])
+PARAMETERIZE_MIN_COUNT = 2
+# Path segments of resource URLs that name a location, and the field the
+# location is parameterized as.
+LOCATION_SEGMENTS = {'zones': 'zone', 'regions': 'region'}
+# The location of resource URLs in a project is parameterized whatever their
+# field, e.g. the source of the disks of an instance.
+PROJECT_URL_PATTERN = re.compile(r'^(?:\S*/)?projects/[^/\s]+/\S+$')
+
+# LibYAML based dumper when PyYAML was built with it. Its emitter only writes
+# the same text as yaml.dump() when every string is printable ASCII: it does
+# not fold long double-quoted scalars, such as startup scripts, for one. See
+# get_dumper().
+C_DUMPER = getattr(yaml, 'CDumper', None)
+NOT_PRINTABLE_ASCII_PATTERN = re.compile(r'[^\x20-\x7e]')
+try:
+  NUMBER_TYPES = (int, long, float)  # pylint: disable=undefined-variable
+except NameError:
+  NUMBER_TYPES = (int, float)
+
+# Scrub rules, applied by scrub_properties(). Fields are given as paths from
+# the top of the API object; see compile_scrub_rules() for the syntax.
+#
+# Output-only and unnecessary fields of every resource.
+SCRUB_FIELDS = [
+    'name',
+    'id',
+    'creationTimestamp',
+    'status',
+    'selfLink',
+    'labelFingerprint',
+]
+# Fields scrubbed wherever they appear, at any depth.
+SCRUB_NESTED_FIELDS = frozenset(['kind', 'fingerprint'])
+# Fields that are unique to certain kinds.
+SCRUB_KIND_FIELDS = {
+    'compute#targetPool': [
+        'instances',
+    ],
+    'compute#forwardingRule': [
+        'IPAddress',
+    ],
+    'compute#instanceGroupManager': [
+        'currentActions',
+        'instanceGroup',
+        'autoscaler',
+    ],
+    'compute#instance': [
+        'cpuPlatform',
+        # Clear all IP assignments from network interfaces. Especially in
+        # accessConfigs, where it is assumed there is a static IP address with
+        # the given IP if assigned. This currently cannot support
+        # user-provided static IP, only allows for ephemeral.
+        'networkInterfaces[].networkIP',
+        'networkInterfaces[].accessConfigs[].natIP',
+    ],
+    'compute#network': [
+        'gatewayIPv4',
+        'peerings',
+        'subnetworks',
+    ],
+    'compute#route': [
+        'warnings',
+    ],
+    'compute#subnetwork': [
+        'gatewayAddress',
+    ],
+}
+# Fields returned as full resource URLs where only the name is used on input.
+SHORTEN_FIELDS = ['zone', 'region']
+
+# Describe output is cached here between runs, and reused without asking the
+# API for DEFAULT_CACHE_TTL seconds. By default, cached resources are only
+# reused once their fingerprint was checked, so that a rerun never writes a
+# resource that changed since it was cached.
+DEFAULT_CACHE_DIR = os.path.join('~', '.cache', 'genconfig')
+DEFAULT_CACHE_TTL = 0
+FINGERPRINT_PATTERN = re.compile(r'^fingerprint: *(.*)$', re.MULTILINE)
+# Separates the resources in the YAML output of gcloud list.
+DOCUMENT_SEPARATOR_PATTERN = re.compile(r'^---$', re.MULTILINE)
+
+# Leaf marker in compiled scrub rules.
+SCRUB = object()
+# Compiled scrub rules by kind, filled in by get_scrub_rules().
+_scrub_rules = {}
+
+
+def get_config(urls, project, jobs=DEFAULT_JOBS, batch=False, cache=None):
   """Given a set of resource URLs, returns a DM config.
 
   The DM config will contain a resource for each URL provided, filled with the
@@ -53,6 +211,10 @@ def get_config(urls, project):
   Args:
     urls: the list of resource URLs to process into config
     project: the project for the associated resources
+    jobs: the number of gcloud commands run concurrently
+    batch: if true, fetch resources of the same collection and location with
+      one gcloud list command instead of one describe command each
+    cache: optional DescribeCache holding gcloud output from earlier runs
 
   Returns:
     A valid DM config containing all resources from the URL list.
@@ -61,19 +223,468 @@ def get_config(urls, project):
     Exception: if any URLs or resources are invalid.
   """
 
-  resources = []
-  for cmd in get_gcloud_cmds(urls, project):
-    if not cmd:
+  return {'resources': list(get_resources(urls, project, jobs, batch, cache))}
+
+
+def get_resources(urls, project, jobs=DEFAULT_JOBS, batch=False, cache=None):
+  """Like get_config(), but yields each resource as soon as it is scrubbed."""
+
+  if batch:
+    for resource in get_batched_resources(urls, project, jobs, cache):
+      yield resource
+    return
+
+  described = [(url.rstrip(), cmd)
+               for url, cmd in zip(urls, get_gcloud_cmds(urls, project))
+               if cmd]
+  rewriter = UrlRewriter(project, urls)
+  outputs = describe_resources(described, project, jobs, cache)
+  for i, pstr in enumerate(outputs):
+    # Only keep the output of resources that were not written yet.
+    outputs[i] = None
+    for resource in get_resource_config(pstr, rewriter):
+      yield resource
+
+
+def get_batched_resources(urls, project, jobs=DEFAULT_JOBS, cache=None):
+  """Like get_resources(), but lists resources in batches.
+
+  URLs are grouped by (collection, location), and each group is fetched with
+  gcloud list commands filtered on the resource names. The list output is
+  split back into one document per resource. Resources keep the order of the
+  URL list.
+
+  Cached resources are only listed again once their cache entry expired;
+  the list output holds the whole resource, so there is no point in checking
+  fingerprints first.
+  """
+
+  rewriter = UrlRewriter(project, urls)
+  configs = {}
+  groups = {}
+  listed_urls = {}
+  describe_urls = []
+  for url in urls:
+    url = url.rstrip()
+    key = parse_url(url)
+    location, collection, name = key
+    if collection == 'autoscalers':
+      continue
+    entry = cache.get(project, url) if cache else None
+    if entry and cache.is_fresh(entry):
+      configs[key] = get_resource_config(entry['output'], rewriter)
+    elif collection in DESCRIBE_ONLY_COLLECTIONS:
+      describe_urls.append(url)
+    else:
+      groups.setdefault((collection, location), []).append(name)
+      listed_urls[key] = url
+
+  list_cmds, unused_keys = get_batch_list_cmds(groups, project)
+  for pstr in describe_all(list_cmds, jobs):
+    for doc in DOCUMENT_SEPARATOR_PATTERN.split(pstr):
+      props = yaml.safe_load(rewriter.rewrite(doc))
+      if props is None:
+        continue
+      # Name filters match substrings, so there may be more resources than
+      # were asked for, and lists of global collections without --global
+      # also return regional resources of the same name.
+      key = parse_url(get_self_link(doc))
+      configs[key] = get_resource_config_from_dict(props)
+      if cache and key in listed_urls:
+        cache.put(project, listed_urls[key], doc)
+
+  described = [(url, get_describe_cmd(url, project)) for url in describe_urls]
+  outputs = describe_resources(described, project, jobs, cache)
+  for url, pstr in zip(describe_urls, outputs):
+    configs[parse_url(url)] = get_resource_config(pstr, rewriter)
+
+  for url in urls:
+    key = parse_url(url.rstrip())
+    if key[1] == 'autoscalers':
       continue
+    if key not in configs:
+      raise Exception('Resource not found: ' + url)
+    for resource in configs[key]:
+      yield resource
+
+
+def discover_resources(project, jobs=DEFAULT_JOBS, cache=None):
+  """Yields DM resources for every supported resource in a project.
+
+  Each collection of DISCOVER_COLLECTIONS is fetched with one aggregated
+  gcloud list command. Resource names are only unique within a collection
+  and location, so the resources that share their name with another one are
+  given a unique DM name (see get_resource_names()), and references are made
+  to these names. As names are only known once every collection was read,
+  the documents are written to a temporary file as they are read, and
+  resources are yielded from there, so the project never has to fit in
+  memory. Managed instance groups are described afterwards, one by one, to
+  get their autoscalers. Resources created implicitly are skipped: instances
+  created by a managed instance group, subnetworks of auto mode networks and
+  default or peering routes.
+
+  Args:
+    project: the project to discover.
+    jobs: the number of gcloud commands run concurrently.
+    cache: optional DescribeCache for the instance group describes.
+
+  Yields:
+    DM resource configurations.
+  """
+
+  rewriter = ProjectRewriter(project, DISCOVER_COLLECTIONS)
+  cmds = [get_aggregated_list_cmd(collection, project)
+          for collection in DISCOVER_COLLECTIONS]
+  self_links = []
+  described = []
+  with tempfile.TemporaryFile('w+') as spool:
+    for i, doc in stream_documents(cmds, jobs):
+      collection = DISCOVER_COLLECTIONS[i]
+      self_link = get_self_link(doc)
+      if collection == 'networks':
+        rewriter.skipped.update(get_auto_subnetworks(doc))
+      elif self_link in rewriter.skipped or (
+          collection == 'routes' and
+          parse_url(self_link)[2].startswith(DEFAULT_ROUTE_PREFIX)):
+        continue
+      self_links.append(self_link)
+      if collection in DESCRIBE_ONLY_COLLECTIONS:
+        described.append((self_link, get_describe_cmd(self_link, project)))
+      else:
+        # One line per document, so it can be read back line by line.
+        spool.write(json.dumps(doc) + '\n')
+    rewriter.names = get_resource_names(self_links)
+
+    spool.seek(0)
+    for line in spool:
+      doc = json.loads(line)
+      props = yaml.safe_load(rewriter.rewrite(doc))
+      if (props is None or is_managed_instance(props) or
+          is_implicit_route(props)):
+        continue
+      for resource in rename(get_resource_config_from_dict(props),
+                             rewriter.names.get(get_self_link(doc))):
+        yield resource
+
+  for (url, unused_cmd), pstr in zip(
+      described, describe_resources(described, project, jobs, cache)):
+    for resource in rename(get_resource_config(pstr, rewriter),
+                           rewriter.names.get(url)):
+      yield resource
+
+
+def get_resource_names(self_links):
+  """Returns unique DM resource names for resources, by selfLink.
+
+  A resource is named after its API name, unless another resource has the
+  same name. These resources get the kind of resource as a suffix if their
+  kinds differ, and their zone or region (or 'global') if resources of the
+  same kind have the same name, e.g. vm-1-us-central1-a and vm-1-us-east1-b
+  for two instances vm-1, and web-instance-templates and
+  web-instance-group-managers.
+
+  Raises:
+    Exception: if two resources still end up with the same name.
+  """
+
+  by_name = {}
+  for self_link in self_links:
+    location, collection, name = parse_url(self_link)
+    by_name.setdefault(name, []).append((self_link, location, collection))
+
+  names = {}
+  for name, found in by_name.items():
+    collections = [collection for unused_link, unused_loc, collection in found]
+    for self_link, location, collection in found:
+      parts = [name]
+      if len(set(collections)) > 1:
+        parts.append(re.sub('([A-Z])', r'-\1', collection).lower())
+      if collections.count(collection) > 1:
+        parts.append(location.split('/')[-1])
+      names[self_link] = '-'.join(parts)
+
+  by_dm_name = {}
+  for self_link, dm_name in names.items():
+    by_dm_name.setdefault(dm_name, []).append(self_link)
+  for dm_name, found in sorted(by_dm_name.items()):
+    if len(found) > 1:
+      raise Exception(''.join([
+          'Resources would have the same name "', dm_name, '": ',
+          ', '.join(sorted(found)),
+          '. List them in a URL file instead of using --discover.']))
+  return names
+
+
+def rename(resources, name):
+  """Gives the first of resources another DM name, keeping its API name."""
+
+  if name and name != resources[0]['name']:
+    resources[0]['properties']['name'] = resources[0]['name']
+    resources[0]['name'] = name
+  return resources
+
+
+def is_managed_instance(props):
+  """Whether props describe an instance created by an instance group."""
+
+  if props.get('kind', None) != 'compute#instance':
+    return False
+  items = (props.get('metadata', None) or {}).get('items', None) or []
+  return any(item.get('key', None) == 'created-by' for item in items)
+
+
+def is_implicit_route(props):
+  """Whether props describe a route created with a network or a peering."""
+
+  if props.get('kind', None) != 'compute#route':
+    return False
+  return (props.get('name', '').startswith(DEFAULT_ROUTE_PREFIX) or
+          'nextHopPeering' in props)
+
+
+def get_auto_subnetworks(doc):
+  """Returns the URLs of the subnetworks of a network created in auto mode."""
+
+  props = yaml.safe_load(doc) or {}
+  if not props.get('autoCreateSubnetworks', False):
+    return []
+  return props.get('subnetworks', None) or []
+
+
+def get_self_link(doc):
+  """Returns the URL of the resource described by a YAML document."""
+
+  return yaml.safe_load(SELF_LINK_FIELD_PATTERN.search(doc).group(1))
+
+
+def stream_documents(cmds, jobs=DEFAULT_JOBS):
+  """Yields (command index, document) for the YAML output of commands.
+
+  Commands are read one after the other, in order, but up to jobs of them are
+  started ahead so their API calls overlap. A command that is not being read
+  blocks once its output pipe is full, which bounds the memory used.
+
+  Raises:
+    CalledProcessError: if a command fails. Commands are not retried, since
+      part of their output may already have been yielded.
+  """
+
+  useShell = sys.platform == 'win32'
+  procs = {}
+  try:
+    for i, cmd in enumerate(cmds):
+      for j in range(i, min(i + max(1, jobs), len(cmds))):
+        if j not in procs:
+          procs[j] = Popen(cmds[j].split(), stdout=PIPE, shell=useShell,
+                           universal_newlines=True)
+      proc = procs.pop(i)
+      lines = []
+      for line in iter(proc.stdout.readline, ''):
+        if line.rstrip() == '---':
+          if lines:
+            yield i, ''.join(lines)
+          lines = []
+        else:
+          lines.append(line)
+      if lines:
+        yield i, ''.join(lines)
+      if proc.wait():
+        raise CalledProcessError(proc.returncode, cmd)
+      print('\rListed %d/%d collections' % (i + 1, len(cmds)), end='',
+            file=sys.stderr)
+    print(file=sys.stderr)
+  finally:
+    for proc in procs.values():
+      if proc.poll() is None:
+        proc.kill()
+      proc.wait()
+
+
+def describe_resources(described, project, jobs=DEFAULT_JOBS, cache=None):
+  """Returns the describe output of resources, from the cache if possible.
+
+  Cache entries younger than the cache TTL are used as they are. Older
+  entries of resources that have a fingerprint are revalidated by listing
+  only the fingerprints, with one gcloud list command per collection and
+  location; the resource is described again only if it changed. Managed
+  instance groups are always described again, since their cached output
+  includes their autoscaler, which has a fingerprint of its own.
+
+  Args:
+    described: (url, describe command) pairs.
+    project: the project of the resources.
+    jobs: the maximum number of gcloud commands running at the same time.
+    cache: optional DescribeCache.
+
+  Returns:
+    The describe output of each resource, in the same order as described.
+  """
+
+  outputs = [None] * len(described)
+  entries = [None] * len(described)
+  missing = []
+  stale = []
+  for i, (url, unused_cmd) in enumerate(described):
+    entries[i] = cache.get(project, url) if cache else None
+    if entries[i] is None:
+      missing.append(i)
+    elif cache.is_fresh(entries[i]):
+      outputs[i] = entries[i]['output']
+    elif (entries[i]['fingerprint'] is None or
+          parse_url(url)[1] in DESCRIBE_ONLY_COLLECTIONS):
+      missing.append(i)
+    else:
+      stale.append(i)
+
+  groups = {}
+  for i in stale:
+    location, collection, name = parse_url(described[i][0])
+    groups.setdefault((collection, location), []).append(name)
+  list_cmds, unused_keys = get_batch_list_cmds(groups, project,
+                                               'value(selfLink,fingerprint)')
+  fingerprints = {}
+  for output in describe_all(list_cmds, jobs):
+    for line in output.splitlines():
+      self_link, _, fingerprint = line.partition('\t')
+      if self_link:
+        fingerprints[parse_url(self_link)] = fingerprint.strip()
+
+  for i in stale:
+    url = described[i][0]
+    if fingerprints.get(parse_url(url)) == entries[i]['fingerprint']:
+      cache.put(project, url, entries[i]['output'])
+      outputs[i] = entries[i]['output']
+    else:
+      missing.append(i)
+
+  missing.sort()
+  cmds = [described[i][1] for i in missing]
+  for i, output in zip(missing, describe_all(cmds, jobs)):
+    if cache:
+      cache.put(project, described[i][0], output)
+    outputs[i] = output
+
+  return outputs
+
+
+class DescribeCache(object):
+  """On-disk cache of gcloud output, keyed by (project, URL).
+
+  Each entry is a JSON file named after the SHA-1 of its key, holding the
+  output, the time it was fetched and the resource fingerprint, if any.
+  Entries are written to a temporary file first and renamed into place, so
+  an interrupted run never leaves a partial entry behind.
+  """
+
+  def __init__(self, cache_dir, ttl=DEFAULT_CACHE_TTL, refresh=False):
+    self.cache_dir = os.path.expanduser(cache_dir)
+    self.ttl = ttl
+    self.refresh = refresh
+
+  def path(self, project, url):
+    key = hashlib.sha1('\n'.join([project, url]).encode('utf-8')).hexdigest()
+    return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+  def get(self, project, url):
+    """Returns the entry for a resource, or None if there is none."""
+
+    if self.refresh:
+      return None
+    try:
+      with open(self.path(project, url)) as f:
+        return json.load(f)
+    except (IOError, ValueError):
+      return None
+
+  def is_fresh(self, entry):
+    return time.time() - entry['fetched'] < self.ttl
+
+  def put(self, project, url, output):
+    path = self.path(project, url)
+    if not os.path.isdir(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    m = FINGERPRINT_PATTERN.search(output)
+    entry = {
+        'project': project,
+        'url': url,
+        'fetched': time.time(),
+        'fingerprint': yaml.safe_load(m.group(1)) if m else None,
+        'output': output,
+    }
+    tmp_path = '%s.%d.tmp' % (path, os.getpid())
+    with open(tmp_path, 'w') as f:
+      json.dump(entry, f)
+    replace_file(tmp_path, path)
+
+
+def replace_file(src, dst):
+  """Renames src to dst, replacing dst if it exists."""
+
+  if sys.platform == 'win32' and os.path.exists(dst):
+    # Windows does not rename over an existing file, and Python 2 has no
+    # os.replace().
+    os.remove(dst)
+  os.rename(src, dst)
+
+
+def describe_all(cmds, jobs=DEFAULT_JOBS):
+  """Runs gcloud describe or list commands on a pool of jobs threads.
+
+  Progress is reported on stderr as commands complete.
+
+  Args:
+    cmds: the list of gcloud commands to run.
+    jobs: the maximum number of commands running at the same time.
 
-    useShell = sys.platform == 'win32'
-    props = check_output(cmd.split(), shell=useShell)
-    resources.extend(get_resource_config(props, project, urls))
+  Returns:
+    The output of each command, in the same order as cmds.
+
+  Raises:
+    CalledProcessError: if a command still fails after all retries.
+  """
+
+  results = [None] * len(cmds)
+  if not cmds:
+    return results
+
+  pool = ThreadPool(max(1, min(jobs, len(cmds))))
+  try:
+    completed = pool.imap_unordered(describe_indexed, enumerate(cmds))
+    for done, (i, props) in enumerate(completed, 1):
+      results[i] = props
+      print('\rFetched %d/%d gcloud commands' % (done, len(cmds)), end='',
+            file=sys.stderr)
+    print(file=sys.stderr)
+  finally:
+    pool.terminate()
+    pool.join()
 
-  return {'resources': resources}
+  return results
 
 
-def get_resource_config(pstr, project, urls):
+def describe_indexed(item):
+  i, cmd = item
+  return i, describe(cmd)
+
+
+def describe(cmd, retries=DESCRIBE_RETRIES):
+  """Runs one gcloud command, retrying with exponential backoff."""
+
+  useShell = sys.platform == 'win32'
+  for attempt in range(retries + 1):
+    try:
+      return check_output(cmd.split(), shell=useShell)
+    except CalledProcessError as e:
+      if attempt == retries:
+        raise
+      delay = RETRY_DELAY_SECONDS * 2 ** attempt
+      print(''.join(['\n!!! ', cmd, ' failed with status ', str(e.returncode),
+                     ', retrying in ', str(delay), 's']),
+            file=sys.stderr)
+      time.sleep(delay)
+
+
+def get_resource_config(pstr, rewriter):
   """Returns a list of DM resource configurations.
 
   The algorithm for this is:
@@ -87,26 +698,79 @@ def get_resource_config(pstr, project, urls):
   Args:
     pstr: the string blob of resource properties to be converted to resource
       config.
-    project: the project of the associated resource, used for parameterization
+    rewriter: UrlRewriter for the URL list and project, used for references
+      and parameterization
 
   Returns:
     A list of valid DM configuration for this resource and any auxiliary
     resources.
   """
 
-  for url in urls:
-    if url.startswith('projects'):
-      url = "https://www.googleapis.com/compute/v1/" + url
-    m = SELF_LINK_PATTERN.match(url)
-    name = m.group(5)
-    ref = "$(ref." + name + ".selfLink)"
-    pstr = pstr.replace(url, ref)
-  pstr = pstr.replace(project, "{{env['project']}}")
-  props = yaml.load(pstr)
+  props = yaml.load(rewriter.rewrite(pstr))
 
   return get_resource_config_from_dict(props)
 
 
+class UrlRewriter(object):
+  """Replaces resource URLs with references, and the project with env.
+
+  All URLs of the list are compiled into one regular expression, longest
+  first, so each resource blob is scanned once no matter how many URLs
+  there are. Longest first also keeps a URL that is a prefix of another one
+  (e.g. .../instances/vm-1 and .../instances/vm-10) from matching inside it.
+  """
+
+  def __init__(self, project, urls):
+    self.project = project
+    self.refs = {}
+    for url in urls:
+      if url.startswith('projects'):
+        url = "https://www.googleapis.com/compute/v1/" + url
+      m = SELF_LINK_PATTERN.match(url)
+      name = m.group(5)
+      self.refs[url] = "$(ref." + name + ".selfLink)"
+    self.pattern = None
+    if self.refs:
+      self.pattern = re.compile('|'.join(
+          re.escape(url) for url in sorted(self.refs, key=len, reverse=True)))
+
+  def rewrite(self, pstr):
+    if self.pattern:
+      pstr = self.pattern.sub(lambda m: self.refs[m.group(0)], pstr)
+    return pstr.replace(self.project, "{{env['project']}}")
+
+
+class ProjectRewriter(object):
+  """Like UrlRewriter, for all resources of some collections in a project.
+
+  Used when the whole project is discovered, so that the URL of any resource
+  of a discovered collection refers to a resource of the generated config.
+  URLs added to skipped, of resources that are not generated, are left as
+  they are. URLs in names refer to the DM name they map to, others to the
+  name in the URL.
+  """
+
+  def __init__(self, project, collections):
+    self.project = project
+    self.skipped = set()
+    self.names = {}
+    self.pattern = re.compile(''.join([
+        re.escape('https://www.googleapis.com/compute/v1/projects/' + project),
+        r'/(?:global|zones/[^/]+|regions/[^/]+)/(?:',
+        '|'.join(collections),
+        r')/([-\w]+)']))
+
+  def rewrite(self, pstr):
+    pstr = self.pattern.sub(self.reference, pstr)
+    return pstr.replace(self.project, "{{env['project']}}")
+
+  def reference(self, match):
+    if match.group(0) in self.skipped:
+      return match.group(0)
+    return '$(ref.%s.selfLink)' % self.names.get(match.group(0),
+                                                 match.group(1))
+
+
 def get_resource_config_from_dict(props):
   """Helper for get_resource_config()."""
 
@@ -130,8 +794,13 @@ def scrub_properties(orig_props):
 
   Scrubbed fields include:
 
-  - output-only fields common for most resources
-  - output-only fields specific to a particular resource type
+  - output-only fields common for most resources (SCRUB_FIELDS)
+  - fields that may exist at any level (SCRUB_NESTED_FIELDS)
+  - output-only fields specific to a particular resource kind
+    (SCRUB_KIND_FIELDS)
+
+  The properties are walked once, iteratively, and the scrubbed copy is built
+  along the way; the original properties are left untouched.
 
   Args:
     orig_props: the resource properties that need to be scrubbed
@@ -140,77 +809,61 @@ def scrub_properties(orig_props):
     The final scrubbed resource properties.
   """
 
-  props = deepcopy(orig_props)
-
-  # Scrub output-only and unnecessary fields that we know about.
-  props.pop('name', None)
-  props.pop('id', None)
-  props.pop('creationTimestamp', None)
-  props.pop('status', None)
-  props.pop('selfLink', None)
-
-  # Some fields are at multiple layers and need to be scrubbed recursively.
-  scrub_sub_properties(props)
-
-  # Scrub fields that some types return.
-  scrub_type_specific_properties(props)
+  props = {}
+  stack = [(orig_props, props, get_scrub_rules(orig_props.get('kind', None)))]
+  while stack:
+    src, dst, rules = stack.pop()
+    if isinstance(src, dict):
+      items = [(k, v, rules.get(k, {})) for k, v in src.iteritems()
+               if k not in SCRUB_NESTED_FIELDS]
+    else:
+      item_rules = rules.get('[]', {})
+      items = [(i, v, item_rules) for i, v in enumerate(src)]
+    for key, value, sub_rules in items:
+      if sub_rules is SCRUB:
+        continue
+      if isinstance(value, dict):
+        dst[key] = {}
+      elif isinstance(value, list):
+        dst[key] = [None] * len(value)
+      else:
+        dst[key] = value
+        continue
+      stack.append((value, dst[key], sub_rules))
 
   # Location is always returned as a full resource URL, but only the name is
   # used on input.
-  if 'zone' in props:
-    props['zone'] = props['zone'].rsplit('/', 1)[1]
-  if 'region' in props:
-    props['region'] = props['region'].rsplit('/', 1)[1]
+  for field in SHORTEN_FIELDS:
+    if field in props:
+      props[field] = props[field].rsplit('/', 1)[1]
 
   return props
 
 
-def scrub_type_specific_properties(props):
-  """Scrubs fields that are unique to certain types."""
-
-  # TargetPool specific stuff.
-  props.pop('instances', None)
-
-  # ForwardingRule specific stuff.
-  props.pop('IPAddress', None)
-
-  # IGM specific stuff.
-  props.pop('currentActions', None)
-  props.pop('instanceGroup', None)
-  props.pop('autoscaler', None)
-
-  # Instance specific stuff.
-  props.pop('cpuPlatform', None)
-  props.pop('labelFingerprint', None)
+def compile_scrub_rules(paths):
+  """Turns field paths into a tree of dicts with SCRUB at the leaves.
 
-  # Clear all IP assignments from network interfaces. Especially in
-  # accessConfigs, where it is assumed there is a static IP address with the
-  # given IP if assigned.
-  if 'networkInterfaces' in props:
-    for i in props['networkInterfaces']:
-      i.pop('networkIP', None)
-      if 'accessConfigs' in i:
-        for ac in i['accessConfigs']:
-          # This currently cannot support user-provided static IP, only allows
-          # for ephemeral.
-          ac.pop('natIP', None)
+  Path components are separated by '.', and '[]' stands for every item of a
+  list, e.g. 'networkInterfaces[].accessConfigs[].natIP'.
+  """
 
+  tree = {}
+  for path in paths:
+    parts = path.replace('[]', '.[]').split('.')
+    node = tree
+    for part in parts[:-1]:
+      node = node.setdefault(part, {})
+    node[parts[-1]] = SCRUB
+  return tree
 
-def scrub_sub_properties(props):
-  """Scrubs certain fields that may exist at any level in properties."""
-  if isinstance(props, list):
-    # May be list of objects, must go deeper.
-    for p in props:
-      scrub_sub_properties(p)
 
-  if isinstance(props, dict):
-    # Scrub properties on this set.
-    props.pop('kind', None)
-    props.pop('fingerprint', None)
+def get_scrub_rules(kind):
+  """Returns the compiled scrub rules for an API resource kind."""
 
-    # Check any sub structures.
-    for unused_k, p in props.iteritems():
-      scrub_sub_properties(p)
+  if kind not in _scrub_rules:
+    _scrub_rules[kind] = compile_scrub_rules(
+        SCRUB_FIELDS + SCRUB_KIND_FIELDS.get(kind, []))
+  return _scrub_rules[kind]
 
 
 def get_type(kind, props):
@@ -258,7 +911,7 @@ def get_gcloud_cmds(urls, project):
   return [get_describe_cmd(u.rstrip(), project) for u in urls]
 
 
-def get_describe_cmd(url, project):
+def get_describe_cmd(url, project, output_format='yaml'):
   r"""Builds a gcloud describe command given a resource URL.
 
   gcloud command will look like:
@@ -271,6 +924,7 @@ def get_describe_cmd(url, project):
   Args:
     url: the URL for this resource.
     project: the project of this resource.
+    output_format: the gcloud --format of the output.
 
   Returns:
     The gcloud command to be used to describe the resource in YAML, or empty
@@ -280,6 +934,118 @@ def get_describe_cmd(url, project):
     Exception: if URL is bad.
   """
 
+  location, collection, name = parse_url(url)
+
+  # Autoscalers have no associated gcloud command for describing.
+  if collection == 'autoscalers':
+    print(''.join(['!!! Found autoscaler resource ',
+                   name,
+                   ', will attempt to generate config from its associated ',
+                   'instanceGroupManager (NOTE: you must include the '
+                   'associated instanceGroupManager in the resource list).']),
+          file=sys.stderr)
+    return ''
+
+  return ' '.join(['gcloud compute',
+                   get_gcloud_command_group(collection),
+                   'describe',
+                   name,
+                   get_location_flag(location, url, collection),
+                   '--format', output_format,
+                   '--project', project])
+
+
+def get_list_cmd(collection, location, names, project, output_format='yaml'):
+  r"""Builds a gcloud list command for named resources of one collection.
+
+  gcloud command will look like:
+
+    gcloud compute instances list --filter name:(vm-1,vm-2) \
+        --zones us-central1-f --format yaml
+
+  gcloud filters take a list of values separated by spaces or commas (see
+  gcloud topic filters). Commas are used, since commands are split on
+  whitespace to be run. The ':' operator also matches names that only
+  contain one of the names, so the output may hold more resources.
+
+  Args:
+    collection: collection within the compute API for these resources.
+    location: 'global', 'zones/<zone>' or 'regions/<region>'.
+    names: names of the resources to list.
+    project: the project of these resources.
+    output_format: the gcloud --format of the output.
+
+  Returns:
+    The gcloud command to be used to list the resources.
+  """
+
+  parts = location.split('/')
+  if parts[0] == 'zones':
+    location_flag = '--zones ' + parts[1]
+  elif parts[0] == 'regions':
+    location_flag = '--regions ' + parts[1]
+  elif collection in GLOBAL_FLAG_COLLECTIONS:
+    location_flag = '--global'
+  else:
+    location_flag = ''
+
+  return ' '.join(['gcloud compute',
+                   get_gcloud_command_group(collection),
+                   'list',
+                   '--filter', 'name:(' + ','.join(names) + ')',
+                   location_flag,
+                   '--format', output_format,
+                   '--project', project])
+
+
+def get_batch_list_cmds(groups, project, output_format='yaml'):
+  """Builds the gcloud list commands for groups of named resources.
+
+  Args:
+    groups: resource names by (collection, location).
+    project: the project of these resources.
+    output_format: the gcloud --format of the output.
+
+  Returns:
+    A (commands, keys) tuple, where keys holds the (collection, location) of
+    each command. A group has one command per LIST_BATCH_SIZE names.
+  """
+
+  cmds = []
+  keys = []
+  for (collection, location), names in sorted(groups.items()):
+    for i in range(0, len(names), LIST_BATCH_SIZE):
+      cmds.append(get_list_cmd(collection, location,
+                               names[i:i + LIST_BATCH_SIZE], project,
+                               output_format))
+      keys.append((collection, location))
+  return cmds, keys
+
+
+def get_aggregated_list_cmd(collection, project):
+  """Builds a gcloud list command for a collection, in every location."""
+
+  return ' '.join(['gcloud compute',
+                   get_gcloud_command_group(collection),
+                   'list',
+                   '--format yaml',
+                   '--project', project])
+
+
+def parse_url(url):
+  """Splits a resource URL into (location, collection, name).
+
+  Args:
+    url: the selfLink URL, or truncated selfLink, of a compute resource.
+
+  Returns:
+    A (location, collection, name) tuple, where location is 'global',
+    'zones/<zone>' or 'regions/<region>'.
+
+  Raises:
+    Exception: if URL is bad or not a compute resource.
+  """
+
   m = SELF_LINK_PATTERN.match(url)
   if m:
     service = m.group(1)
@@ -302,23 +1068,7 @@ def get_describe_cmd(url, project):
   if service != 'compute/v1':
     raise Exception(''.join(['!!! Found resource that is unsupported: ', url]))
 
-  # Autoscalers have no associated gcloud command for describing.
-  if collection == 'autoscalers':
-    print(''.join(['!!! Found autoscaler resource ',
-                   name,
-                   ', will attempt to generate config from its associated ',
-                   'instanceGroupManager (NOTE: you must include the '
-                   'associated instanceGroupManager in the resource list).']),
-          file=sys.stderr)
-    return ''
-
-  return ' '.join(['gcloud compute',
-                   get_gcloud_command_group(collection),
-                   'describe',
-                   name,
-                   get_location_flag(location, url, collection),
-                   '--format yaml',
-                   '--project', project])
+  return location, collection, name
 
 
 def get_gcloud_command_group(collection):
@@ -346,6 +1096,9 @@ def get_gcloud_command_group(collection):
       'targetHttpProxies': 'target-http-proxies',
       'targetHttpsProxies': 'target-https-proxies',
       'targetPools': 'target-pools',
+      'targetSslProxies': 'target-ssl-proxies',
+      'targetTcpProxies': 'target-tcp-proxies',
+      'subnetworks': 'networks subnets',
       'urlMaps': 'url-maps',
 	  'healthChecks': 'health-checks',
       'instanceGroups': 'instance-groups'
@@ -366,7 +1119,7 @@ def get_location_flag(location, url, collection):
 
     raise Exception('Invalid location "' + location + '" in URL: ' + url)
 
-  if collection in ['backendServices','forwardingRules']:
+  if collection in GLOBAL_FLAG_COLLECTIONS:
     return ' --global'
   # No slash, assume global and so no location flag is needed.
   return ''
@@ -384,35 +1137,270 @@ def get_config_dot_yaml():
   }
 
 
-def get_generated_schema():
+def get_generated_schema(parameters=None):
   return {
       'info': {
           'author': 'Auto-generated template with schema',
           'description': 'Enter description here.',
           'title': 'Enter title here.'
       },
-      'properties': {}
+      'properties': dict(
+          (name, {'type': 'string', 'default': value})
+          for name, value in (parameters or {}).items())
   }
 
 
-def main(argv):
-  if len(argv) < 3:
-    usage()
-    sys.exit(1)
+def parameterize(resources, fields=PARAMETERIZE_FIELDS,
+                 min_count=PARAMETERIZE_MIN_COUNT):
+  """Replaces repeated field values with template properties, in place.
+
+  Every string value of one of fields, at any depth of the resource
+  properties, is counted. Values seen at least min_count times become
+  template properties named after their field, with a number appended for
+  the less frequent values of the same field (zone, zone2, ...), and are
+  replaced with a reference to that property.
+
+  URLs within the project, such as the machine type of an instance, are
+  parameterized segment by segment: their zone or region counts as a value
+  of the zone or region field, and their last segment as a value of their
+  own field. The zone or region of project URLs in other fields, or in
+  lists, is parameterized too, so that all resources move together.
+
+  Only values that YAML reads back as the same plain string are considered,
+  so that the rendered template means the same as the original. Values that
+  already hold a template expression or a reference are left alone.
+
+  Args:
+    resources: list of DM resource configurations.
+    fields: the names of the fields whose values may be parameterized.
+    min_count: the number of times a value must occur to be parameterized.
+
+  Returns:
+    A dict of the template properties created, and their values.
+  """
+
+  counts = collections.Counter()
+  for container, key, field in iter_values(resources):
+    for unused_index, field, value in iter_segments(field, container[key],
+                                                    fields):
+      counts[(field, value)] += 1
+
+  names = {}
+  parameters = {}
+  per_field = collections.Counter()
+  frequent = [(-count, field, value)
+              for (field, value), count in counts.items() if count >= min_count]
+  for unused_count, field, value in sorted(frequent):
+    per_field[field] += 1
+    name = field if per_field[field] == 1 else field + str(per_field[field])
+    names[(field, value)] = '{{ properties["' + name + '"] }}'
+    parameters[name] = value
+
+  for container, key, field in iter_values(resources):
+    value = container[key]
+    parts = None
+    for index, field, segment in iter_segments(field, value, fields):
+      if (field, segment) not in names:
+        continue
+      if index is None:
+        container[key] = names[(field, segment)]
+      else:
+        parts = parts or value.split('/')
+        parts[index] = names[(field, segment)]
+    if parts:
+      container[key] = '/'.join(parts)
+
+  return parameters
+
+
+def iter_values(resources):
+  """Yields (container, key, field) for the strings in resource properties.
+
+  container[key] is the string, and field the name of the field holding it,
+  or holding the list it is in.
+  """
+
+  stack = [(resource.get('properties', None), None) for resource in resources]
+  while stack:
+    value, field = stack.pop()
+    if isinstance(value, dict):
+      for key, item in value.items():
+        if isinstance(item, str):
+          yield value, key, key
+        else:
+          stack.append((item, key))
+    elif isinstance(value, list):
+      for index, item in enumerate(value):
+        if isinstance(item, str):
+          yield value, index, field
+        else:
+          stack.append((item, field))
+
+
+def iter_segments(key, value, fields):
+  """Yields (index, field, segment) for the parameterizable parts of value.
+
+  index is None when the whole value is parameterizable, and the index of
+  the '/' separated segment of a URL otherwise. Values of a key that is not
+  in fields only have the location of project URLs parameterized.
+  """
+
+  if key in fields and is_parameterizable(value):
+    yield None, key, value
+    return
+  if not isinstance(value, str) or '$(ref.' in value:
+    return
+  if key not in fields and not PROJECT_URL_PATTERN.match(value):
+    return
+  parts = value.split('/')
+  if len(parts) < 2:
+    return
+  for index, part in enumerate(parts):
+    if index > 0 and parts[index - 1] in LOCATION_SEGMENTS:
+      field = LOCATION_SEGMENTS[parts[index - 1]]
+    elif index == len(parts) - 1:
+      field = key
+    else:
+      continue
+    if field in fields and is_parameterizable(part):
+      yield index, field, part
+
+
+def is_parameterizable(value):
+  if not isinstance(value, str) or "'" in value:
+    return False
+  if '{{' in value or '$(ref.' in value:
+    return False
+  return yaml.safe_dump(value, default_flow_style=True) == value + '\n...\n'
+
+
+def parse_args(argv):
+  parser = argparse.ArgumentParser(
+      description='Generates a Jinja template from a list of GCE resource '
+      'URLs, or from all resources of a project.',
+      usage='%(prog)s [options] project url_file [output_dir]\n'
+      '       %(prog)s [options] --discover project [output_dir]',
+      epilog='Will generate the following files: <output dir>/generated.jinja, '
+      '<output dir>/generated.jinja.schema and <output dir>/config.yaml.')
+  parser.add_argument('project', nargs='?', help='Project of the resources.')
+  parser.add_argument('url_file', nargs='?',
+                      help='File with one resource URL (selfLink) per line.')
+  parser.add_argument('output_dir', nargs='?', default='.',
+                      help='Default output dir is current directory.')
+  parser.add_argument('--jobs', type=int, default=DEFAULT_JOBS,
+                      help='Number of gcloud commands run concurrently.')
+  parser.add_argument('--batch', action='store_true',
+                      help='List resources of the same collection and '
+                      'location with one gcloud command instead of '
+                      'describing them one by one.')
+  parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                      help='Directory where gcloud output is cached between '
+                      'runs.')
+  parser.add_argument('--cache-ttl', type=int, default=DEFAULT_CACHE_TTL,
+                      help='Seconds cached resources are used without '
+                      'checking their fingerprint. The default, 0, always '
+                      'checks it.')
+  parser.add_argument('--refresh', action='store_true',
+                      help='Ignore the cache and fetch every resource again.')
+  parser.add_argument('--parameterize', action='store_true',
+                      help='Turn zones, regions, machine types, networks and '
+                      'other values repeated across resources into template '
+                      'properties.')
+  parser.add_argument('--discover', metavar='PROJECT',
+                      help='Generate config for every supported compute '
+                      'resource of PROJECT instead of a URL list.')
+  args = parser.parse_args(argv[1:])
+
+  if args.discover:
+    # The only positional argument left is the output dir.
+    if args.url_file:
+      parser.error('--discover does not take a URL file')
+    args.output_dir = args.project or '.'
+    args.project = args.discover
+  elif not args.url_file:
+    parser.error('project and url_file are required')
+  return args
+
+
+def write_generated(f, resources):
+  """Writes resources to f as they come, the way yaml.dump() lays them out.
+
+  Each resource is emitted as its own block sequence entry, straight to f,
+  so neither the whole resource list nor its YAML text is ever built. The
+  LibYAML dumper is only used for the resources it writes the same text for,
+  see get_dumper().
+  """
+
+  empty = True
+  for resource in resources:
+    if empty:
+      f.write('resources:\n')
+      empty = False
+    yaml.dump([resource], f, Dumper=get_dumper(resource),
+              default_flow_style=False)
+  if empty:
+    f.write('resources: []\n')
+
 
-  output_dir = argv[3] if len(argv) == 4 else '.'
+def get_dumper(value):
+  """Returns the fastest dumper that writes value as yaml.dump() would.
+
+  That is the LibYAML based dumper if value only holds dicts, lists, tuples,
+  numbers, booleans, None and printable ASCII str, and yaml.Dumper otherwise.
+  Same as GetDumper() in templates/common.py.
+  """
+
+  if C_DUMPER is None:
+    return yaml.Dumper
+  stack = [value]
+  while stack:
+    value = stack.pop()
+    if isinstance(value, dict):
+      stack.extend(value.keys())
+      stack.extend(value.values())
+    elif isinstance(value, (list, tuple)):
+      stack.extend(value)
+    elif type(value) is str:  # pylint: disable=unidiomatic-typecheck
+      if NOT_PRINTABLE_ASCII_PATTERN.search(value):
+        return yaml.Dumper
+    elif value is not None and not isinstance(value, NUMBER_TYPES):
+      return yaml.Dumper
+  return C_DUMPER
 
-  urls = []
-  with open(argv[2]) as f:
-    urls = [line.rstrip() for line in f]
 
-  config = get_config(urls, argv[1])
+def main(argv):
+  args = parse_args(argv)
+  output_dir = args.output_dir
+
+  cache = DescribeCache(args.cache_dir, args.cache_ttl, args.refresh)
 
-  # Write generated template.
-  with open(output_dir + '/generated.jinja', 'w') as f:
-    f.write(yaml.dump(config, default_flow_style=False))
+  if args.discover:
+    resources = discover_resources(args.project, args.jobs, cache)
+  else:
+    urls = []
+    with open(args.url_file) as f:
+      urls = [line.rstrip() for line in f]
+    resources = get_resources(urls, args.project, args.jobs, args.batch, cache)
+
+  parameters = None
+  if args.parameterize:
+    # All resources must be known before any of them can be written.
+    resources = list(resources)
+    parameters = parameterize(resources)
+
+  # Write generated template. Resources are fetched while it is written, so
+  # write it aside first and only replace the template once all went well.
+  tmp_path = output_dir + '/generated.jinja.tmp'
+  try:
+    with open(tmp_path, 'w') as f:
+      write_generated(f, resources)
+    replace_file(tmp_path, output_dir + '/generated.jinja')
+  finally:
+    if os.path.exists(tmp_path):
+      os.remove(tmp_path)
   with open(output_dir + '/generated.jinja.schema', 'w') as f:
-    f.write(yaml.dump(get_generated_schema(), default_flow_style=False))
+    f.write(yaml.dump(get_generated_schema(parameters),
+                      default_flow_style=False))
 
   # Write yaml config which uses template.
   with open(output_dir + '/config.yaml', 'w') as f:
@@ -0,0 +1,622 @@
+#!/usr/bin/env python
+#
+# Copyright 2016 Google Inc. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tests for genconfig.py.
+
+The gcloud commands are run against the fake gcloud next to this file, so
+the tests need neither gcloud nor a project. Run them with:
+
+  python tests/genconfig_test.py
+"""
+
+import copy
+import json
+import os
+import shutil
+from subprocess import CalledProcessError
+import sys
+import tempfile
+import unittest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+import genconfig  # pylint: disable=g-import-not-at-top
+
+PROJECT = 'my-project'
+BASE_URL = 'https://www.googleapis.com/compute/v1/projects/' + PROJECT
+
+
+class FakeGcloudTest(unittest.TestCase):
+  """Runs gcloud commands against the fake gcloud next to this file."""
+
+  def setUp(self):
+    self.state_dir = tempfile.mkdtemp()
+    self.environ = dict(os.environ)
+    os.environ['FAKE_GCLOUD_DIR'] = self.state_dir
+    os.environ['PATH'] = TESTS_DIR + os.pathsep + os.environ['PATH']
+    self.retry_delay = genconfig.RETRY_DELAY_SECONDS
+    genconfig.RETRY_DELAY_SECONDS = 0
+
+  def tearDown(self):
+    genconfig.RETRY_DELAY_SECONDS = self.retry_delay
+    os.environ.clear()
+    os.environ.update(self.environ)
+    shutil.rmtree(self.state_dir)
+
+  def set_resources(self, resources):
+    with open(os.path.join(self.state_dir, 'resources.yaml'), 'w') as f:
+      genconfig.yaml.safe_dump(resources, f)
+
+  def all_calls(self):
+    path = os.path.join(self.state_dir, 'calls')
+    if not os.path.exists(path):
+      return []
+    with open(path) as f:
+      lines = f.readlines()
+    os.remove(path)
+    return lines
+
+
+def Resource(kind, location, name, **props):
+  collection = {'address': 'addresses', 'route': 'routes',
+                'subnetwork': 'subnetworks'}.get(kind, kind + 's')
+  props.update({
+      'kind': 'compute#' + kind,
+      'name': name,
+      'id': '123',
+      'selfLink': '%s/%s/%s/%s' % (BASE_URL, location, collection, name),
+  })
+  return props
+
+
+class DescribeAllTest(FakeGcloudTest):
+
+  def describe_cmds(self, names):
+    return [genconfig.get_describe_cmd(
+        'projects/%s/zones/us-central1-f/instances/%s' % (PROJECT, name),
+        PROJECT) for name in names]
+
+  def calls(self, name):
+    with open(os.path.join(self.state_dir, 'calls')) as f:
+      return len([line for line in f if ' describe %s ' % name in line])
+
+  def testKeepsCommandOrder(self):
+    names = ['slow-a', 'b', 'slow-c', 'd', 'e']
+    outputs = genconfig.describe_all(self.describe_cmds(names), jobs=4)
+    self.assertEqual([genconfig.yaml.safe_load(o)['name'] for o in outputs],
+                     names)
+
+  def testRetriesFailedCommands(self):
+    outputs = genconfig.describe_all(self.describe_cmds(['a', 'flaky-b']))
+    self.assertEqual(outputs[1], 'name: flaky-b\nfingerprint: abc=\n')
+    self.assertEqual(self.calls('flaky-b'), 2)
+    self.assertEqual(self.calls('a'), 1)
+
+  def testGivesUpAfterRetries(self):
+    with self.assertRaises(CalledProcessError):
+      genconfig.describe_all(self.describe_cmds(['a', 'broken-b']))
+    self.assertEqual(self.calls('broken-b'), genconfig.DESCRIBE_RETRIES + 1)
+
+  def testNoCommands(self):
+    self.assertEqual(genconfig.describe_all([]), [])
+
+
+class DescribeCacheTest(FakeGcloudTest):
+
+  def setUp(self):
+    FakeGcloudTest.setUp(self)
+    self.cache_dir = os.path.join(self.state_dir, 'cache')
+    self.resources = [
+        Resource('instance', 'zones/us-central1-f', 'vm-1', fingerprint='a='),
+        Resource('instance', 'zones/us-central1-f', 'vm-2', fingerprint='b='),
+        Resource('instance', 'zones/us-central1-b', 'vm-3', fingerprint='c='),
+        Resource('firewall', 'global', 'fw', network='default'),
+    ]
+    self.set_resources(self.resources)
+
+  def describe(self, ttl=3600, refresh=False):
+    cache = genconfig.DescribeCache(self.cache_dir, ttl, refresh)
+    described = [(r['selfLink'], genconfig.get_describe_cmd(r['selfLink'],
+                                                            PROJECT))
+                 for r in self.resources]
+    outputs = genconfig.describe_resources(described, PROJECT, cache=cache)
+    return [genconfig.yaml.safe_load(o) for o in outputs]
+
+  def commands(self):
+    return [call.split()[2] for call in self.all_calls()]
+
+  def testFreshEntriesAreUsedAsTheyAre(self):
+    self.assertEqual(self.describe(), self.resources)
+    self.assertEqual(self.commands(), ['describe'] * 4)
+    self.assertEqual(self.describe(), self.resources)
+    self.assertEqual(self.commands(), [])
+
+  def testStaleEntriesAreRevalidatedByFingerprint(self):
+    self.describe(ttl=0)
+    self.all_calls()
+    self.resources[1].update(fingerprint='b2=', canIpForward=True)
+    self.set_resources(self.resources)
+
+    self.assertEqual(self.describe(ttl=0), self.resources)
+    calls = self.all_calls()
+    # One list per zone for the fingerprints, then the changed instance and
+    # the firewall, which has no fingerprint
+    lists = sorted(c for c in calls if ' list ' in c)
+    self.assertEqual(len(lists), 2)
+    self.assertIn('--filter name:(vm-1,vm-2) --zones us-central1-f', lists[0])
+    self.assertIn('--filter name:(vm-3) --zones us-central1-b', lists[1])
+    self.assertIn('--format value(selfLink,fingerprint)', lists[0])
+    described = sorted(c.split()[3] for c in calls if ' describe ' in c)
+    self.assertEqual(described, ['fw', 'vm-2'])
+
+  def testEntriesAreRevalidatedByDefault(self):
+    args = genconfig.parse_args(['genconfig.py', PROJECT, 'urls.txt'])
+    self.describe(ttl=args.cache_ttl)
+    self.all_calls()
+    self.resources[0]['canIpForward'] = True
+    self.resources[0]['fingerprint'] = 'a2='
+    self.set_resources(self.resources)
+
+    self.assertEqual(self.describe(ttl=args.cache_ttl), self.resources)
+    self.assertEqual(sorted(self.commands()),
+                     ['describe', 'describe', 'list', 'list'])
+
+  def testRevalidatedEntriesAreFreshAgain(self):
+    self.describe(ttl=0)
+    cache = genconfig.DescribeCache(self.cache_dir, 3600)
+    url = self.resources[0]['selfLink']
+    entry = cache.get(PROJECT, url)
+    entry['fetched'] -= 7200
+    with open(cache.path(PROJECT, url), 'w') as f:
+      json.dump(entry, f)
+    self.assertFalse(cache.is_fresh(cache.get(PROJECT, url)))
+    self.all_calls()
+
+    self.describe()
+    self.assertEqual(self.commands(), ['list'])
+    self.assertTrue(cache.is_fresh(cache.get(PROJECT, url)))
+
+  def testRefresh(self):
+    self.describe()
+    self.all_calls()
+    self.resources[0]['canIpForward'] = True
+    self.set_resources(self.resources)
+    self.assertEqual(self.describe(refresh=True), self.resources)
+    self.assertEqual(self.commands(), ['describe'] * 4)
+    # The refreshed entries are cached for later runs
+    self.assertEqual(self.describe(), self.resources)
+    self.assertEqual(self.commands(), [])
+
+  def testEntries(self):
+    cache = genconfig.DescribeCache(self.cache_dir)
+    url = self.resources[0]['selfLink']
+    self.assertEqual(cache.get(PROJECT, url), None)
+    cache.put(PROJECT, url, 'name: vm-1\nfingerprint: "a="\n')
+    entry = cache.get(PROJECT, url)
+    self.assertEqual((entry['fingerprint'], entry['output']),
+                     ('a=', 'name: vm-1\nfingerprint: "a="\n'))
+    self.assertEqual(cache.get('other-project', url), None)
+    self.assertEqual(os.listdir(os.path.dirname(cache.path(PROJECT, url))),
+                     [os.path.basename(cache.path(PROJECT, url))])
+
+
+class GetBatchedResourcesTest(FakeGcloudTest):
+
+  def setUp(self):
+    FakeGcloudTest.setUp(self)
+    self.set_resources([
+        Resource('instance', 'zones/us-central1-f', 'vm-1'),
+        Resource('instance', 'zones/us-central1-f', 'vm-10'),
+        Resource('instance', 'zones/us-central1-f', 'vm-2',
+                 description='next to ' + BASE_URL +
+                 '/zones/us-central1-f/instances/vm-1'),
+        Resource('instance', 'zones/us-central1-b', 'vm-3'),
+        Resource('firewall', 'global', 'fw'),
+    ])
+    self.urls = [
+        BASE_URL + '/zones/us-central1-f/instances/vm-2',
+        BASE_URL + '/global/firewalls/fw',
+        BASE_URL + '/zones/us-central1-b/instances/vm-3',
+        BASE_URL + '/zones/us-central1-f/instances/vm-1',
+    ]
+
+  def get(self, urls, cache=None):
+    return list(genconfig.get_batched_resources(urls, PROJECT, cache=cache))
+
+  def testOneListPerCollectionAndLocation(self):
+    resources = self.get(self.urls)
+    # vm-10 matches the vm-1 filter, but was not asked for
+    self.assertEqual([r['name'] for r in resources],
+                     ['vm-2', 'fw', 'vm-3', 'vm-1'])
+    self.assertEqual(resources[0]['properties']['description'],
+                     'next to $(ref.vm-1.selfLink)')
+    calls = sorted(self.all_calls())
+    self.assertEqual(len(calls), 3)
+    self.assertIn('instances list --filter name:(vm-2,vm-1) '
+                  '--zones us-central1-f', calls[1])
+
+  def testGlobalAndRegionalResourcesOfTheSameName(self):
+    self.set_resources([
+        Resource('address', 'global', 'ip', address='1.1.1.1'),
+        Resource('address', 'regions/us-east1', 'ip', address='2.2.2.2'),
+        Resource('instanceTemplate', 'global', 'web', description='global'),
+        Resource('instanceTemplate', 'regions/us-east1', 'web',
+                 description='regional'),
+    ])
+    urls = [BASE_URL + '/global/addresses/ip',
+            BASE_URL + '/global/instanceTemplates/web']
+    described = list(genconfig.get_resources(urls, PROJECT))
+    self.assertEqual(self.get(urls), described)
+    self.assertEqual(described[0]['properties']['address'], '1.1.1.1')
+    self.assertEqual(described[1]['properties']['description'], 'global')
+    lists = sorted(c for c in self.all_calls() if ' list ' in c)
+    self.assertIn('addresses list --filter name:(ip) --global', lists[0])
+    # Listed without --global, the regional template is told apart by its
+    # selfLink
+    self.assertIn('instance-templates list', lists[1])
+    self.assertNotIn('--global', lists[1])
+
+  def testBatchSize(self):
+    batch_size = genconfig.LIST_BATCH_SIZE
+    genconfig.LIST_BATCH_SIZE = 1
+    try:
+      self.get(self.urls)
+    finally:
+      genconfig.LIST_BATCH_SIZE = batch_size
+    self.assertEqual(len(self.all_calls()), 4)
+
+  def testResourceNotFound(self):
+    url = BASE_URL + '/zones/us-central1-f/instances/vm-3'
+    with self.assertRaises(Exception) as raised:
+      self.get(self.urls + [url])
+    self.assertEqual(str(raised.exception), 'Resource not found: ' + url)
+
+  def testCachedAndListedResources(self):
+    cache_dir = os.path.join(self.state_dir, 'cache')
+    cache = genconfig.DescribeCache(cache_dir, ttl=3600)
+    expected = self.get(self.urls[2:], cache)
+    self.all_calls()
+    # Only the resources asked for are cached
+    extra_url = BASE_URL + '/zones/us-central1-f/instances/vm-10'
+    self.assertEqual(cache.get(PROJECT, extra_url), None)
+
+    resources = self.get(self.urls, cache)
+    self.assertEqual(resources[2:], expected)
+    calls = self.all_calls()
+    self.assertEqual(len(calls), 2)
+    self.assertNotIn('vm-1', ' '.join(calls))
+
+    # Expired entries are listed again, without checking fingerprints
+    stale = genconfig.DescribeCache(cache_dir, ttl=0)
+    self.assertEqual(self.get(self.urls, stale), resources)
+    self.assertEqual(len(self.all_calls()), 3)
+
+
+class DiscoverResourcesTest(FakeGcloudTest):
+
+  def testSkipsImplicitResources(self):
+    auto_subnet = BASE_URL + '/regions/us-central1/subnetworks/default'
+    self.set_resources([
+        Resource('network', 'global', 'default', autoCreateSubnetworks=True,
+                 subnetworks=[auto_subnet]),
+        Resource('network', 'global', 'net', autoCreateSubnetworks=False,
+                 subnetworks=[BASE_URL + '/regions/us-central1/subnetworks/sub']),
+        Resource('subnetwork', 'regions/us-central1', 'default',
+                 network=BASE_URL + '/global/networks/default'),
+        Resource('subnetwork', 'regions/us-central1', 'sub',
+                 network=BASE_URL + '/global/networks/net'),
+        Resource('instance', 'zones/us-central1-f', 'vm-1',
+                 networkInterfaces=[{'subnetwork': auto_subnet}]),
+        Resource('instance', 'zones/us-central1-f', 'vm-2',
+                 networkInterfaces=[{'subnetwork': BASE_URL +
+                                     '/regions/us-central1/subnetworks/sub'}]),
+        Resource('instance', 'zones/us-central1-f', 'mig-abcd',
+                 metadata={'items': [{'key': 'created-by', 'value': 'mig'}]}),
+        Resource('route', 'global', 'default-route-0123456789abcdef'),
+        Resource('route', 'global', 'peering-route',
+                 nextHopPeering='peering'),
+        Resource('route', 'global', 'route-1',
+                 network=BASE_URL + '/global/networks/net'),
+    ])
+    resources = list(genconfig.discover_resources(PROJECT, jobs=4))
+    self.assertEqual(
+        [(r['type'], r['name']) for r in resources],
+        [('compute.v1.network', 'default'), ('compute.v1.network', 'net'),
+         ('compute.v1.subnetwork', 'sub'), ('compute.v1.instance', 'vm-1'),
+         ('compute.v1.instance', 'vm-2'), ('compute.v1.route', 'route-1')])
+    self.assertEqual(resources[1]['properties'],
+                     {'autoCreateSubnetworks': False})
+    self.assertEqual(resources[2]['properties']['network'],
+                     '$(ref.net.selfLink)')
+    self.assertEqual(
+        resources[3]['properties']['networkInterfaces'][0]['subnetwork'],
+        "https://www.googleapis.com/compute/v1/projects/{{env['project']}}"
+        '/regions/us-central1/subnetworks/default')
+    self.assertEqual(
+        resources[4]['properties']['networkInterfaces'][0]['subnetwork'],
+        '$(ref.sub.selfLink)')
+    self.assertEqual(len(self.all_calls()), len(genconfig.DISCOVER_COLLECTIONS))
+
+  def testDescribesManagedInstanceGroups(self):
+    self.set_resources([
+        Resource('instanceGroupManager', 'zones/us-central1-f', 'mig',
+                 baseInstanceName='mig', targetSize=2,
+                 currentActions={'none': 2}),
+    ])
+    resources = list(genconfig.discover_resources(PROJECT))
+    self.assertEqual(resources, [{
+        'name': 'mig',
+        'type': 'compute.v1.instanceGroupManager',
+        'properties': {'baseInstanceName': 'mig', 'targetSize': 2},
+    }])
+    calls = self.all_calls()
+    self.assertEqual(len([c for c in calls if ' describe mig ' in c]), 1)
+
+  def testRenamesResourcesWithTheSameName(self):
+    template = BASE_URL + '/global/instanceTemplates/web'
+    self.set_resources([
+        Resource('instanceTemplate', 'global', 'web'),
+        Resource('instanceGroupManager', 'zones/us-central1-f', 'web',
+                 instanceTemplate=template),
+        Resource('instance', 'zones/us-central1-a', 'vm-1'),
+        Resource('instance', 'zones/us-central1-b', 'vm-1'),
+        Resource('targetPool', 'regions/us-central1', 'pool', instances=[
+            BASE_URL + '/zones/us-central1-a/instances/vm-1']),
+        Resource('firewall', 'global', 'fw',
+                 targetTags=[BASE_URL + '/zones/us-central1-b/instances/vm-1']),
+    ])
+    resources = list(genconfig.discover_resources(PROJECT))
+    self.assertEqual(
+        [(r['name'], r['properties'].get('name')) for r in resources],
+        [('fw', None), ('web-instance-templates', 'web'),
+         ('vm-1-us-central1-a', 'vm-1'), ('vm-1-us-central1-b', 'vm-1'),
+         ('pool', None), ('web-instance-group-managers', 'web')])
+    self.assertEqual(resources[0]['properties']['targetTags'],
+                     ['$(ref.vm-1-us-central1-b.selfLink)'])
+    self.assertEqual(resources[5]['properties']['instanceTemplate'],
+                     '$(ref.web-instance-templates.selfLink)')
+
+  def testResourceNames(self):
+    self.assertEqual(genconfig.get_resource_names([
+        BASE_URL + '/global/networks/net',
+        BASE_URL + '/regions/us-central1/subnetworks/net',
+        BASE_URL + '/regions/us-east1/subnetworks/net',
+    ]), {
+        BASE_URL + '/global/networks/net': 'net-networks',
+        BASE_URL + '/regions/us-central1/subnetworks/net':
+            'net-subnetworks-us-central1',
+        BASE_URL + '/regions/us-east1/subnetworks/net':
+            'net-subnetworks-us-east1',
+    })
+    with self.assertRaises(Exception) as raised:
+      genconfig.get_resource_names([
+          BASE_URL + '/global/networks/net',
+          BASE_URL + '/global/firewalls/net',
+          BASE_URL + '/global/routes/net-networks',
+      ])
+    self.assertIn('same name "net-networks"', str(raised.exception))
+
+  def testStreamDocuments(self):
+    self.set_resources([Resource('firewall', 'global', 'fw-%d' % i)
+                        for i in range(3)])
+    cmds = [genconfig.get_aggregated_list_cmd(collection, PROJECT)
+            for collection in ['instances', 'firewalls', 'instances']]
+    docs = [(i, genconfig.yaml.safe_load(doc)['name'])
+            for i, doc in genconfig.stream_documents(cmds, jobs=2)]
+    self.assertEqual(docs, [(1, 'fw-0'), (1, 'fw-1'), (1, 'fw-2')])
+
+  def testStreamDocumentsFails(self):
+    cmds = [genconfig.get_aggregated_list_cmd('instances', PROJECT),
+            'gcloud compute instances describe broken-vm --project ' + PROJECT]
+    with self.assertRaises(CalledProcessError):
+      list(genconfig.stream_documents(cmds))
+
+
+class UrlRewriterTest(unittest.TestCase):
+
+  def testReplacesListedUrlsWithReferences(self):
+    rewriter = genconfig.UrlRewriter(PROJECT, [
+        'projects/%s/zones/us-central1-f/instances/vm-1' % PROJECT,
+        BASE_URL + '/zones/us-central1-f/instances/vm-10',
+    ])
+    pstr = '\n'.join([
+        'a: ' + BASE_URL + '/zones/us-central1-f/instances/vm-10',
+        'b: ' + BASE_URL + '/zones/us-central1-f/instances/vm-1',
+        'c: ' + BASE_URL + '/zones/us-central1-f/instances/vm-2',
+    ])
+    self.assertEqual(rewriter.rewrite(pstr), '\n'.join([
+        'a: $(ref.vm-10.selfLink)',
+        'b: $(ref.vm-1.selfLink)',
+        "c: https://www.googleapis.com/compute/v1/projects/{{env['project']}}"
+        '/zones/us-central1-f/instances/vm-2',
+    ]))
+
+  def testManyUrls(self):
+    urls = [BASE_URL + '/zones/us-central1-f/instances/vm-%d' % i
+            for i in range(1000)]
+    rewriter = genconfig.UrlRewriter(PROJECT, urls)
+    self.assertEqual(rewriter.rewrite(' '.join(reversed(urls))),
+                     ' '.join('$(ref.vm-%d.selfLink)' % i
+                              for i in reversed(range(1000))))
+
+  def testNoUrls(self):
+    rewriter = genconfig.UrlRewriter(PROJECT, [])
+    self.assertEqual(rewriter.rewrite('project: ' + PROJECT),
+                     "project: {{env['project']}}")
+
+
+class ScrubPropertiesTest(unittest.TestCase):
+
+  def testCompileScrubRules(self):
+    self.assertEqual(
+        genconfig.compile_scrub_rules(['name', 'a[].b.c', 'a[].d']),
+        {'name': genconfig.SCRUB,
+         'a': {'[]': {'b': {'c': genconfig.SCRUB}, 'd': genconfig.SCRUB}}})
+
+  def testScrubsInstance(self):
+    props = {
+        'kind': 'compute#instance',
+        'name': 'vm-1',
+        'id': '123',
+        'selfLink': BASE_URL + '/zones/us-central1-f/instances/vm-1',
+        'zone': BASE_URL + '/zones/us-central1-f',
+        'cpuPlatform': 'Intel Haswell',
+        'machineType': 'n1-standard-1',
+        'metadata': {'kind': 'compute#metadata', 'fingerprint': 'abc=',
+                     'items': [{'key': 'a', 'value': 'b'}]},
+        'networkInterfaces': [{
+            'kind': 'compute#networkInterface',
+            'network': 'default',
+            'networkIP': '10.0.0.2',
+            'accessConfigs': [{'name': 'nat', 'natIP': '1.2.3.4'}],
+        }],
+    }
+    orig = copy.deepcopy(props)
+    self.assertEqual(genconfig.scrub_properties(props), {
+        'zone': 'us-central1-f',
+        'machineType': 'n1-standard-1',
+        'metadata': {'items': [{'key': 'a', 'value': 'b'}]},
+        'networkInterfaces': [{
+            'network': 'default',
+            'accessConfigs': [{'name': 'nat'}],
+        }],
+    })
+    self.assertEqual(props, orig)
+
+  def testKindFieldsOnlyApplyToTheirKind(self):
+    props = {'kind': 'compute#targetPool', 'instances': ['a'],
+             'healthChecks': ['b']}
+    self.assertEqual(genconfig.scrub_properties(props), {'healthChecks': ['b']})
+    props = {'kind': 'compute#backendService', 'instances': ['a']}
+    self.assertEqual(genconfig.scrub_properties(props), {'instances': ['a']})
+
+  def testDeeplyNestedProperties(self):
+    # Walked without recursion, well past the recursion limit.
+    depth = sys.getrecursionlimit() * 2
+    props = {'kind': 'compute#urlMap', 'description': 'd'}
+    for _ in range(depth):
+      props = {'fingerprint': 'abc=', 'tests': [props]}
+    scrubbed = genconfig.scrub_properties(props)
+    for _ in range(depth):
+      self.assertEqual(scrubbed.keys(), ['tests'])
+      scrubbed = scrubbed['tests'][0]
+    self.assertEqual(scrubbed, {'description': 'd'})
+
+
+class ParameterizeTest(unittest.TestCase):
+
+  URL = "https://www.googleapis.com/compute/v1/projects/{{env['project']}}"
+
+  def vm(self, name, zone, **props):
+    props.update({
+        'zone': zone,
+        'machineType': '%s/zones/%s/machineTypes/n1-standard-1' % (self.URL,
+                                                                  zone),
+        'disks': [{'source': '%s/zones/%s/disks/%s' % (self.URL, zone, name)}],
+    })
+    return {'name': name, 'type': 'compute.v1.instance', 'properties': props}
+
+  def testReplacesUrlSegments(self):
+    resources = [self.vm('vm-1', 'us-central1-f', description='zones/x/a'),
+                 self.vm('vm-2', 'us-central1-f', description='zones/x/a')]
+    self.assertEqual(genconfig.parameterize(resources),
+                     {'zone': 'us-central1-f', 'machineType': 'n1-standard-1'})
+    self.assertEqual(resources[0]['properties'], {
+        'zone': '{{ properties["zone"] }}',
+        'machineType': self.URL + '/zones/{{ properties["zone"] }}'
+                       '/machineTypes/{{ properties["machineType"] }}',
+        # Only the location of URLs in other fields is parameterized
+        'disks': [{'source': self.URL +
+                             '/zones/{{ properties["zone"] }}/disks/vm-1'}],
+        'description': 'zones/x/a',
+    })
+
+  def testNumbersFieldsByFrequency(self):
+    resources = [self.vm('a-%d' % i, 'zone-a') for i in range(3)]
+    resources += [self.vm('b-%d' % i, 'zone-b') for i in range(2)]
+    # Seen once: in a VM, it would also be in its machine type and disk
+    resources += [{'name': 'c', 'type': 'compute.v1.disk',
+                   'properties': {'zone': 'zone-c'}}]
+    parameters = genconfig.parameterize(resources)
+    self.assertEqual((parameters['zone'], parameters['zone2']),
+                     ('zone-a', 'zone-b'))
+    self.assertNotIn('zone3', parameters)
+    self.assertEqual(resources[3]['properties']['zone'],
+                     '{{ properties["zone2"] }}')
+    self.assertEqual(resources[5]['properties']['zone'], 'zone-c')
+
+  def testLocationsInLists(self):
+    instances = [self.URL + '/zones/us-central1-f/instances/vm-%d' % i
+                 for i in range(2)]
+    resources = [{'name': 'tp', 'type': 'compute.v1.targetPool',
+                  'properties': {'instances': instances}}]
+    self.assertEqual(genconfig.parameterize(resources),
+                     {'zone': 'us-central1-f'})
+    self.assertEqual(instances[1], self.URL +
+                     '/zones/{{ properties["zone"] }}/instances/vm-1')
+
+  def testSkipsValues(self):
+    values = ["it's", '{{ properties["zone"] }}', '$(ref.vm.zone)',
+              'a: b', 'yes', '1']
+    resources = [{'name': 'r-%d' % i, 'type': 'compute.v1.instance',
+                  'properties': {'zone': value, 'network': value}}
+                 for i in range(2) for value in values]
+    self.assertEqual(genconfig.parameterize(resources), {})
+    self.assertEqual([r['properties']['zone'] for r in resources],
+                     values + values)
+
+
+class WriteGeneratedTest(unittest.TestCase):
+
+  def assertSameAsYamlDump(self, resources):
+    with tempfile.TemporaryFile('w+') as f:
+      # A generator, as main() passes it, so nothing is known up front.
+      genconfig.write_generated(f, (r for r in resources))
+      f.seek(0)
+      self.assertEqual(f.read(), genconfig.yaml.dump(
+          {'resources': resources}, default_flow_style=False))
+
+  def testResources(self):
+    self.assertSameAsYamlDump([
+        {'name': 'vm-%d' % i, 'type': 'compute.v1.instance',
+         'properties': {'zone': 'us-central1-f', 'tags': {'items': ['a']}}}
+        for i in range(3)])
+
+  def testStartupScript(self):
+    script = ('#!/bin/bash\n' +
+              'echo "hello world" >> /var/log/startup.log\n' * 5 +
+              '\techo done  \n')
+    self.assertSameAsYamlDump([
+        {'name': 'vm', 'type': 'compute.v1.instance',
+         'properties': {'description': u'caf\xe9 ' * 20, 'metadata': {
+             'items': [{'key': 'startup-script', 'value': script}]}}},
+        {'name': 'vm-2', 'type': 'compute.v1.instance',
+         'properties': {'zone': 'us-central1-f'}}])
+
+  def testNoResources(self):
+    self.assertSameAsYamlDump([])
+
+  def testGetDumper(self):
+    fastest = getattr(genconfig.yaml, 'CDumper', genconfig.yaml.Dumper)
+    self.assertIs(genconfig.get_dumper({'a': [1, 2.5, None, ('b', False)]}),
+                  fastest)
+    for value in ['a\tb', 'a\nb', u'caf\xe9', object(), {'a\n': 'b'}]:
+      self.assertIs(genconfig.get_dumper(value), genconfig.yaml.Dumper)
+
+
+if __name__ == '__main__':
+  unittest.main()